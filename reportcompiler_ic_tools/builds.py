@@ -0,0 +1,323 @@
+"""
+This module contains helpers to incrementally build the assets (tables,
+maps, ...) of a report. The fingerprints of the inputs of each generated
+asset are recorded in a manifest, so successive builds only generate again
+the assets whose inputs changed and reuse the stored results for the rest.
+"""
+import hashlib
+import json
+import os
+import pickle
+import re
+import tempfile
+from odictliteral import odict
+from reportcompiler_ic_tools import __version__
+from reportcompiler_ic_tools.markers import \
+    source_markers, note_markers, method_markers, year_markers
+from reportcompiler_ic_tools.utils import fingerprint
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+__all__ = ['IncrementalBuild']
+
+MANIFEST_FILE = 'manifest.json'
+''' File name of the manifest in the build directory. '''
+
+
+class IncrementalBuild:
+    """
+    Incremental build of report assets. Each asset is identified by a name
+    and generated by a function; its result is stored in the build directory
+    alongside the fingerprint of the function and its arguments. If an asset
+    is requested again with the same inputs, the stored result is returned
+    instead of being generated.
+
+    Several builds (e.g. of different reports or processes) can share the
+    same build directory: the manifest is merged with the one on disk when
+    saved, under a file lock.
+
+    It can be used as a context manager, saving the manifest on exit:
+
+    .. code-block:: python
+
+        with IncrementalBuild('build') as build:
+            table_info = build.table('hpv_prevalence', data_dict)
+            image_path = build.map_image('hpv_map', data, 'XFX', 'value')
+
+    :param str build_dir: Directory where the manifest and the assets are
+        stored. It is created if it does not exist.
+    """
+
+    def __init__(self, build_dir):
+        self.build_dir = build_dir
+        self.manifest_path = os.path.join(build_dir, MANIFEST_FILE)
+        self.built = []
+        self.reused = []
+        os.makedirs(os.path.join(build_dir, 'assets'), exist_ok=True)
+        try:
+            with open(self.manifest_path) as manifest_file:
+                self.manifest = json.load(manifest_file)
+        except FileNotFoundError:
+            self.manifest = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.save()
+
+    def asset(self, name, function, *args, **kwargs):
+        """
+        Returns the result of calling *function* with the given arguments,
+        reusing the stored result if the asset was already built with the
+        same inputs. Results must be picklable.
+
+        :param str name: Name of the asset, unique within the build
+        :param function function: Function generating the asset
+        :returns: The function result
+        """
+        key = fingerprint(_function_id(function), args, kwargs, __version__)
+        path = self._asset_path(name, 'pickle')
+        if self._reuse(name, key, path):
+            with open(path, 'rb') as result_file:
+                return pickle.load(result_file)
+
+        result = function(*args, **kwargs)
+
+        def write(result_path):
+            with open(result_path, 'wb') as result_file:
+                pickle.dump(result, result_file)
+
+        _write_atomic(path, write)
+        self._record(name, key, path)
+        return result
+
+    def table(self, name, data_dict, footer=None, **kwargs):
+        """
+        Returns the result of generate_table_data (with the given arguments)
+        for the asset *name*, reusing the stored result if its inputs did not
+        change. To chain tables in a single footer, pass the footer returned
+        by the previous table: the marker generators are restored from it,
+        so the 'markers' argument is not accepted.
+
+        :param str name: Name of the asset, unique within the build
+        :param dict data_dict: Dictionary returned by the IC data fetcher
+        :param dict footer: Footer returned by a previous table
+        :returns: Dictionary as returned by generate_table_data
+        :rtype: dict
+        """
+        from reportcompiler_ic_tools.tables import generate_table_data
+
+        if 'markers' in kwargs:
+            raise ValueError(
+                'Marker generators cannot be fingerprinted, chain tables '
+                'with the footer parameter instead')
+        if 'registry' in kwargs:
+            raise ValueError(
+                'Tables using a reference registry depend on its state and '
+                'cannot be reused')
+
+        def generate(data_dict, footer, **kwargs):
+            if footer is not None:
+                kwargs['markers'] = _restore_markers(footer)
+            table_info = generate_table_data(data_dict,
+                                             footer=footer,
+                                             **kwargs)
+            del table_info['markers']
+            return table_info
+
+        if footer is not None:
+            footer = _copy_footer(footer)
+        table_info = self.asset(name, generate, data_dict, footer, **kwargs)
+        table_info['markers'] = _restore_markers(table_info['footer'])
+        return table_info
+
+    def map_image(self,
+                  name,
+                  data,
+                  region,
+                  value_field,
+                  format='png',
+                  dpi=300,
+                  **map_params):
+        """
+        Returns the path of the image of the map generated by generate_map
+        (with the given arguments) for the asset *name*, rendering it only
+        if its inputs changed.
+
+        :param str name: Name of the asset, unique within the build
+        :param pandas.DataFrame data: Data to be plotted
+        :param str region: Region to center the map around
+        :param str value_field: Column of *data* with the values to be plotted
+        :param str format: Format of the image (e.g. 'png' or 'pdf')
+        :param int dpi: Resolution of the image
+        :param map_params: Rest of generate_map parameters
+        :returns: Path of the map image
+        :rtype: str
+        """
+        from matplotlib.figure import Figure
+        from reportcompiler_ic_tools.maps import generate_map, CUSTOM_REGIONS
+
+        key = fingerprint('generate_map', data, region,
+                          CUSTOM_REGIONS.get(region), value_field, format,
+                          dpi, map_params, __version__)
+        path = self._asset_path(name, format)
+        if self._reuse(name, key, path):
+            return path
+
+        plot = generate_map(data, region, value_field, **map_params)['plot']
+
+        def write(image_path):
+            if isinstance(plot, Figure):
+                plot.savefig(image_path, format=format, dpi=dpi)
+            else:
+                plot.save(image_path, format=format, dpi=dpi, verbose=False)
+
+        _write_atomic(path, write)
+        self._record(name, key, path)
+        return path
+
+    def save(self, prune=False):
+        """
+        Writes the manifest of the build, merged with the manifest on disk
+        (which other builds sharing the directory may have updated).
+
+        :param bool prune: Whether the assets that were not requested during
+            this build should be removed (including those of other builds
+            sharing the directory). Only use it when the build requested all
+            the assets of the directory.
+        """
+        requested = self.built + self.reused
+        with _FileLock(self.manifest_path + '.lock'):
+            try:
+                with open(self.manifest_path) as manifest_file:
+                    manifest = json.load(manifest_file)
+            except FileNotFoundError:
+                manifest = {}
+            manifest.update({name: self.manifest[name] for name in requested})
+            if prune:
+                requested = set(requested)
+                for name in list(manifest.keys()):
+                    if name not in requested:
+                        path = os.path.join(self.build_dir,
+                                            manifest[name]['file'])
+                        if os.path.exists(path):
+                            os.remove(path)
+                        del manifest[name]
+            self.manifest = manifest
+
+            def write(manifest_path):
+                with open(manifest_path, 'w') as manifest_file:
+                    json.dump(manifest, manifest_file,
+                              indent=2, sort_keys=True)
+
+            _write_atomic(self.manifest_path, write)
+
+    def _asset_path(self, name, extension):
+        safe_name = re.sub(r'[^\w.-]', '_', name)
+        suffix = hashlib.sha1(name.encode('utf-8')).hexdigest()[:8]
+        return os.path.join(self.build_dir,
+                            'assets',
+                            '{}-{}.{}'.format(safe_name, suffix, extension))
+
+    def _reuse(self, name, key, path):
+        if name in self.built or name in self.reused:
+            raise ValueError('Asset "{}" already built'.format(name))
+        entry = self.manifest.get(name)
+        if (entry is not None and
+                entry['fingerprint'] == key and
+                os.path.exists(path)):
+            self.reused.append(name)
+            return True
+        return False
+
+    def _record(self, name, key, path):
+        self.built.append(name)
+        self.manifest[name] = {
+            'fingerprint': key,
+            'file': os.path.relpath(path, self.build_dir),
+        }
+
+
+def _function_id(function):
+    return '{}.{}'.format(getattr(function, '__module__', ''),
+                          getattr(function, '__qualname__', repr(function)))
+
+
+def _copy_footer(footer):
+    return {
+        ref_type: (entries if ref_type == 'date'
+                   else [{'marker': entry[0], 'text': entry[1]}
+                         if isinstance(entry, tuple) else dict(entry)
+                         for entry in entries])
+        for ref_type, entries in footer.items()
+    }
+
+
+def _restore_markers(footer):
+    # Markers are assigned sequentially, so the generators can be restored
+    # by skipping as many markers as used in the footer
+    ref_type_markers = odict[
+        'sources': source_markers(),
+        'notes': note_markers(),
+        'methods': method_markers(),
+        'years': year_markers(),
+    ]
+    for ref_type, markers in ref_type_markers.items():
+        used = len([entry for entry in footer.get(ref_type, [])
+                    if entry['marker'] != ''])
+        for _ in range(used):
+            next(markers)
+    return ref_type_markers
+
+
+def _write_atomic(path, write):
+    # Each writer uses its own temporary file, so concurrent writers of the
+    # same path do not interfere
+    descriptor, tmp_path = tempfile.mkstemp(
+        suffix=os.path.splitext(path)[1],
+        prefix='.tmp-',
+        dir=os.path.dirname(path) or None)
+    os.close(descriptor)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class _FileLock:
+    """
+    Exclusive advisory lock on a file, blocking until it is acquired.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, 'a+b')
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        else:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self._file.close()
+            self._file = None
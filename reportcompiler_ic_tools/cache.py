@@ -0,0 +1,132 @@
+"""
+This module contains a content-addressed file cache, used to store generated
+assets (e.g. map images) so they are only generated again when their inputs
+change.
+"""
+import os
+import tempfile
+
+__all__ = ['FileCache', 'CACHE_DIR', 'CACHE_SIZE']
+
+CACHE_DIR = os.path.join(os.path.expanduser('~'),
+                         '.cache',
+                         'reportcompiler_ic_tools')
+''' Default base directory of the file caches. '''
+
+CACHE_SIZE = 500 * 1024 * 1024
+''' Default maximum size (in bytes) of a file cache. '''
+
+_TMP_PREFIX = '.tmp-'
+# Prefix of the files being written, which are not cache entries yet
+
+
+class FileCache:
+    """
+    Directory of files addressed by a key (usually a fingerprint of the
+    inputs used to generate them). When the total size of the files exceeds
+    *max_size*, the least recently used files are removed.
+
+    :param str directory: Directory of the cache. It is created if it does
+        not exist.
+    :param int max_size: Maximum size (in bytes) of the cache files. If None,
+        CACHE_SIZE is used.
+    """
+
+    def __init__(self, directory, max_size=None):
+        if max_size is None:
+            max_size = CACHE_SIZE
+        self.directory = directory
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key, extension):
+        """
+        Returns the path of the file with the given key and extension, whether
+        it exists or not.
+
+        :param str key: Key of the file
+        :param str extension: Extension of the file (e.g. 'png')
+        :rtype: str
+        """
+        return os.path.join(self.directory, '{}.{}'.format(key, extension))
+
+    def get(self, key, extension):
+        """
+        Returns the path of the cached file with the given key and extension,
+        or None if it is not cached.
+
+        :param str key: Key of the file
+        :param str extension: Extension of the file (e.g. 'png')
+        :rtype: str
+        """
+        path = self.path(key, extension)
+        try:
+            # Mark as recently used
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key, extension, write):
+        """
+        Stores a new file in the cache and returns its path. The file is
+        written to a temporary path first and then moved, so concurrent
+        readers never see partially written files.
+
+        :param str key: Key of the file
+        :param str extension: Extension of the file (e.g. 'png')
+        :param function write: Function that receives a path and writes the
+            file contents into it.
+        :rtype: str
+        """
+        path = self.path(key, extension)
+        descriptor, tmp_path = tempfile.mkstemp(suffix='.' + extension,
+                                                dir=self.directory,
+                                                prefix=_TMP_PREFIX)
+        os.close(descriptor)
+        try:
+            write(tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.evict(keep=path)
+        return path
+
+    def evict(self, keep=None):
+        """
+        Removes the least recently used files until the cache size is below
+        its maximum size.
+
+        :param str keep: Path of a file that should not be removed (e.g. the
+            one just stored).
+        """
+        entries = []
+        total_size = 0
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.startswith(_TMP_PREFIX):
+                stat = entry.stat()
+                total_size += stat.st_size
+                if entry.path != keep:
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+
+    def clear(self):
+        """
+        Removes all the cached files. Files still being written (e.g. by
+        another process) are kept.
+        """
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.startswith(_TMP_PREFIX):
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
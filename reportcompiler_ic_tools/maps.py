@@ -4,28 +4,67 @@ Centre data.
 """
 import pandas as pd
 import numpy as np
+from pandas.api.types import is_numeric_dtype
 import pyproj
 import os
+from functools import lru_cache
 from pprint import pprint
 from geopandas import GeoDataFrame
+import shapely
+from shapely.geometry import MultiPolygon
+from shapely.geometry.polygon import orient
 from odictliteral import odict
 from plotnine import ggplot, aes, scale_fill_brewer, scale_fill_gradient, \
     scale_color_manual, scale_x_continuous, scale_y_continuous, geom_point, \
     theme, guides, guide_colorbar, xlab, ylab, element_rect, element_text, \
     theme_bw, guide_legend
 from plotnine.geoms.geom_map import geom_map
+from matplotlib.collections import PathCollection
+from matplotlib.colors import to_rgba, to_rgba_array
+from matplotlib.cm import ScalarMappable
+from matplotlib.figure import Figure
+from matplotlib.patches import Patch
+from matplotlib.path import Path
+from reportcompiler_ic_tools import __version__
+from reportcompiler_ic_tools.cache import FileCache, CACHE_DIR
+from reportcompiler_ic_tools.palettes import get_palette
+from reportcompiler_ic_tools.shared import _path_codes
+from reportcompiler_ic_tools.utils import fingerprint, _is_arrow_table
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = pc = None
 
-__all__ = ['generate_map', 'DEFAULT_TOLERANCES', 'DOT_THRESHOLD',
-           'REGION_BOUNDS', 'PROJECTION_DICT']
+__all__ = ['generate_map', 'generate_facet_map', 'cached_map_image',
+           'MapPlan', 'define_region', 'reproject', 'reproject_geometries',
+           'DEFAULT_TOLERANCES', 'DOT_THRESHOLD', 'REGION_BOUNDS',
+           'CUSTOM_REGIONS', 'PROJECTION_DICT', 'MAP_ENGINES']
+
+MAP_ENGINES = ['plotnine', 'matplotlib']
+''' Available map rendering engines. '''
 
 PROJECTION_DICT = {
     'robinson': {
         'proj': 'robin'
     },
+    'equal_earth': {
+        'proj': 'eqearth'
+    },
+    'mollweide': {
+        'proj': 'moll'
+    },
     'epsg4326': {}
 }
 ''' Pyproj projections. '''
 
+WRAPPED_PROJECTION = {
+    'proj': 'longlat',
+    'datum': 'WGS84',
+    'lon_wrap': 180
+}
+''' EPSG:4326 wrapped around the 180º longitude, used to plot Oceania. '''
+
 REGION_BOUNDS = {
     'robinson': {
         'XWX': (
@@ -50,6 +89,52 @@ REGION_BOUNDS = {
         ),
         'XOX': None  # Uncapable of wrapping in this projection, disabled
     },
+    'equal_earth': {
+        'XWX': (
+            [-16220000, 8150000],
+            [16220000, -6620000]
+        ),
+        'XFX': (
+            [-1600000, 4410000],
+            [5660000, -4670000]
+        ),
+        'XMX': (
+            [-14700000, 8150000],
+            [-1010000, -6340000]
+        ),
+        'XSX': (
+            [2540000, 6440000],
+            [13180000, -1160000]
+        ),
+        'XEX': (
+            [-2540000, 8250000],
+            [5070000, 4410000]
+        ),
+        'XOX': None  # Uncapable of wrapping in this projection, disabled
+    },
+    'mollweide': {
+        'XWX': (
+            [-16970000, 8440000],
+            [16970000, -6550000]
+        ),
+        'XFX': (
+            [-1680000, 4280000],
+            [5920000, -4540000]
+        ),
+        'XMX': (
+            [-15380000, 8440000],
+            [-1060000, -6250000]
+        ),
+        'XSX': (
+            [2650000, 6350000],
+            [13790000, -1120000]
+        ),
+        'XEX': (
+            [-2650000, 8620000],
+            [5300000, 4280000]
+        ),
+        'XOX': None  # Uncapable of wrapping in this projection, disabled
+    },
     'epsg4326': {
         'XWX': (
             [-163, 80],
@@ -88,6 +173,22 @@ DEFAULT_TOLERANCES = {
         'XEX': 13000,
         'XOX': None  # Uncapable of wrapping in this projection, disabled
     },
+    'equal_earth': {
+        'XWX': 40000,
+        'XFX': 26000,
+        'XMX': 40000,
+        'XSX': 32000,
+        'XEX': 13000,
+        'XOX': None  # Uncapable of wrapping in this projection, disabled
+    },
+    'mollweide': {
+        'XWX': 40000,
+        'XFX': 26000,
+        'XMX': 40000,
+        'XSX': 32000,
+        'XEX': 13000,
+        'XOX': None  # Uncapable of wrapping in this projection, disabled
+    },
     'epsg4326': {
         'XWX': .6,
         'XFX': .2,
@@ -100,10 +201,48 @@ DEFAULT_TOLERANCES = {
 ''' Default tolerances for polygon simplification in different regions by
 projection. '''
 
+COUNTRIES_PATH = os.path.join(os.path.dirname(__file__),
+                              'data/world-countries.shp')
+''' Path of the shapefile with the countries layer. '''
+
+PANEL_MAP_WIDTH = .75
+''' Proportion of the width of the facet map panels taken by the map (the
+rest is used by the legend). '''
+
 DOT_THRESHOLD = .00001
 ''' A dot will be plotted for countries with areas below this percentage of
 the total shown map area. '''
 
+CUSTOM_REGIONS = {}
+''' Custom regions (see define_region) by code, with their ISO codes and
+margin. '''
+
+REGION_MARGIN = .05
+''' Default margin around the countries of custom regions, as a proportion of
+the largest side of their bounds. '''
+
+TOLERANCE_RATIO = .0015
+''' Simplification tolerance of custom regions, as a proportion of the
+largest side of their bounds. '''
+
+MAIN_POLYGON_RATIO = .2
+''' Polygons of a country smaller than this proportion of its largest
+polygon (e.g. overseas territories) are ignored when computing the bounds of
+custom regions. '''
+
+_SIZE_FACTOR = np.sqrt(np.pi)
+# Conversion of plotnine sizes to matplotlib line widths (plotnine's
+# SIZE_FACTOR, defined in its private _utils module), so both engines draw
+# the same line widths
+
+_MAP_AXES = [.01, .01, .84, .98]
+# Axes box (left, bottom, width, height, as a fraction of the figure) of the
+# maps drawn with the 'matplotlib' engine, leaving room for the legend
+
+_SHARED_COUNTRIES = {}
+# Countries layers installed from shared memory (see the shared module), by
+# (projection, tolerance, wrap)
+
 
 def generate_map(data,
                  region,
@@ -116,11 +255,16 @@ def generate_map(data,
                  out_region_color='#f0f0f0',
                  na_color='#aaaaaa',
                  line_color='#666666',
-                 projection=None):
+                 projection=None,
+                 cache_base_layer=False,
+                 engine='plotnine',
+                 lazy=False,
+                 vector_resolution=None):
     """
     This function returns a map plot with the specified options.
 
-    :param pandas.DataFrame data: Data to be plotted.
+    :param pandas.DataFrame data: Data to be plotted (a dataframe or a
+        pyarrow table).
     :param str region: Region to center the map around. Countries outside
         the chosen region will be obscured.
     :param str value_field: Column of *data* with the values to be plotted.
@@ -139,141 +283,331 @@ def generate_map(data,
         specified region.
     :param str na_color: Hex color of the countries with no data available.
     :param str line_color: Color of the country borders.
-    :param str projection: Kind of map projection to be used in the map.
-        Currently, Oceania (XOX) is only available in ESPG:4326 to enable
-        wrapping.
-    :returns: a ggplot-like plot with the map
-    :rtype: plotnine.ggplot
+    :param str projection: Kind of map projection to be used in the map
+        (see PROJECTION_DICT). Currently, Oceania (XOX) is only available in
+        ESPG:4326 to enable wrapping.
+    :param bool cache_base_layer: Whether the countries out of the region
+        should be drawn from a cached layer, shared by all the maps with the
+        same region, projection and tolerance, that merges them into a
+        single shape. This speeds up the drawing of large batches of maps.
+        Only used by the 'plotnine' engine.
+    :param str engine: Rendering engine (see MAP_ENGINES). 'plotnine' returns
+        a ggplot-like plot that can be further refined, 'matplotlib' draws
+        the same map directly from cached country paths into a matplotlib
+        figure, which is considerably faster for high-volume outputs.
+    :param bool lazy: Whether the plot should be deferred. If True, a
+        MapPlan is returned instead of the plot, which allows inspecting the
+        data of each layer and rendering the plot later.
+    :param int vector_resolution: Resolution (in dots per inch) of the
+        vector output (e.g. PDF) the map is saved to. If given, the country
+        coordinates are quantized to that resolution and the vertices that
+        collapse to the same point are dropped. The quantized paths are
+        cached, and shared by all the maps with the same region, projection,
+        tolerance, plot size and resolution. This makes vector files
+        smaller, without visible changes at the given resolution. Only
+        available with the 'matplotlib' engine, since the grid is computed
+        from the layout of its figures.
+    :returns: Dictionary with the plot ('plot' key), or the map plan ('plan'
+        key) if lazy, and its width/height ratio ('ratio' key)
+    :rtype: dict
     """
-    if projection is None:
-        if region == 'XOX':
-            projection = 'epsg4326'
-        else:
-            projection = 'robinson'
+    projection, tolerance = _resolve_projection(region,
+                                                projection,
+                                                tolerance)
 
-    if projection not in PROJECTION_DICT.keys():
-        raise ValueError('Projection "{}" not valid'.format(projection))
+    if engine not in MAP_ENGINES:
+        raise ValueError('Engine "{}" not valid'.format(engine))
+    if vector_resolution is not None and vector_resolution <= 0:
+        raise ValueError('Vector resolution must be positive')
+    if vector_resolution is not None and engine != 'matplotlib':
+        raise ValueError(
+            'Vector resolution is only available with the "matplotlib" '
+            'engine')
 
     if scale_params is None:
         scale_params = {}
 
-    if region not in REGION_BOUNDS[projection]:
+    if value_field in _layer_columns():
         raise ValueError(
-            '"region" not available. Valid regions are: {}'.format(
-                ', '.join(REGION_BOUNDS[projection].keys())
-            ))
-
-    if tolerance is None:
-        tolerance = DEFAULT_TOLERANCES[projection][region]
-
-    countries = GeoDataFrame.from_file(
-        os.path.join(os.path.dirname(__file__), 'data/world-countries.shp'))
+            '"{}" is a column of the countries layer and cannot be used as '
+            'value_field'.format(value_field))
 
-    # To plot Oceania we need the original EPSG:4326 to wrap around the 180º
-    # longitude. In other cases transform to the desired projection.
-    if region == 'XOX':
-        countries.crs['lon_wrap'] = '180'  # Wrap around longitude 180º
-
-        XOX_countries = countries['continent'] == 'XOX'
-        countries[XOX_countries] = countries[XOX_countries].to_crs(
-            countries.crs)
-        centroids = countries[XOX_countries].apply(
-            lambda row: row['geometry'].centroid,
-            axis=1)
-        countries.loc[XOX_countries, 'lon'] = [c.x for c in centroids]
-        countries.loc[XOX_countries, 'lat'] = [c.y for c in centroids]
+    # Rows without ISO code cannot be placed on the map, so they are ignored
+    if _is_arrow_table(data):
+        if data.column(iso_field).null_count > 0:
+            data = data.filter(pc.is_valid(data.column(iso_field)))
+        iso_codes = _arrow_strings(data.column(iso_field))
+        counts = pc.value_counts(iso_codes)
+        duplicated = counts.field('values').filter(
+            pc.greater(counts.field('counts'), 1)).to_pylist()
     else:
-        if projection != 'epsg4326':
-            countries = countries.to_crs(PROJECTION_DICT[projection])
-            centroids = countries.apply(
-                lambda row: row['geometry'].centroid,
-                axis=1)
-            countries['lon'] = [c.x for c in centroids]
-            countries['lat'] = [c.y for c in centroids]
+        data = data[data[iso_field].notna()]
+        iso_codes = data[iso_field]
+        duplicated = iso_codes[iso_codes.duplicated()]
+    if len(duplicated) > 0:
+        raise ValueError('Duplicated ISO codes in data: {}'.format(
+            ', '.join(sorted(set(str(iso) for iso in duplicated)))))
 
-    countries['geometry'] = countries['geometry'].simplify(tolerance)
+    countries = _prepared_countries(projection,
+                                    tolerance,
+                                    region == 'XOX')
+    if engine == 'plotnine' and 'geometry' not in countries:
+        raise ValueError(
+            'Shared countries layers (without geometries) can only be '
+            'drawn with the "matplotlib" engine')
+    countries = countries.copy()
 
-    upper_left, lower_right = REGION_BOUNDS[projection][region]
+    upper_left, lower_right = _region_bounds(region, projection)
     limits_x = [upper_left[0], lower_right[0]]
     limits_y = [lower_right[1], upper_left[1]]
     ratio = (limits_x[1] - limits_x[0]) / (limits_y[1] - limits_y[0])
 
-    plot_data = pd.merge(countries,
-                         data,
-                         how='left',
-                         left_on='iso',
-                         right_on=iso_field)
-    map_bounds = REGION_BOUNDS['epsg4326'][region]
-    map_area = (
-        (map_bounds[1][0] - map_bounds[0][0]) *
-        (map_bounds[0][1] - map_bounds[1][1])
-    )
-    plot_data['plot_dot'] = (plot_data['pol_area'] <
-                             DOT_THRESHOLD * map_area)
+    # The countries layer is indexed by ISO code, so the data values only
+    # need to be aligned to it
+    plot_data = countries
+    if _is_arrow_table(data):
+        # Joined in arrow, only the aligned values are converted
+        positions = pc.index_in(pa.array(countries.index.astype(str)),
+                                value_set=iso_codes)
+        plot_data[value_field] = data.column(value_field) \
+            .take(positions).to_numpy(zero_copy_only=False)
+    else:
+        plot_data[value_field] = pd.Series(
+            data[value_field].values,
+            index=iso_codes.values).reindex(countries.index).values
+    plot_data['plot_dot'] = _small_countries(region)
 
+    has_value = ~pd.isnull(plot_data[value_field].values)
     if not plot_na_dots:
-        plot_data['plot_dot'] &= ~pd.isnull(plot_data[value_field])
-
-    if region != 'XWX':
-        in_region = ((~pd.isnull(plot_data[value_field])) &
-                     (plot_data['continent'] == region))
-        in_region_missing = ((pd.isnull(plot_data[value_field])) &
-                             (plot_data['continent'] == region))
-        out_region = plot_data['continent'] != region
-    else:
-        in_region = ~pd.isnull(plot_data[value_field])
-        in_region_missing = pd.isnull(plot_data[value_field])
-        out_region = np.repeat(False, len(plot_data))
+        plot_data['plot_dot'] &= has_value
 
-    if plot_data[value_field].dtype == 'object':
-        # Assume discrete values
-        fill_scale = scale_fill_brewer(**scale_params, drop=False)
-    else:
-        # Assume continuous values
-        fill_scale = scale_fill_gradient(**scale_params)
-
-    plot_data_values = plot_data[in_region]
-    plot_data_missing = plot_data[in_region_missing]
-    plot_data_out_region = plot_data[out_region]
-
-    dots_region = plot_data_values[plot_data_values['plot_dot']]
-    dots_region_missing = plot_data_missing[plot_data_missing['plot_dot']]
-    dots_out_region = plot_data_out_region[plot_data_out_region['plot_dot']]
-
-    plt = (
-           ggplot() +
-           geom_map(plot_data_values,
-                    aes(fill=value_field),
-                    color=line_color,
-                    size=0.3) +
-           geom_map(plot_data_missing,
-                    aes(color='plot_dot'),
-                    fill=na_color,
-                    size=0.3) +
-           geom_map(plot_data_out_region,
-                    fill=out_region_color,
-                    color=line_color,
-                    size=0.3) +
-           geom_point(dots_region,
-                      aes(x='lon', y='lat', fill=value_field),
-                      size=3,
-                      stroke=.1,
-                      color=line_color) +
-           geom_point(dots_region_missing,
-                      aes(x='lon', y='lat'),
-                      fill=na_color,
-                      size=3,
-                      stroke=.1,
-                      color=line_color) +
-           geom_point(dots_out_region,
-                      aes(x='lon', y='lat'),
-                      fill=out_region_color,
-                      size=3,
-                      stroke=.1,
-                      color=line_color) +
-           scale_x_continuous(breaks=[], limits=limits_x) +
-           scale_y_continuous(breaks=[], limits=limits_y) +
-           theme(figure_size=(plot_size*ratio, plot_size),
+    region_mask = _region_mask(region)
+    in_region = has_value & region_mask
+    in_region_missing = ~has_value & region_mask
+    out_region = ~region_mask
+    plan = MapPlan(plot_data,
+                   value_field,
+                   region=region,
+                   projection=projection,
+                   tolerance=tolerance,
+                   in_region=in_region,
+                   in_region_missing=in_region_missing,
+                   out_region=out_region,
+                   limits_x=limits_x,
+                   limits_y=limits_y,
+                   scale_params=scale_params,
+                   plot_size=plot_size,
+                   out_region_color=out_region_color,
+                   na_color=na_color,
+                   line_color=line_color,
+                   cache_base_layer=cache_base_layer,
+                   engine=engine,
+                   vector_resolution=vector_resolution)
+
+    if lazy:
+        return {
+            'plan': plan,
+            'ratio': ratio,
+        }
+    return {
+        'plot': plan.render(),
+        'ratio': ratio,
+    }
+
+
+class MapPlan:
+    """
+    Deferred map, as returned by generate_map when *lazy* is True. It records
+    the layers requested for the map (countries with values, countries
+    without data, countries out of the region and the dots for the small
+    countries of each group) but their data is only extracted when needed,
+    and only the non-empty layers are built when the map is rendered.
+
+    The prepared data of each layer can be inspected with *frame* (or
+    *frames*) without building the plot.
+    """
+
+    LAYERS = ['values', 'missing', 'out_region',
+              'dots_values', 'dots_missing', 'dots_out_region']
+    ''' Layers of the map, from bottom to top. '''
+
+    def __init__(self,
+                 plot_data,
+                 value_field,
+                 region,
+                 projection,
+                 tolerance,
+                 in_region,
+                 in_region_missing,
+                 out_region,
+                 limits_x,
+                 limits_y,
+                 scale_params,
+                 plot_size,
+                 out_region_color,
+                 na_color,
+                 line_color,
+                 cache_base_layer,
+                 engine,
+                 vector_resolution=None):
+        self.plot_data = plot_data
+        self.value_field = value_field
+        self.region = region
+        self.projection = projection
+        self.tolerance = tolerance
+        self.limits_x = limits_x
+        self.limits_y = limits_y
+        self.scale_params = scale_params
+        self.plot_size = plot_size
+        self.out_region_color = out_region_color
+        self.na_color = na_color
+        self.line_color = line_color
+        self.cache_base_layer = cache_base_layer
+        self.engine = engine
+        self.vector_resolution = vector_resolution
+        dots = plot_data['plot_dot'].values.astype(bool)
+        self.masks = odict[
+            'values': in_region,
+            'missing': in_region_missing,
+            'out_region': out_region,
+            'dots_values': in_region & dots,
+            'dots_missing': in_region_missing & dots,
+            'dots_out_region': out_region & dots,
+        ]
+        self._frames = {}
+
+    @property
+    def paths(self):
+        """
+        Cached matplotlib paths of the countries by ISO code (quantized if
+        the map has a vector resolution)
+        """
+        if self.vector_resolution is not None:
+            return _quantized_paths(self.projection,
+                                    self.tolerance,
+                                    self.region == 'XOX',
+                                    _quantization_step(
+                                        self.limits_y,
+                                        self.plot_size,
+                                        self.vector_resolution))
+        return _country_paths(self.projection,
+                              self.tolerance,
+                              self.region == 'XOX')
+
+    @property
+    def layers(self):
+        """ Names of the non-empty layers of the map """
+        return [name for name in self.LAYERS if self.masks[name].any()]
+
+    @property
+    def frames(self):
+        """ Dictionary with the data of each non-empty layer """
+        return {name: self.frame(name) for name in self.layers}
+
+    def frame(self, name):
+        """
+        Returns the data of a layer of the map.
+
+        :param str name: Layer name (see LAYERS)
+        :rtype: geopandas.GeoDataFrame
+        """
+        if name not in self._frames:
+            if name == 'out_region' and self.cache_base_layer:
+                frame, _ = _base_layer(self.region,
+                                       self.projection,
+                                       self.tolerance)
+            else:
+                frame = self.plot_data[self.masks[name]]
+            self._frames[name] = frame
+        return self._frames[name]
+
+    def render(self):
+        """
+        Builds the map plot with the non-empty layers.
+
+        :returns: A ggplot-like plot with the 'plotnine' engine or a
+            matplotlib figure with the 'matplotlib' engine
+        """
+        if self.engine == 'matplotlib':
+            return _draw_map(self.plot_data,
+                             self.value_field,
+                             self.masks['values'],
+                             self.masks['missing'],
+                             self.masks['out_region'],
+                             self.paths,
+                             self.limits_x,
+                             self.limits_y,
+                             self.scale_params,
+                             self.plot_size,
+                             self.out_region_color,
+                             self.na_color,
+                             self.line_color)
+        return self._build_ggplot()
+
+    def _build_ggplot(self):
+        value_field = self.value_field
+        line_color = self.line_color
+        paths = self.paths
+        discrete = not is_numeric_dtype(self.plot_data[value_field])
+        if self.cache_base_layer:
+            _, out_region_paths = _base_layer(self.region,
+                                              self.projection,
+                                              self.tolerance)
+        else:
+            out_region_paths = paths
+
+        layer_factories = {
+            'values': lambda frame: _cached_geom_map(
+                frame,
+                aes(fill=value_field, iso='iso'),
+                color=line_color,
+                size=0.3,
+                paths=paths),
+            'missing': lambda frame: _cached_geom_map(
+                frame,
+                aes(color='plot_dot', iso='iso'),
+                fill=self.na_color,
+                size=0.3,
+                paths=paths),
+            'out_region': lambda frame: _cached_geom_map(
+                frame,
+                aes(iso='iso'),
+                fill=self.out_region_color,
+                color=line_color,
+                size=0.3,
+                paths=out_region_paths),
+            'dots_values': lambda frame: geom_point(
+                frame,
+                aes(x='lon', y='lat', fill=value_field),
+                size=3,
+                stroke=.1,
+                color=line_color),
+            'dots_missing': lambda frame: geom_point(
+                frame,
+                aes(x='lon', y='lat'),
+                fill=self.na_color,
+                size=3,
+                stroke=.1,
+                color=line_color),
+            'dots_out_region': lambda frame: geom_point(
+                frame,
+                aes(x='lon', y='lat'),
+                fill=self.out_region_color,
+                size=3,
+                stroke=.1,
+                color=line_color),
+        }
+
+        ratio = ((self.limits_x[1] - self.limits_x[0]) /
+                 (self.limits_y[1] - self.limits_y[0]))
+        plt = ggplot()
+        for name in self.layers:
+            plt += layer_factories[name](self.frame(name))
+        plt = (
+           plt +
+           scale_x_continuous(breaks=[], limits=self.limits_x) +
+           scale_y_continuous(breaks=[], limits=self.limits_y) +
+           theme(figure_size=(self.plot_size*ratio, self.plot_size),
                  panel_background=element_rect(fill='white', color='black'),
                  #  panel_border=element_rect(fill='white',
                  #                            color='black',
@@ -285,20 +619,851 @@ def generate_map(data,
                  legend_box_just='left'
                  ) +
            xlab('') + ylab('')
-          )
+        )
+
+        if 'values' in self.layers:
+            if discrete:
+                plt += scale_fill_brewer(**self.scale_params, drop=False)
+            else:
+                plt += scale_fill_gradient(**self.scale_params)
+
+        plt += scale_color_manual(name=' ',
+                                  values=[line_color],
+                                  breaks=[False],
+                                  labels=['No data available'])
+
+        if discrete:
+            plt += guides(fill=guide_legend(override_aes={'shape': None}))
+
+        return plt
+
+
+def cached_map_image(data,
+                     region,
+                     value_field,
+                     iso_field='iso',
+                     cache_dir=None,
+                     format='png',
+                     dpi=300,
+                     max_cache_size=None,
+                     **map_params):
+    """
+    Returns the path of an image file with the map generated by generate_map
+    with the specified options. Images are stored in a content-addressed
+    cache, keyed by the data values and all the map options, so a map is
+    only rendered again when any of them changes. The returned path can be
+    used directly as the 'image_path' of the figure template.
+
+    :param pandas.DataFrame data: Data to be plotted (a dataframe or a
+        pyarrow table).
+    :param str region: Region to center the map around (see generate_map).
+    :param str value_field: Column of *data* with the values to be plotted.
+    :param str iso_field: Column of *data* with the ISO3 codes for each
+        country.
+    :param str cache_dir: Directory of the cached images. By default, a
+        'maps' subdirectory of reportcompiler_ic_tools.cache.CACHE_DIR.
+    :param str format: Format of the image (e.g. 'png' or 'pdf').
+    :param int dpi: Resolution of the image.
+    :param int max_cache_size: Maximum size (in bytes) of the cache
+        directory. The least recently used images are removed when exceeded.
+        By default, reportcompiler_ic_tools.cache.CACHE_SIZE.
+    :param map_params: Rest of generate_map parameters.
+    :returns: Path of the map image
+    :rtype: str
+    """
+    if cache_dir is None:
+        cache_dir = os.path.join(CACHE_DIR, 'maps')
+    projection, tolerance = _resolve_projection(region,
+                                                map_params.get('projection'),
+                                                map_params.get('tolerance'))
+    map_params = dict(map_params, projection=projection, tolerance=tolerance)
+
+    if _is_arrow_table(data):
+        values = data.select([iso_field, value_field]).sort_by(iso_field)
+    else:
+        values = data[[iso_field, value_field]].sort_values(iso_field)
+        values = values.reset_index(drop=True)
+    key = fingerprint(values, region, CUSTOM_REGIONS.get(region), value_field,
+                      map_params, format, dpi, __version__)
+
+    cache = FileCache(cache_dir, max_size=max_cache_size)
+    path = cache.get(key, format)
+    if path is not None:
+        return path
+
+    def write(path):
+        plot = generate_map(data,
+                            region,
+                            value_field,
+                            iso_field=iso_field,
+                            **map_params)['plot']
+        if isinstance(plot, Figure):
+            plot.savefig(path, format=format, dpi=dpi)
+        else:
+            plot.save(path, format=format, dpi=dpi, verbose=False)
 
-    if len(plot_data_values.index) > 0:
-        plt += fill_scale
+    return cache.put(key, format, write)
 
-    plt += scale_color_manual(name=' ',
-                              values=[line_color],
-                              breaks=[False],
-                              labels=['No data available'])
 
-    if plot_data[value_field].dtype == 'object':
-        plt += guides(fill=guide_legend(override_aes={'shape': None}))
+def generate_facet_map(data,
+                       region,
+                       indicator_field='indicator',
+                       value_field='value',
+                       iso_field='iso',
+                       indicators=None,
+                       titles=None,
+                       ncol=None,
+                       scale_params=None,
+                       plot_na_dots=False,
+                       tolerance=None,
+                       plot_size=4,
+                       out_region_color='#f0f0f0',
+                       na_color='#aaaaaa',
+                       line_color='#666666',
+                       projection=None):
+    """
+    This function returns a single figure with a map panel (small multiple)
+    for each indicator of a long-format dataframe. All the panels are drawn
+    from the same prepared (projected and simplified) countries layer and
+    cached country paths, and each one has its own colour scale and legend.
+    Panels are drawn with the 'matplotlib' engine, since plotnine facets
+    cannot have a different fill scale per panel. Their coordinates are not
+    quantized (see vector_resolution in generate_map), as the size of a
+    panel depends on the layout of the grid.
+
+    :param pandas.DataFrame data: Data to be plotted, with a row for each
+        country and indicator.
+    :param str region: Region to center the maps around (see generate_map).
+    :param str indicator_field: Column of *data* with the indicator of each
+        row.
+    :param str value_field: Column of *data* with the values to be plotted.
+    :param str iso_field: Column of *data* with the ISO3 codes for each
+        country.
+    :param list indicators: Indicators to be plotted, in panel order. By
+        default, all the indicators in order of appearance.
+    :param dict titles: Panel title of each indicator. By default, the
+        indicator itself.
+    :param int ncol: Number of panel columns. By default, panels are
+        arranged in a square-like grid.
+    :param dict scale_params: Scale parameters (see generate_map with the
+        'matplotlib' engine) of each indicator.
+    :param bool plot_na_dots: Whether to plot the dots for small countries
+        if said country doesn't have data available.
+    :param int tolerance: Coordinate tolerance for polygon simplification
+        (see generate_map).
+    :param int plot_size: Size of each panel, which determines the relative
+        sizes of the elements within.
+    :param str out_region_color: Hex color of the countries that are out of
+        the specified region.
+    :param str na_color: Hex color of the countries with no data available.
+    :param str line_color: Color of the country borders.
+    :param str projection: Kind of map projection to be used in the maps.
+    :returns: Dictionary with the figure ('plot' key) and its width/height
+        ratio ('ratio' key)
+    :rtype: dict
+    """
+    projection, tolerance = _resolve_projection(region,
+                                                projection,
+                                                tolerance)
+    if scale_params is None:
+        scale_params = {}
+    if titles is None:
+        titles = {}
+
+    # Rows without ISO code cannot be placed on the map, so they are ignored
+    data = data[data[iso_field].notna()]
+    duplicated = data[data.duplicated([iso_field, indicator_field])]
+    if len(duplicated) > 0:
+        raise ValueError('Duplicated ISO codes in data: {}'.format(
+            ', '.join(sorted(set(
+                '{} ({})'.format(iso, indicator)
+                for iso, indicator in zip(duplicated[iso_field],
+                                          duplicated[indicator_field]))))))
+
+    groups = {indicator: group
+              for indicator, group in data.groupby(indicator_field,
+                                                   sort=False)}
+    if indicators is None:
+        indicators = list(groups.keys())
+    unknown = [indicator for indicator in indicators
+               if indicator not in groups]
+    if unknown:
+        raise ValueError('Indicators not found in data: {}'.format(
+            ', '.join(str(indicator) for indicator in unknown)))
+    if len(indicators) == 0:
+        raise ValueError('No indicators to plot')
+
+    if ncol is None:
+        ncol = int(np.ceil(np.sqrt(len(indicators))))
+    nrow = int(np.ceil(len(indicators) / ncol))
+
+    # Shared by all the panels
+    countries = _prepared_countries(projection, tolerance, region == 'XOX')
+    paths = _country_paths(projection, tolerance, region == 'XOX')
+    region_mask = _region_mask(region)
+    small = _small_countries(region)
+    upper_left, lower_right = _region_bounds(region, projection)
+    limits_x = [upper_left[0], lower_right[0]]
+    limits_y = [lower_right[1], upper_left[1]]
+    ratio = (limits_x[1] - limits_x[0]) / (limits_y[1] - limits_y[0])
+    panel_data = pd.DataFrame({
+        'iso': countries['iso'].values,
+        'lon': countries['lon'].values,
+        'lat': countries['lat'].values,
+    })
+
+    # Panels leave room for their legend at the right side
+    panel_width = .9 * plot_size * ratio / PANEL_MAP_WIDTH
+    figure = Figure(figsize=(panel_width * ncol, plot_size * nrow))
+    for i, indicator in enumerate(indicators):
+        group = groups[indicator]
+        panel_data['value'] = pd.Series(
+            group[value_field].infer_objects().values,
+            index=group[iso_field].values).reindex(countries.index).values
+        has_value = ~pd.isnull(panel_data['value'].values)
+        panel_data['plot_dot'] = small if plot_na_dots else small & has_value
+        in_region = has_value & region_mask
+        in_region_missing = ~has_value & region_mask
+        panel_scale_params = dict(scale_params.get(indicator, {}))
+        panel_scale_params.setdefault('name', '')
+
+        row, col = divmod(i, ncol)
+        ax = figure.add_axes([(col + .01) / ncol,
+                              (nrow - row - 1 + .01) / nrow,
+                              PANEL_MAP_WIDTH / ncol,
+                              .90 / nrow])
+        ax.set_xlim(limits_x)
+        ax.set_ylim(limits_y)
+        ax.set_aspect('equal', adjustable='box', anchor='W')
+        ax.set_xticks([])
+        ax.set_yticks([])
+        ax.set_title(titles.get(indicator, indicator), loc='left')
+
+        palette, region_values, norm, has_missing = _draw_countries(
+            ax,
+            panel_data,
+            'value',
+            in_region,
+            in_region_missing,
+            ~region_mask,
+            paths,
+            panel_scale_params,
+            out_region_color,
+            na_color,
+            line_color)
+        _draw_panel_legend(ax,
+                           palette,
+                           region_values,
+                           norm,
+                           has_missing,
+                           panel_scale_params,
+                           na_color,
+                           line_color)
 
     return {
-        'plot': plt,
-        'ratio': ratio,
-    }
\ No newline at end of file
+        'plot': figure,
+        'ratio': panel_width * ncol / (plot_size * nrow),
+    }
+
+
+def reproject(x, y, projection, source='epsg4326'):
+    """
+    Reprojects arrays of coordinates in bulk. The pyproj transformers are
+    built once per process for each pair of projections.
+
+    :param numpy.ndarray x: X coordinates (longitudes in EPSG:4326)
+    :param numpy.ndarray y: Y coordinates (latitudes in EPSG:4326)
+    :param projection: Target projection, a key of PROJECTION_DICT or a
+        dictionary of pyproj parameters.
+    :param source: Source projection, as *projection*.
+    :returns: Reprojected x and y arrays
+    :rtype: tuple
+    """
+    transformer = _transformer(_crs(source), _crs(projection))
+    return transformer.transform(np.asarray(x, dtype=float),
+                                 np.asarray(y, dtype=float))
+
+
+def reproject_geometries(geometries, projection, source='epsg4326'):
+    """
+    Reprojects an array of shapely geometries, transforming the coordinates
+    of all of them in one single call (see reproject).
+
+    :param numpy.ndarray geometries: Geometries to be reprojected
+    :param projection: Target projection (see reproject)
+    :param source: Source projection (see reproject)
+    :returns: Array with the reprojected geometries
+    :rtype: numpy.ndarray
+    """
+    transformer = _transformer(_crs(source), _crs(projection))
+
+    def transform(coordinates):
+        return np.column_stack(transformer.transform(coordinates[:, 0],
+                                                     coordinates[:, 1]))
+
+    return shapely.transform(np.asarray(geometries, dtype=object), transform)
+
+
+def define_region(code, iso_codes, margin=None):
+    """
+    Defines a custom region (e.g. a WHO region, an income group or a country
+    and its neighbours) that can be used as the *region* of the maps. Its
+    bounds, simplification tolerance and dot threshold are computed from the
+    bounding boxes of its countries, and cached for each projection.
+
+    :param str code: Code of the region
+    :param list iso_codes: ISO3 codes of the countries of the region
+    :param float margin: Margin around the countries of the region, as a
+        proportion of the largest side of their bounds. By default,
+        REGION_MARGIN.
+    """
+    if code in REGION_BOUNDS['epsg4326']:
+        raise ValueError('"{}" is a built-in region'.format(code))
+    iso_codes = sorted(set(iso_codes))
+    if len(iso_codes) == 0:
+        raise ValueError('Region "{}" has no countries'.format(code))
+    known = set(_countries_attributes()['iso'].cat.categories)
+    unknown = [iso for iso in iso_codes if iso not in known]
+    if unknown:
+        raise ValueError('Unknown ISO codes in region "{}": {}'.format(
+            code, ', '.join(unknown)))
+    CUSTOM_REGIONS[code] = {
+        'iso': iso_codes,
+        'margin': REGION_MARGIN if margin is None else margin,
+    }
+    _clear_region_caches()
+
+
+def _resolve_projection(region, projection, tolerance):
+    if projection is None:
+        if region == 'XOX':
+            projection = 'epsg4326'
+        else:
+            projection = 'robinson'
+
+    if projection not in PROJECTION_DICT.keys():
+        raise ValueError('Projection "{}" not valid'.format(projection))
+
+    if region in CUSTOM_REGIONS:
+        if tolerance is None:
+            tolerance = _region_tolerance(region, projection)
+        return projection, tolerance
+
+    if REGION_BOUNDS[projection].get(region) is None:
+        raise ValueError(
+            '"region" not available. Valid regions are: {}'.format(
+                ', '.join([code for code, bounds
+                           in REGION_BOUNDS[projection].items()
+                           if bounds is not None] +
+                          list(CUSTOM_REGIONS.keys()))
+            ))
+
+    if tolerance is None:
+        tolerance = DEFAULT_TOLERANCES[projection][region]
+
+    return projection, tolerance
+
+
+@lru_cache(maxsize=None)
+def _load_countries():
+    countries = GeoDataFrame.from_file(COUNTRIES_PATH)
+    countries['iso'] = countries['iso'].astype('category')
+    countries['continent'] = countries['continent'].astype('category')
+    countries.index = pd.CategoricalIndex(countries['iso'], name=None)
+    return countries
+
+
+def _crs(projection):
+    if isinstance(projection, dict):
+        return _cached_crs(tuple(sorted(projection.items())))
+    if projection not in PROJECTION_DICT:
+        raise ValueError('Projection "{}" not valid'.format(projection))
+    return _cached_crs(tuple(sorted(PROJECTION_DICT[projection].items())))
+
+
+@lru_cache(maxsize=None)
+def _cached_crs(parameters):
+    if not parameters:
+        return pyproj.CRS('EPSG:4326')
+    return pyproj.CRS.from_dict(dict(parameters))
+
+
+@lru_cache(maxsize=None)
+def _transformer(source, target):
+    # Transformers are expensive to build, so they are shared by all the
+    # reprojections between the same pair of CRS
+    return pyproj.Transformer.from_crs(source, target, always_xy=True)
+
+
+def _countries_attributes():
+    # Projection-independent attributes of the countries layer, from a shared
+    # layer if any is installed (to avoid loading the shapefile)
+    for shared in _SHARED_COUNTRIES.values():
+        return shared.countries
+    return _load_countries()
+
+
+def _layer_columns():
+    for shared in _SHARED_COUNTRIES.values():
+        return shared.spec['columns']
+    return list(_load_countries().columns)
+
+
+def _arrow_strings(column):
+    # ISO codes of an arrow table as a plain string array, since index_in
+    # needs the value set to have the type of the looked up values
+    # (dictionary-encoded or large_string columns would fail otherwise)
+    values = column.combine_chunks()
+    if pa.types.is_dictionary(values.type):
+        values = values.dictionary_decode()
+    return pc.cast(values, pa.string())
+
+
+def _clear_caches():
+    for function in [_region_masks, _prepared_countries, _country_paths,
+                     _quantized_paths]:
+        function.cache_clear()
+    _clear_region_caches()
+
+
+def _clear_region_caches():
+    # Caches keyed by region, e.g. after a custom region is (re)defined
+    for function in [_region_mask, _region_bounds, _region_tolerance,
+                     _small_countries, _base_layer]:
+        function.cache_clear()
+
+
+@lru_cache(maxsize=None)
+def _region_masks():
+    # Boolean arrays (aligned with the countries layer rows) of the countries
+    # belonging to each region
+    continents = _countries_attributes()['continent']
+    codes = continents.cat.codes.values
+    masks = {
+        continent: codes == code
+        for code, continent in enumerate(continents.cat.categories)
+    }
+    masks['XWX'] = np.ones(len(codes), dtype=bool)
+    for mask in masks.values():
+        mask.setflags(write=False)
+    return masks
+
+
+@lru_cache(maxsize=None)
+def _region_mask(region):
+    # Boolean array of the countries of a built-in or custom region
+    if region not in CUSTOM_REGIONS:
+        return _region_masks()[region]
+    iso = _countries_attributes()['iso'].astype(str).values
+    mask = np.isin(iso, CUSTOM_REGIONS[region]['iso'])
+    mask.setflags(write=False)
+    return mask
+
+
+@lru_cache(maxsize=None)
+def _region_bounds(region, projection):
+    # Upper left and lower right corners of the region (see REGION_BOUNDS),
+    # computed from the bounds of its countries for custom regions
+    if region not in CUSTOM_REGIONS:
+        return REGION_BOUNDS[projection][region]
+    bounds = _country_bounds(projection)[_region_mask(region)]
+    min_x, min_y = np.nanmin(bounds[:, :2], axis=0)
+    max_x, max_y = np.nanmax(bounds[:, 2:], axis=0)
+    margin = CUSTOM_REGIONS[region]['margin'] * max(max_x - min_x,
+                                                    max_y - min_y)
+    return (
+        [float(min_x - margin), float(max_y + margin)],
+        [float(max_x + margin), float(min_y - margin)]
+    )
+
+
+@lru_cache(maxsize=None)
+def _region_tolerance(region, projection):
+    bounds = _country_bounds(projection)[_region_mask(region)]
+    size = max(np.nanmax(bounds[:, 2]) - np.nanmin(bounds[:, 0]),
+               np.nanmax(bounds[:, 3]) - np.nanmin(bounds[:, 1]))
+    return float(TOLERANCE_RATIO * size)
+
+
+@lru_cache(maxsize=None)
+def _country_bounds(projection):
+    # Bounding box index (min x, min y, max x, max y) of each country in the
+    # given projection, only taking into account its main polygons
+    geometries = _projected_countries(projection, False)['geometry'].values
+    parts, rows = shapely.get_parts(geometries, return_index=True)
+    areas = shapely.area(parts)
+    largest = np.zeros(len(geometries))
+    np.maximum.at(largest, rows, areas)
+    main = areas >= MAIN_POLYGON_RATIO * largest[rows]
+    parts, rows = parts[main], rows[main]
+
+    part_bounds = shapely.bounds(parts)
+    bounds = np.full((len(geometries), 4), np.nan)
+    bounds[:, :2] = np.inf
+    bounds[:, 2:] = -np.inf
+    np.minimum.at(bounds[:, 0], rows, part_bounds[:, 0])
+    np.minimum.at(bounds[:, 1], rows, part_bounds[:, 1])
+    np.maximum.at(bounds[:, 2], rows, part_bounds[:, 2])
+    np.maximum.at(bounds[:, 3], rows, part_bounds[:, 3])
+    bounds[~np.isfinite(bounds)] = np.nan
+    bounds.setflags(write=False)
+    return bounds
+
+
+@lru_cache(maxsize=None)
+def _small_countries(region):
+    # Boolean array of the countries drawn with a dot, i.e. those whose area
+    # is below DOT_THRESHOLD of the (EPSG:4326) region area
+    map_bounds = _region_bounds(region, 'epsg4326')
+    map_area = (
+        (map_bounds[1][0] - map_bounds[0][0]) *
+        (map_bounds[0][1] - map_bounds[1][1])
+    )
+    small = (_countries_attributes()['pol_area'] <
+             DOT_THRESHOLD * map_area).values
+    small.setflags(write=False)
+    return small
+
+
+@lru_cache(maxsize=None)
+def _prepared_countries(projection, tolerance, wrap):
+    # Countries layer projected and simplified, shared by all the maps with
+    # the same projection and tolerance
+    shared = _SHARED_COUNTRIES.get((projection, tolerance, wrap))
+    if shared is not None:
+        return shared.countries
+    countries = _projected_countries(projection, wrap).copy()
+    countries['geometry'] = countries['geometry'].simplify(tolerance)
+    return countries
+
+
+@lru_cache(maxsize=None)
+def _projected_countries(projection, wrap):
+    # Countries layer in the given projection, not simplified
+    countries = _load_countries().copy()
+
+    # To plot Oceania we need the original EPSG:4326 to wrap around the 180º
+    # longitude. In other cases transform to the desired projection.
+    if wrap:
+        XOX_countries = _region_masks()['XOX']
+        geometries = reproject_geometries(
+            countries.loc[XOX_countries, 'geometry'].values,
+            WRAPPED_PROJECTION)
+        centroids = shapely.centroid(geometries)
+        countries.loc[XOX_countries, 'geometry'] = geometries
+        countries.loc[XOX_countries, 'lon'] = shapely.get_x(centroids)
+        countries.loc[XOX_countries, 'lat'] = shapely.get_y(centroids)
+    elif projection != 'epsg4326':
+        geometries = reproject_geometries(countries['geometry'].values,
+                                          projection)
+        centroids = shapely.centroid(geometries)
+        countries = GeoDataFrame(countries.drop(columns='geometry'),
+                                 geometry=geometries,
+                                 crs=_crs(projection))
+        countries['lon'] = shapely.get_x(centroids)
+        countries['lat'] = shapely.get_y(centroids)
+
+    return countries
+
+
+@lru_cache(maxsize=None)
+def _base_layer(region, projection, tolerance):
+    # All the countries out of the region merged (not dissolved, so borders
+    # are kept) in a single multipolygon, drawn as one single patch
+    countries = _prepared_countries(projection, tolerance, region == 'XOX')
+    out_region = countries[~_region_mask(region)]
+    polygons = []
+    for geometry in out_region['geometry']:
+        if geometry is None or geometry.is_empty:
+            continue
+        if geometry.geom_type == 'MultiPolygon':
+            polygons.extend(geometry.geoms)
+        else:
+            polygons.append(geometry)
+    if not polygons:
+        return out_region, {}
+    base_layer = MultiPolygon(polygons)
+    return (
+        GeoDataFrame({'iso': ['base'], 'geometry': [base_layer]},
+                     crs=countries.crs),
+        {'base': _geometry_path(base_layer)}
+    )
+
+
+class _cached_geom_map(geom_map):
+    """
+    geom_map that draws the polygons from the already converted matplotlib
+    paths (see _country_paths) of each row 'iso' aesthetic, instead of
+    converting the geometries on each draw.
+    """
+    DEFAULT_AES = dict(geom_map.DEFAULT_AES, iso=None)
+    DEFAULT_PARAMS = dict(geom_map.DEFAULT_PARAMS, paths=None)
+
+    def draw_panel(self, data, panel_params, coord, ax):
+        paths = self.params['paths']
+        if not len(data) or paths is None:
+            return geom_map.draw_panel(self, data, panel_params, coord, ax)
+        data = data[[iso in paths for iso in data['iso']]]
+        if not len(data):
+            return
+        data.loc[data['color'].isna(), 'color'] = 'none'
+        data.loc[data['fill'].isna(), 'fill'] = 'none'
+        coll = PathCollection(
+            [paths[iso] for iso in data['iso']],
+            edgecolor=data['color'],
+            facecolor=to_rgba_array(data['fill'], data['alpha']),
+            linestyle=data['linetype'],
+            linewidth=data['size'] * _SIZE_FACTOR,
+            zorder=self.params['zorder'],
+            rasterized=self.params['raster'])
+        ax.add_collection(coll)
+
+
+@lru_cache(maxsize=None)
+def _country_paths(projection, tolerance, wrap):
+    # Ready to draw matplotlib paths of each country by ISO code
+    shared = _SHARED_COUNTRIES.get((projection, tolerance, wrap))
+    if shared is not None:
+        return shared.paths
+    countries = _prepared_countries(projection, tolerance, wrap)
+    paths = {}
+    for iso, geometry in zip(countries['iso'], countries['geometry']):
+        if geometry is None or geometry.is_empty:
+            continue
+        path = _geometry_path(geometry)
+        if iso in paths:
+            path = Path.make_compound_path(paths[iso], path)
+        paths[iso] = path
+    return paths
+
+
+def _geometry_path(geometry):
+    # As in descartes/plotnine, exteriors are drawn clockwise and interiors
+    # (holes) counter clockwise
+    if geometry.geom_type == 'MultiPolygon':
+        polygons = geometry.geoms
+    else:
+        polygons = [geometry]
+    rings = []
+    for polygon in polygons:
+        polygon = orient(polygon, sign=-1.0)
+        rings.append(Path(np.asarray(polygon.exterior.coords)[:, :2]))
+        rings.extend(Path(np.asarray(ring.coords)[:, :2])
+                     for ring in polygon.interiors)
+    return Path.make_compound_path(*rings)
+
+
+def _quantization_step(limits_y, plot_size, resolution):
+    # Size in map units of a dot at the given resolution, with the axes of
+    # _draw_map. The figure has the width/height ratio of the map, so the
+    # (equal aspect) map fills the width of the axes box, which is the
+    # smaller fraction of the figure: the map units per inch are the x range
+    # over the box width, i.e. the y range over _MAP_AXES[2] * plot_size
+    return (limits_y[1] - limits_y[0]) / (_MAP_AXES[2] * plot_size
+                                          * resolution)
+
+
+@lru_cache(maxsize=32)
+def _quantized_paths(projection, tolerance, wrap, step):
+    # Country paths with their vertices snapped to a grid of *step* map
+    # units, without the vertices collapsing to the same point nor the rings
+    # collapsing to less than a triangle
+    paths = _country_paths(projection, tolerance, wrap)
+    isos = list(paths.keys())
+    lengths = [len(paths[iso].vertices) for iso in isos]
+    grid = np.rint(np.concatenate([paths[iso].vertices for iso in isos])
+                   / step).astype(np.int64)
+    ring = np.cumsum(np.concatenate([_path_codes(paths[iso]) for iso in isos])
+                     == Path.MOVETO)
+    owner = np.repeat(np.arange(len(isos)), lengths)
+
+    # The last vertex of each ring is always kept, so rings stay closed
+    keep = np.ones(len(grid), dtype=bool)
+    keep[:-1] = ~((grid[:-1] == grid[1:]).all(axis=1) &
+                  (ring[:-1] == ring[1:]))
+    keep &= np.bincount(ring, weights=keep)[ring] >= 4
+    grid, ring, owner = grid[keep], ring[keep], owner[keep]
+    codes = np.full(len(grid), Path.LINETO, dtype=np.uint8)
+    codes[np.r_[True, ring[1:] != ring[:-1]]] = Path.MOVETO
+    vertices = grid * step
+
+    quantized = {}
+    bounds = np.searchsorted(owner, np.arange(len(isos) + 1))
+    for i, iso in enumerate(isos):
+        start, end = bounds[i], bounds[i + 1]
+        if start < end:
+            quantized[iso] = Path(vertices[start:end], codes[start:end])
+    return quantized
+
+
+def _draw_map(plot_data,
+              value_field,
+              in_region,
+              in_region_missing,
+              out_region,
+              paths,
+              limits_x,
+              limits_y,
+              scale_params,
+              plot_size,
+              out_region_color,
+              na_color,
+              line_color):
+    ratio = (limits_x[1] - limits_x[0]) / (limits_y[1] - limits_y[0])
+    figure = Figure(figsize=(plot_size * ratio, plot_size))
+    ax = figure.add_axes(_MAP_AXES)
+    ax.set_xlim(limits_x)
+    ax.set_ylim(limits_y)
+    ax.set_aspect('equal', adjustable='box')
+    ax.set_xticks([])
+    ax.set_yticks([])
+
+    palette, region_values, norm, has_missing = _draw_countries(
+        ax,
+        plot_data,
+        value_field,
+        in_region,
+        in_region_missing,
+        out_region,
+        paths,
+        scale_params,
+        out_region_color,
+        na_color,
+        line_color)
+    discrete = norm is None
+
+    na_handle = Patch(facecolor=na_color,
+                      edgecolor=line_color,
+                      label='No data available')
+    if discrete:
+        handles = [Patch(facecolor=color, edgecolor=line_color, label=label)
+                   for label, color in palette.legend(region_values)]
+        if has_missing:
+            handles.append(na_handle)
+        if handles:
+            ax.legend(handles=handles,
+                      title=scale_params.get('name', value_field),
+                      loc='center left',
+                      bbox_to_anchor=(1.02, .5),
+                      edgecolor='black',
+                      fancybox=False)
+    else:
+        if len(region_values) > 0:
+            colorbar = figure.colorbar(ScalarMappable(norm, palette.colormap),
+                                       cax=figure.add_axes(
+                                           [.87, .45, .015, .25]),
+                                       ticks=scale_params.get('breaks'))
+            colorbar.ax.set_title(scale_params.get('name', value_field),
+                                  loc='left')
+            if 'labels' in scale_params:
+                colorbar.set_ticklabels(scale_params['labels'])
+        if has_missing:
+            figure.legend(handles=[na_handle],
+                          loc='upper left',
+                          bbox_to_anchor=(.86, .42),
+                          edgecolor='black',
+                          fancybox=False)
+    return figure
+
+
+def _draw_panel_legend(ax,
+                       palette,
+                       region_values,
+                       norm,
+                       has_missing,
+                       scale_params,
+                       na_color,
+                       line_color):
+    # Legend (or colorbar) of a facet map panel, placed at its right side
+    na_handle = Patch(facecolor=na_color,
+                      edgecolor=line_color,
+                      label='No data available')
+    legend_params = dict(edgecolor='black', fancybox=False, fontsize='small')
+    if norm is None:
+        handles = [Patch(facecolor=color, edgecolor=line_color, label=label)
+                   for label, color in palette.legend(region_values)]
+        if has_missing:
+            handles.append(na_handle)
+        if handles:
+            ax.legend(handles=handles,
+                      title=scale_params.get('name') or None,
+                      loc='center left',
+                      bbox_to_anchor=(1.02, .5),
+                      **legend_params)
+        return
+    if len(region_values) > 0:
+        colorbar = ax.figure.colorbar(ScalarMappable(norm, palette.colormap),
+                                      cax=ax.inset_axes([1.03, .45, .02, .3]),
+                                      ticks=scale_params.get('breaks'))
+        colorbar.ax.tick_params(labelsize='small')
+        if scale_params.get('name'):
+            colorbar.ax.set_title(scale_params['name'],
+                                  loc='left',
+                                  fontsize='small')
+        if 'labels' in scale_params:
+            colorbar.set_ticklabels(scale_params['labels'])
+    if has_missing:
+        ax.legend(handles=[na_handle],
+                  loc='upper left',
+                  bbox_to_anchor=(1.02, .4),
+                  **legend_params)
+
+
+def _draw_countries(ax,
+                    plot_data,
+                    value_field,
+                    in_region,
+                    in_region_missing,
+                    out_region,
+                    paths,
+                    scale_params,
+                    out_region_color,
+                    na_color,
+                    line_color):
+    # Draws the country polygons and dots of a map into *ax*. Returns the
+    # palette, the values in the region, the normalization (None if discrete)
+    # and whether a 'No data available' legend entry is needed
+    iso = plot_data['iso'].values
+    values = plot_data[value_field].to_numpy()
+    dots = plot_data['plot_dot'].values.astype(bool)
+    discrete = not is_numeric_dtype(plot_data[value_field])
+    palette = get_palette(scale_params, discrete)
+    region_values = values[in_region]
+    norm = None
+    fills = np.tile(to_rgba(na_color), (len(plot_data), 1))
+    if discrete:
+        fills[in_region] = palette(region_values)
+    else:
+        norm = palette.norm(region_values)
+        fills[in_region] = palette(region_values, norm)
+    fills[out_region] = to_rgba(out_region_color)
+
+    # Countries out of the region, countries without data and countries
+    # with data (bottom to top), so the borders of the region are drawn over
+    # those of the other countries
+    for mask in [out_region, in_region_missing, in_region]:
+        if not mask.any():
+            continue
+        _, first = np.unique(iso[mask], return_index=True)
+        rows = np.flatnonzero(mask)[first]
+        rows = [row for row in rows if iso[row] in paths]
+        ax.add_collection(PathCollection([paths[iso[row]] for row in rows],
+                                         facecolors=fills[rows],
+                                         edgecolors=line_color,
+                                         linewidths=.3 * _SIZE_FACTOR))
+
+    lon = plot_data['lon'].values
+    lat = plot_data['lat'].values
+    for mask in [out_region, in_region_missing, in_region]:
+        mask = mask & dots
+        if not mask.any():
+            continue
+        ax.scatter(lon[mask], lat[mask],
+                   s=(3 + .1) ** 2 * np.pi,
+                   c=fills[mask],
+                   edgecolors=line_color,
+                   linewidths=.1 * _SIZE_FACTOR,
+                   zorder=3)
+
+    has_missing = np.any(in_region_missing & ~dots)
+    return palette, region_values, norm, has_missing
@@ -0,0 +1,210 @@
+"""
+This module contains the colour palettes used to fill the maps from the HPV
+Information Centre data. Palettes precompute their colour lookup tables once,
+so whole arrays of values are mapped to RGBA colours with numpy and the same
+palette can be reused by all the maps sharing the same scale parameters.
+They are used by the 'matplotlib' map engine (and the facet maps); the
+'plotnine' engine keeps colouring its maps through the plotnine fill scales.
+"""
+import numpy as np
+import pandas as pd
+from functools import lru_cache
+from matplotlib.colors import ListedColormap, Normalize, to_rgba, \
+    to_rgba_array
+from mizani.palettes import brewer_pal
+
+__all__ = ['ContinuousPalette', 'DiscretePalette', 'get_palette']
+
+GRADIENT_SIZE = 256
+''' Number of colours of the lookup table of continuous palettes. '''
+
+
+class ContinuousPalette:
+    """
+    Gradient palette for continuous values, equivalent to the plotnine
+    scale_fill_gradient colours.
+
+    :param str low: Colour of the lower end of the gradient.
+    :param str high: Colour of the upper end of the gradient.
+    :param list limits: Value limits of the gradient. Values out of the limits
+        take the colour of the closest end. If None, the limits are taken from
+        the values mapped on each call.
+    :param str na_color: Colour of the missing values.
+    """
+
+    def __init__(self,
+                 low='#132B43',
+                 high='#56B1F7',
+                 limits=None,
+                 na_color='#7f7f7f'):
+        self.limits = limits
+        self.na_color = to_rgba(na_color)
+        steps = np.linspace(0, 1, GRADIENT_SIZE)[:, np.newaxis]
+        self.lut = ((1 - steps) * to_rgba_array(low) +
+                    steps * to_rgba_array(high))
+        self.colormap = ListedColormap(self.lut)
+
+    def norm(self, values):
+        """
+        Returns the normalization (see matplotlib.colors.Normalize) of the
+        palette for the given values.
+
+        :param numpy.ndarray values: Values to be mapped
+        :rtype: matplotlib.colors.Normalize
+        """
+        limits = self.limits
+        if limits is None:
+            values = np.asarray(values, dtype=float)
+            if len(values) == 0 or np.all(np.isnan(values)):
+                limits = (0, 1)
+            else:
+                limits = (np.nanmin(values), np.nanmax(values))
+        return Normalize(*limits, clip=True)
+
+    def __call__(self, values, norm=None):
+        """
+        Maps the values to RGBA colours.
+
+        :param numpy.ndarray values: Values to be mapped
+        :param matplotlib.colors.Normalize norm: Normalization of the values.
+            By default, the one returned by *norm*.
+        :returns: Array with a RGBA row for each value
+        :rtype: numpy.ndarray
+        """
+        values = np.asarray(values, dtype=float)
+        if norm is None:
+            norm = self.norm(values)
+        vmin, vmax = norm.vmin, norm.vmax
+        scale = (GRADIENT_SIZE - 1) / ((vmax - vmin) or 1)
+        missing = np.isnan(values)
+        index = np.clip(np.rint((np.where(missing, vmin, values) - vmin) *
+                                scale),
+                        0,
+                        GRADIENT_SIZE - 1).astype(int)
+        colors = self.lut[index]
+        colors[missing] = self.na_color
+        return colors
+
+
+class DiscretePalette:
+    """
+    Brewer palette for discrete values, equivalent to the plotnine
+    scale_fill_brewer colours.
+
+    :param list categories: Categories of the palette, in order. If None,
+        the (sorted) unique values mapped on each call are used.
+    :param str type: Brewer palette type ('seq', 'div' or 'qual').
+    :param palette: Brewer palette name or index.
+    :param int direction: Order of the colours (1 or -1).
+    :param list labels: Legend labels of each category. By default, the
+        categories themselves.
+    :param str na_color: Colour of the missing values (or values not included
+        in the categories).
+    """
+
+    def __init__(self,
+                 categories=None,
+                 type='seq',
+                 palette=1,
+                 direction=1,
+                 labels=None,
+                 na_color='#7f7f7f'):
+        self.categories = None if categories is None else list(categories)
+        self.labels = labels
+        self.na_color = to_rgba(na_color)
+        self._brewer = brewer_pal(type, palette, direction=direction)
+        self._luts = {}
+
+    def lut(self, n):
+        """
+        Returns the lookup table with *n* colours (one per category).
+
+        :param int n: Number of categories
+        :rtype: numpy.ndarray
+        """
+        try:
+            return self._luts[n]
+        except KeyError:
+            lut = to_rgba_array(self._brewer(n)) if n > 0 \
+                else np.empty((0, 4))
+            self._luts[n] = lut
+            return lut
+
+    def categories_for(self, values):
+        """
+        Returns the categories used to map the given values.
+
+        :param numpy.ndarray values: Values to be mapped
+        :rtype: list
+        """
+        if self.categories is not None:
+            return self.categories
+        return sorted(set(v for v in values if not pd.isnull(v)))
+
+    def legend(self, values):
+        """
+        Returns the legend entries for the given values.
+
+        :param numpy.ndarray values: Values to be mapped
+        :returns: List of (label, RGBA colour) pairs
+        :rtype: list
+        """
+        categories = self.categories_for(values)
+        labels = self.labels if self.labels is not None else categories
+        return list(zip(labels, self.lut(len(categories))))
+
+    def __call__(self, values):
+        """
+        Maps the values to RGBA colours.
+
+        :param numpy.ndarray values: Values to be mapped
+        :returns: Array with a RGBA row for each value
+        :rtype: numpy.ndarray
+        """
+        categories = self.categories_for(values)
+        codes = pd.Categorical(values, categories=categories).codes
+        lut = np.vstack([self.lut(len(categories)), [self.na_color]])
+        return lut[codes]
+
+
+def get_palette(scale_params, discrete):
+    """
+    Returns the palette for the given scale parameters (as passed to the
+    generate_map function). Palettes are cached, so all the maps with the
+    same scale parameters share the same lookup tables.
+
+    :param dict scale_params: Scale parameters (name, limits, breaks,
+        labels, low, high, type, palette, direction). Unrelated parameters
+        are ignored.
+    :param bool discrete: Whether the palette is for discrete values.
+    :rtype: ContinuousPalette or DiscretePalette
+    """
+    return _cached_palette(_freeze(scale_params or {}), discrete)
+
+
+@lru_cache(maxsize=None)
+def _cached_palette(frozen_params, discrete):
+    params = {key: _thaw(value) for key, value in frozen_params}
+    if discrete:
+        return DiscretePalette(categories=params.get('limits'),
+                               type=params.get('type', 'seq'),
+                               palette=params.get('palette', 1),
+                               direction=params.get('direction', 1),
+                               labels=params.get('labels'))
+    return ContinuousPalette(low=params.get('low', '#132B43'),
+                             high=params.get('high', '#56B1F7'),
+                             limits=params.get('limits'))
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return ('__list__',) + tuple(_freeze(v) for v in value)
+    return value
+
+
+def _thaw(value):
+    if isinstance(value, tuple) and value[:1] == ('__list__',):
+        return [_thaw(v) for v in value[1:]]
+    return value
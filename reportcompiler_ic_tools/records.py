@@ -0,0 +1,115 @@
+"""
+This module contains the record types of the tables returned by
+generate_table_data: table cells, column headers and footer entries. They
+are compact objects (with __slots__) accessed by attribute (e.g. from the
+templates, ``cell.value`` or ``f.marker``), that also behave as the
+dictionaries previously returned (``cell['markers']``, ``dict(entry)`` or
+comparisons with dictionaries).
+"""
+
+__all__ = ['TableCell', 'ColumnHeader', 'FooterEntry']
+
+
+class _Record:
+    """
+    Base class of the records, with the read and write dictionary
+    interface of their fields. Optional fields (None by default) are only
+    included as keys when set.
+    """
+    __slots__ = ()
+    _fields = ()
+    _optional = ()
+
+    def __getitem__(self, key):
+        if key in self._fields:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key not in self._fields:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self):
+        return [field for field in self._fields
+                if field not in self._optional or
+                getattr(self, field) is not None]
+
+    def values(self):
+        return [getattr(self, field) for field in self.keys()]
+
+    def items(self):
+        return [(field, getattr(self, field)) for field in self.keys()]
+
+    def get(self, key, default=None):
+        if key in self._fields:
+            return getattr(self, key)
+        return default
+
+    def __eq__(self, other):
+        if isinstance(other, (_Record, dict)):
+            return dict(self.items()) == dict(other.items())
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__,
+                               ', '.join('{}={!r}'.format(field, value)
+                                         for field, value in self.items()))
+
+
+class TableCell(_Record):
+    """
+    Cell of a table, with its value and markers. The color (used by the
+    table template to shade the cell) is not set by default.
+
+    :param value: Value of the cell
+    :param list markers: Markers of the cell
+    :param color: Color of the cell
+    """
+    __slots__ = ('value', 'markers', 'color')
+    _fields = ('value', 'markers', 'color')
+    _optional = ('color',)
+
+    def __init__(self, value, markers, color=None):
+        self.value = value
+        self.markers = markers
+        self.color = color
+
+
+class ColumnHeader(_Record):
+    """
+    Header of a table column, with its name and markers.
+
+    :param value: Name of the column
+    :param list markers: Markers of the column
+    """
+    __slots__ = ('value', 'markers')
+    _fields = ('value', 'markers')
+
+    def __init__(self, value, markers):
+        self.value = value
+        self.markers = markers
+
+
+class FooterEntry(_Record):
+    """
+    Reference of a footer, with its marker (empty for global references)
+    and text.
+
+    :param str marker: Marker of the reference
+    :param str text: Text of the reference
+    """
+    __slots__ = ('marker', 'text')
+    _fields = ('marker', 'text')
+
+    def __init__(self, marker, text):
+        self.marker = marker
+        self.text = text
@@ -0,0 +1,196 @@
+"""
+This module contains the ReferenceSet class, which indexes the references
+(sources, notes, methods and years) returned by the IC data fetcher so they
+can be looked up by row, column or cell without scanning the reference
+dataframes again.
+"""
+import sys
+from types import MappingProxyType
+from reportcompiler_ic_tools.utils import EMPTY_REFERENCES, _column_values
+
+__all__ = ['ReferenceSet', 'REFERENCE_TYPES', 'REFERENCE_SCOPES']
+
+REFERENCE_TYPES = ['sources', 'notes', 'methods', 'years']
+''' Types of references, in the order their markers are assigned. '''
+
+REFERENCE_SCOPES = ['global', 'column', 'row', 'cell']
+''' Scopes of references, in the order their markers are assigned. '''
+
+
+class ReferenceSet(dict):
+    """
+    Data dictionary (as returned by the IC data fetcher) whose references
+    are normalized once into lookup structures: for each reference type, the
+    global texts, the texts of each column, of each row and of each
+    (row, column) cell, in their original order. Reference texts are
+    interned, so repeated texts share the same string.
+
+    It can be used anywhere a data dictionary is accepted (it is a dict with
+    the same keys), and it is reused by all the tables built from the same
+    dataset, e.g. with different selected columns:
+
+    .. code-block:: python
+
+        references = ReferenceSet(data_dict)
+        summary = generate_table_data(references, selected_columns=[...])
+        detail = generate_table_data(references)
+
+    The reference dataframes should not be modified after building the set.
+
+    :param dict data_dict: Dictionary returned by the IC data fetcher
+    """
+
+    def __init__(self, data_dict, _lookups=None):
+        super().__init__(data_dict)
+        if _lookups is None:
+            _lookups = {
+                ref_type: _index_references(data_dict.get(ref_type))
+                for ref_type in REFERENCE_TYPES
+            }
+        self.lookups = _lookups
+
+    @classmethod
+    def of(cls, data_dict):
+        """
+        Returns the given data dictionary as a ReferenceSet, indexing its
+        references only if it is not one already.
+
+        :param dict data_dict: Data dictionary or ReferenceSet
+        :rtype: ReferenceSet
+        """
+        if isinstance(data_dict, cls):
+            return data_dict
+        return cls(data_dict)
+
+    def with_data(self, data):
+        """
+        Returns a new ReferenceSet with the same (already indexed) references
+        but different data, e.g. a subset of the rows.
+
+        :param pandas.DataFrame data: New data
+        :rtype: ReferenceSet
+        """
+        data_dict = dict(self)
+        data_dict['data'] = data
+        return type(self)(data_dict, _lookups=self.lookups)
+
+    def __reduce__(self):
+        # Sets are pickled with their lookups (e.g. when sent to a process
+        # pool), except the shared empty ones which are read-only mappings
+        lookups = {ref_type: None if lookup is _EMPTY_LOOKUPS else lookup
+                   for ref_type, lookup in self.lookups.items()}
+        return _unpickle_reference_set, (type(self), dict(self), lookups)
+
+    def is_empty(self, ref_type=None, scope=None):
+        """
+        Returns whether there are no references of a type and scope (all
+        types and scopes by default).
+
+        :param str ref_type: Reference type (see REFERENCE_TYPES)
+        :param str scope: Reference scope (see REFERENCE_SCOPES)
+        :rtype: bool
+        """
+        ref_types = REFERENCE_TYPES if ref_type is None else [ref_type]
+        scopes = REFERENCE_SCOPES if scope is None else [scope]
+        return not any(self.lookups[ref_type][scope]
+                       for ref_type in ref_types
+                       for scope in scopes)
+
+    def global_refs(self, ref_type):
+        """
+        Returns the texts of the global references of a type.
+
+        :param str ref_type: Reference type (see REFERENCE_TYPES)
+        :rtype: list
+        """
+        return self.lookups[ref_type]['global']
+
+    def column_refs(self, ref_type, column):
+        """
+        Returns the texts of the references of a type applied to a column.
+
+        :param str ref_type: Reference type (see REFERENCE_TYPES)
+        :param str column: Column name
+        :rtype: list
+        """
+        return self.lookups[ref_type]['column'].get(column, [])
+
+    def row_refs(self, ref_type, row):
+        """
+        Returns the texts of the references of a type applied to a row.
+
+        :param str ref_type: Reference type (see REFERENCE_TYPES)
+        :param row: Row index
+        :rtype: list
+        """
+        return self.lookups[ref_type]['row'].get(row, [])
+
+    def cell_refs(self, ref_type, row, column):
+        """
+        Returns the texts of the references of a type applied to a cell.
+
+        :param str ref_type: Reference type (see REFERENCE_TYPES)
+        :param row: Row index
+        :param str column: Column name
+        :rtype: list
+        """
+        return self.lookups[ref_type]['cell'].get(row, {}).get(column, [])
+
+
+_EMPTY_LOOKUPS = MappingProxyType({
+    'global': (),
+    'column': MappingProxyType({}),
+    'row': MappingProxyType({}),
+    'cell': MappingProxyType({}),
+})
+
+
+def _unpickle_reference_set(cls, data_dict, lookups):
+    lookups = {ref_type: _EMPTY_LOOKUPS if lookup is None else lookup
+               for ref_type, lookup in lookups.items()}
+    return cls(data_dict, _lookups=lookups)
+
+
+def _index_references(ref_data):
+    # Lookups of the references of one type: global texts, texts by column,
+    # by row and by row and column (nested)
+    if ref_data is None or ref_data is EMPTY_REFERENCES:
+        return _EMPTY_LOOKUPS
+    if all(frame is None or len(frame) == 0
+           for frame in ref_data.values()):
+        return _EMPTY_LOOKUPS
+    lookups = {
+        'global': [],
+        'column': {},
+        'row': {},
+        'cell': {},
+    }
+    # Reference frames can be dataframes or pyarrow tables
+    frame = ref_data.get('global')
+    if frame is not None and len(frame) > 0:
+        lookups['global'] = [_intern(text)
+                             for text in _column_values(frame, 'text')]
+    frame = ref_data.get('column')
+    if frame is not None and len(frame) > 0:
+        for column, text in zip(_column_values(frame, 'column'),
+                                _column_values(frame, 'text')):
+            lookups['column'].setdefault(column, []).append(_intern(text))
+    frame = ref_data.get('row')
+    if frame is not None and len(frame) > 0:
+        for row, text in zip(_column_values(frame, 'row'),
+                             _column_values(frame, 'text')):
+            lookups['row'].setdefault(row, []).append(_intern(text))
+    frame = ref_data.get('cell')
+    if frame is not None and len(frame) > 0:
+        for row, column, text in zip(_column_values(frame, 'row'),
+                                     _column_values(frame, 'column'),
+                                     _column_values(frame, 'text')):
+            lookups['cell'].setdefault(row, {}) \
+                .setdefault(column, []).append(_intern(text))
+    return lookups
+
+
+def _intern(text):
+    if isinstance(text, str):
+        return sys.intern(text)
+    return text
@@ -0,0 +1,231 @@
+"""
+This module contains the ReferenceRegistry class, a report-wide store of
+the markers assigned to each reference text, shared by all the processes
+building the report so the same reference gets the same marker in every
+table.
+"""
+import os
+import sqlite3
+import threading
+from itertools import count, islice
+from odictliteral import odict
+from reportcompiler_ic_tools import markers as _markers
+from reportcompiler_ic_tools.records import FooterEntry
+
+__all__ = ['ReferenceRegistry', 'REGISTRY_FILE']
+
+REGISTRY_FILE = 'references.sqlite'
+''' Default file name of the registry in a build directory. '''
+
+_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS refs (
+        ref_type TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        text TEXT NOT NULL,
+        PRIMARY KEY (ref_type, position),
+        UNIQUE (ref_type, text)
+    )
+'''
+
+
+class ReferenceRegistry:
+    """
+    Markers of the references of a report, stored in a SQLite database. The
+    first process (or thread) needing a marker for a reference text assigns
+    it, in the order of the marker generators of its type, and the rest get
+    the same marker. New markers are assigned in bulk within a single
+    transaction, and known markers are cached by each process, so the
+    database is only queried for texts not seen before.
+
+    Tables generated with a registry (see generate_table_data) take their
+    markers from it, so tables built by different workers are consistent
+    without chaining them:
+
+    .. code-block:: python
+
+        registry = ReferenceRegistry(os.path.join('build', REGISTRY_FILE))
+        with ProcessPoolExecutor() as executor:
+            tables = executor.map(partial(build_section, registry=registry),
+                                  sections)
+        report_footer = registry.footer()
+
+    Registries can be pickled (e.g. sent to worker processes); each process
+    opens its own connection to the database.
+
+    :param str path: Path of the database file. If it is a directory,
+        REGISTRY_FILE inside it is used. It is created if it does not exist.
+    :param dict markers: Dictionary with the functions returning the marker
+        generators of each reference type ('sources', 'notes', 'methods',
+        'years'). All the processes must use the same functions. By default,
+        those in the markers module, except for 'sources', which are numbered
+        without limit (a report-wide registry easily goes past the 50 source
+        markers of a single table).
+    """
+
+    def __init__(self, path, markers=None):
+        if os.path.isdir(path):
+            path = os.path.join(path, REGISTRY_FILE)
+        if markers is None:
+            markers = odict[
+                'sources': _unlimited_source_markers,
+                'notes': _markers.note_markers,
+                'methods': _markers.method_markers,
+                'years': _markers.year_markers,
+            ]
+        self.path = path
+        self.marker_functions = markers
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._cache = {ref_type: {} for ref_type in markers.keys()}
+        self._marker_lists = {ref_type: [] for ref_type in markers.keys()}
+        self._marker_iterators = {}
+        with self._transaction() as connection:
+            connection.execute(_SCHEMA)
+
+    def __getstate__(self):
+        return {'path': self.path, 'marker_functions': self.marker_functions}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'], state['marker_functions'])
+
+    def markers(self, ref_type, texts):
+        """
+        Returns the markers of the given reference texts, assigning new
+        markers to the texts not registered yet (in the given order).
+
+        :param str ref_type: Reference type ('sources', 'notes', 'methods' or
+            'years')
+        :param list texts: Reference texts
+        :returns: List with the marker of each text
+        :rtype: list
+        """
+        texts = list(texts)
+        cache = self._cache[ref_type]
+        if any(text not in cache for text in texts):
+            with self._lock:
+                self._register(ref_type, texts)
+        return [cache[text] for text in texts]
+
+    def footer(self):
+        """
+        Returns all the registered references as a footer (see
+        generate_table_data), in marker order. This is useful for a
+        report-wide list of references.
+
+        :rtype: dict
+        """
+        with self._lock:
+            connection = self._connection()
+            footer = {}
+            for ref_type in self._cache.keys():
+                rows = connection.execute(
+                    'SELECT position, text FROM refs '
+                    'WHERE ref_type = ? ORDER BY position',
+                    (ref_type,)).fetchall()
+                footer[ref_type] = [
+                    FooterEntry(self._marker(ref_type, position), text)
+                    for position, text in rows]
+            return footer
+
+    def close(self):
+        """ Closes the database connection of the current thread. """
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _connection(self):
+        # SQLite connections cannot be shared between threads
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path,
+                                         timeout=60,
+                                         isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            self._local.connection = connection
+        return connection
+
+    def _transaction(self):
+        return _Transaction(self._connection())
+
+    def _load(self, connection, ref_type):
+        # Texts are cached in position order, so only the ones registered
+        # after the last load are queried
+        cache = self._cache[ref_type]
+        rows = connection.execute(
+            'SELECT position, text FROM refs '
+            'WHERE ref_type = ? AND position >= ? ORDER BY position',
+            (ref_type, len(cache))).fetchall()
+        for position, text in rows:
+            cache[text] = self._marker(ref_type, position)
+
+    def _register(self, ref_type, texts):
+        cache = self._cache[ref_type]
+        self._load(self._connection(), ref_type)
+        if all(text in cache for text in texts):
+            return
+        with self._transaction() as connection:
+            # Other processes may have registered texts meanwhile
+            self._load(connection, ref_type)
+            new_texts = [text for text in dict.fromkeys(texts)
+                         if text not in cache]
+            if not new_texts:
+                return
+            start = len(cache)
+            self._marker(ref_type, start + len(new_texts) - 1)
+            connection.executemany(
+                'INSERT INTO refs (ref_type, position, text) '
+                'VALUES (?, ?, ?)',
+                [(ref_type, start + i, text)
+                 for i, text in enumerate(new_texts)])
+        for i, text in enumerate(new_texts):
+            cache[text] = self._marker(ref_type, start + i)
+
+    def _marker(self, ref_type, position):
+        marker_list = self._marker_lists[ref_type]
+        if position >= len(marker_list):
+            iterator = self._marker_iterators.get(ref_type)
+            if iterator is None:
+                iterator = iter(self.marker_functions[ref_type]())
+                self._marker_iterators[ref_type] = iterator
+            marker_list.extend(
+                islice(iterator, position + 1 - len(marker_list)))
+            if position >= len(marker_list):
+                raise EnvironmentError(
+                    "No more '{}' markers are available: {} references are "
+                    "registered but the marker generator only yields {}. "
+                    "Pass a longer generator in the 'markers' argument of "
+                    "the registry.".format(ref_type, position + 1,
+                                           len(marker_list)))
+        return marker_list[position]
+
+
+def _unlimited_source_markers():
+    # Same markers as markers.source_markers, without its limit of 50
+    return (str(n) for n in count(1))
+
+
+class _Transaction:
+    """
+    Write transaction on a SQLite connection, taking the database lock
+    from the start so concurrent writers wait instead of failing.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute('BEGIN IMMEDIATE')
+        return self.connection
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.connection.execute('COMMIT')
+        else:
+            self.connection.execute('ROLLBACK')
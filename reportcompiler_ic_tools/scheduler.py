@@ -0,0 +1,444 @@
+"""
+This module contains the AssetScheduler class, which runs the generation of
+the assets of a report (tables, maps and any other task) concurrently,
+following the dependencies between them: CPU-bound work (preparing tables,
+drawing maps) runs in a process pool, file output in a thread pool, and an
+asyncio event loop dispatches each task as soon as its dependencies finish.
+"""
+import asyncio
+import functools
+import io
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from matplotlib.figure import Figure
+# Imported here rather than in the tasks: worker processes are forked while
+# the thread pool may be running, and a fork in the middle of an import in
+# another thread leaves the import lock of the module held in the child
+from reportcompiler_ic_tools.maps import generate_map
+from reportcompiler_ic_tools.shared import SharedCountries
+from reportcompiler_ic_tools.tables import generate_table_data
+
+__all__ = ['AssetScheduler', 'ScheduleReport', 'TASK_POOLS']
+
+TASK_POOLS = ['process', 'thread', 'loop']
+''' Where tasks can run: the process pool, the thread pool or the event
+loop thread itself (only for quick tasks). '''
+
+
+class TaskResult:
+    """
+    Placeholder for the result of a task (or one of its items), replaced
+    by the actual result when passed as an argument to a dependent task.
+    Created with AssetScheduler.result.
+    """
+
+    def __init__(self, name, key=None):
+        self.name = name
+        self.key = key
+
+    def resolve(self, results):
+        result = results[self.name]
+        if self.key is None:
+            return result
+        if hasattr(result, '__getitem__'):
+            return result[self.key]
+        return getattr(result, self.key)
+
+
+class _Task:
+    """ Task of the scheduler, with its arguments and dependencies. """
+
+    def __init__(self, name, function, args, kwargs, pool, depends_on):
+        self.name = name
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.pool = pool
+        self.depends_on = list(depends_on)
+        for value in list(args) + list(kwargs.values()):
+            if (isinstance(value, TaskResult) and
+                    value.name not in self.depends_on):
+                self.depends_on.append(value.name)
+
+
+class AssetScheduler:
+    """
+    Scheduler of the assets of a report. Tasks are declared with their
+    dependencies (either explicitly or by passing the result of another
+    task as an argument, see *result*) and then run concurrently:
+
+    .. code-block:: python
+
+        scheduler = AssetScheduler()
+        scheduler.shared_countries('world', 'XWX')
+        scheduler.table('burden', burden_data)
+        scheduler.table('screening', screening_data, chain='burden')
+        scheduler.map_image('prevalence_map', data, 'XWX', 'value',
+                            'build/prevalence_map.pdf', format='pdf',
+                            shared='world')
+        report = scheduler.run()
+        screening_table = report.results['screening']
+        print(report.summary())
+
+    :param int max_workers: Number of worker processes (by default, the
+        number of CPUs).
+    :param int io_workers: Number of threads for file output and other
+        tasks run in threads.
+    """
+
+    def __init__(self, max_workers=None, io_workers=4):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.io_workers = io_workers
+        self.tasks = {}
+
+    def result(self, name, key=None):
+        """
+        Returns a placeholder for the result of a task, to be passed as an
+        argument of another task (which then depends on it).
+
+        :param str name: Name of the task
+        :param key: Item (or attribute) of the result to be passed instead
+            of the whole result (e.g. 'footer' for a table)
+        :rtype: TaskResult
+        """
+        return TaskResult(name, key)
+
+    def task(self,
+             name,
+             function,
+             *args,
+             pool='process',
+             depends_on=(),
+             **kwargs):
+        """
+        Declares a task calling *function* with the given arguments, which
+        may include results of other tasks (see *result*).
+
+        :param str name: Name of the task, unique within the scheduler
+        :param function function: Function of the task. For the 'process'
+            pool, it must be picklable (defined at module level), as must
+            its arguments and result.
+        :param str pool: Where the task runs (see TASK_POOLS)
+        :param list depends_on: Names of other tasks that must finish
+            before this one, besides those whose results are arguments.
+        :returns: Name of the task
+        :rtype: str
+        """
+        if name in self.tasks:
+            raise ValueError('Task "{}" already declared'.format(name))
+        if pool not in TASK_POOLS:
+            raise ValueError('Pool "{}" not valid'.format(pool))
+        self.tasks[name] = _Task(name, function, args, kwargs, pool,
+                                 depends_on)
+        return name
+
+    def table(self, name, data_dict, chain=None, **kwargs):
+        """
+        Declares a task generating a table with generate_table_data (in the
+        process pool).
+
+        :param str name: Name of the task
+        :param dict data_dict: Dictionary returned by the IC data fetcher
+        :param str chain: Name of the table task whose footer and markers
+            are continued by this table. As results are copies returned by
+            the workers, only the footer of the last table of a chain
+            contains all the references.
+        :param kwargs: Rest of generate_table_data parameters
+        :returns: Name of the task
+        :rtype: str
+        """
+        if chain is not None:
+            kwargs['footer'] = self.result(chain, 'footer')
+            kwargs['markers'] = self.result(chain, 'markers')
+        return self.task(name, generate_table_data, data_dict, **kwargs)
+
+    def shared_countries(self, name, region, projection=None, tolerance=None):
+        """
+        Declares a task creating a SharedCountries layer (see the shared
+        module), which maps declared with the same *shared* name use in
+        the worker processes instead of preparing the countries layer in
+        each of them. It is closed when the scheduler finishes.
+
+        :param str name: Name of the task
+        :param str region: Region of the maps (see SharedCountries.create)
+        :param str projection: Projection of the maps
+        :param int tolerance: Tolerance of the maps
+        :returns: Name of the task
+        :rtype: str
+        """
+        return self.task(name, SharedCountries.create, region,
+                         projection=projection, tolerance=tolerance,
+                         pool='thread')
+
+    def map_image(self,
+                  name,
+                  data,
+                  region,
+                  value_field,
+                  path,
+                  format='png',
+                  dpi=300,
+                  shared=None,
+                  **map_params):
+        """
+        Declares the tasks drawing a map with generate_map (in the process
+        pool, '<name>:draw' task) and writing its image (in the thread pool,
+        *name* task, whose result is the image path).
+
+        :param str name: Name of the task
+        :param pandas.DataFrame data: Data to be plotted
+        :param str region: Region to center the map around
+        :param str value_field: Column of *data* with the values to be plotted
+        :param str path: Path of the image file
+        :param str format: Format of the image (e.g. 'png' or 'pdf')
+        :param int dpi: Resolution of the image
+        :param str shared: Name of a shared_countries task whose layer is
+            used to draw the map. The 'matplotlib' engine is used by default
+            in this case.
+        :param map_params: Rest of generate_map parameters
+        :returns: Name of the task
+        :rtype: str
+        """
+        shared_spec = None
+        if shared is not None:
+            shared_spec = self.result(shared, 'spec')
+            map_params.setdefault('engine', 'matplotlib')
+        draw_name = self.task('{}:draw'.format(name),
+                              _draw_map_image,
+                              data,
+                              region,
+                              value_field,
+                              format,
+                              dpi,
+                              shared_spec,
+                              map_params)
+        return self.task(name,
+                         _write_file,
+                         path,
+                         self.result(draw_name),
+                         pool='thread')
+
+    def run(self):
+        """
+        Runs all the tasks (in a new event loop) and returns the report with
+        their results and timings.
+
+        :rtype: ScheduleReport
+        """
+        return asyncio.run(self.run_async())
+
+    async def run_async(self):
+        """
+        Coroutine running all the tasks, for callers with an event loop.
+
+        :rtype: ScheduleReport
+        """
+        order = self._topological_order()
+        loop = asyncio.get_running_loop()
+        results = {}
+        timings = {}
+        futures = {}
+        start = time.monotonic()
+
+        with ProcessPoolExecutor(max_workers=self.max_workers) as processes, \
+                ThreadPoolExecutor(max_workers=self.io_workers) as threads:
+            pools = {'process': processes, 'thread': threads}
+
+            async def run_task(task):
+                await asyncio.gather(*(futures[name]
+                                       for name in task.depends_on))
+                args = [_resolve(value, results) for value in task.args]
+                kwargs = {key: _resolve(value, results)
+                          for key, value in task.kwargs.items()}
+                if task.pool == 'loop':
+                    result, timing = _timed_call(task.function, args, kwargs)
+                else:
+                    result, timing = await loop.run_in_executor(
+                        pools[task.pool],
+                        functools.partial(_timed_call, task.function,
+                                          args, kwargs))
+                timing['pool'] = task.pool
+                results[task.name] = result
+                timings[task.name] = timing
+
+            for task in order:
+                futures[task.name] = asyncio.ensure_future(run_task(task))
+            try:
+                await asyncio.gather(*futures.values())
+            except BaseException:
+                for future in futures.values():
+                    future.cancel()
+                raise
+            finally:
+                for result in results.values():
+                    _close_shared(result)
+
+        wall_time = time.monotonic() - start
+        for timing in timings.values():
+            timing['start'] -= start
+            timing['end'] -= start
+        return ScheduleReport(results,
+                              timings,
+                              wall_time,
+                              {task.name: task.depends_on for task in order},
+                              {'process': self.max_workers,
+                               'thread': self.io_workers,
+                               'loop': 1})
+
+    def _topological_order(self):
+        for task in self.tasks.values():
+            for name in task.depends_on:
+                if name not in self.tasks:
+                    raise ValueError(
+                        'Task "{}" depends on unknown task "{}"'.format(
+                            task.name, name))
+        order = []
+        state = {}
+
+        def visit(task, path):
+            if state.get(task.name) == 'done':
+                return
+            if state.get(task.name) == 'visiting':
+                raise ValueError(
+                    'Circular dependency between tasks: {}'.format(
+                        ' -> '.join(path + [task.name])))
+            state[task.name] = 'visiting'
+            for name in task.depends_on:
+                visit(self.tasks[name], path + [task.name])
+            state[task.name] = 'done'
+            order.append(task)
+
+        for task in self.tasks.values():
+            visit(task, [])
+        return order
+
+
+class ScheduleReport:
+    """
+    Results and timings of the tasks run by an AssetScheduler.
+
+    :ivar dict results: Result of each task
+    :ivar dict timings: Start and end times (in seconds since the start of
+        the run), pool and process of each task
+    :ivar float wall_time: Duration of the whole run
+    :ivar list critical_path: Names of the chain of dependent tasks with the
+        longest total duration, which bounds the duration of the run
+    :ivar float critical_path_time: Total duration of the critical path
+    :ivar dict utilization: Fraction of the capacity of each pool (workers
+        by wall time) spent running tasks
+    """
+
+    def __init__(self, results, timings, wall_time, dependencies, workers):
+        self.results = results
+        self.timings = timings
+        self.wall_time = wall_time
+        self.critical_path, self.critical_path_time = _critical_path(
+            timings, dependencies)
+        self.utilization = {}
+        for pool, pool_workers in workers.items():
+            busy = sum(timing['end'] - timing['start']
+                       for timing in timings.values()
+                       if timing['pool'] == pool)
+            if busy > 0:
+                self.utilization[pool] = \
+                    busy / (pool_workers * (wall_time or 1))
+
+    def summary(self):
+        """
+        Returns a text summary of the run: the duration of each task, the
+        critical path and the utilization of the pools.
+
+        :rtype: str
+        """
+        lines = ['{:<30} {:>8} {:>9} {:>9}'.format('Task', 'Pool',
+                                                   'Start', 'Duration')]
+        for name, timing in sorted(self.timings.items(),
+                                   key=lambda item: item[1]['start']):
+            lines.append('{:<30} {:>8} {:>8.3f}s {:>8.3f}s'.format(
+                name, timing['pool'], timing['start'],
+                timing['end'] - timing['start']))
+        lines.append('Wall time: {:.3f}s'.format(self.wall_time))
+        lines.append('Critical path ({:.3f}s): {}'.format(
+            self.critical_path_time, ' -> '.join(self.critical_path)))
+        lines.append('Utilization: {}'.format(', '.join(
+            '{} {:.0%}'.format(pool, utilization)
+            for pool, utilization in self.utilization.items())))
+        return '\n'.join(lines)
+
+
+def _resolve(value, results):
+    if isinstance(value, TaskResult):
+        return value.resolve(results)
+    return value
+
+
+def _timed_call(function, args, kwargs):
+    # Timings use the monotonic clock, shared by all processes
+    start = time.monotonic()
+    result = function(*args, **kwargs)
+    timing = {'start': start, 'end': time.monotonic(), 'pid': os.getpid()}
+    return result, timing
+
+
+def _critical_path(timings, dependencies):
+    # Longest chain of dependent tasks by duration, in dependency order
+    finish = {}
+    previous = {}
+    for name, depends_on in dependencies.items():
+        duration = timings[name]['end'] - timings[name]['start']
+        longest = max(depends_on, key=lambda d: finish[d], default=None)
+        finish[name] = duration + (finish[longest] if longest else 0)
+        previous[name] = longest
+    if not finish:
+        return [], 0
+    name = max(finish, key=finish.get)
+    total = finish[name]
+    path = []
+    while name is not None:
+        path.append(name)
+        name = previous[name]
+    return path[::-1], total
+
+
+_ATTACHED_COUNTRIES = {}
+
+
+def _draw_map_image(data, region, value_field, format, dpi, shared_spec,
+                    map_params):
+    if (shared_spec is not None and
+            shared_spec['path'] not in _ATTACHED_COUNTRIES):
+        _ATTACHED_COUNTRIES[shared_spec['path']] = \
+            SharedCountries.attach(shared_spec)
+    plot = generate_map(data, region, value_field, **map_params)['plot']
+    image = io.BytesIO()
+    if isinstance(plot, Figure):
+        plot.savefig(image, format=format, dpi=dpi)
+    else:
+        plot.save(image, format=format, dpi=dpi, verbose=False)
+    return image.getvalue()
+
+
+def _write_file(path, content):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    descriptor, tmp_path = tempfile.mkstemp(
+        suffix=os.path.splitext(path)[1],
+        prefix='.tmp-',
+        dir=directory or None)
+    try:
+        with os.fdopen(descriptor, 'wb') as image_file:
+            image_file.write(content)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path
+
+
+def _close_shared(result):
+    if isinstance(result, SharedCountries):
+        result.close()
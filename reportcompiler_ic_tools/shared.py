@@ -0,0 +1,240 @@
+"""
+This module contains helpers to share the prepared countries layer of the
+maps between processes. The projected country paths (vertices, codes and
+offsets) and the attribute columns used by generate_map are written once
+to a memory-mapped file, and worker processes attach to it without copying
+or loading and projecting the countries layer themselves.
+"""
+import json
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+from matplotlib.path import Path
+
+__all__ = ['SharedCountries']
+
+ATTRIBUTE_COLUMNS = ['lon', 'lat', 'pol_area']
+''' Numeric columns of the countries layer shared with the workers. '''
+
+_ALIGNMENT = 64
+
+
+class SharedCountries:
+    """
+    Countries layer (for a projection and tolerance) stored in a
+    memory-mapped file. The process preparing the maps creates it:
+
+    .. code-block:: python
+
+        with SharedCountries.create('XFX') as shared:
+            with ProcessPoolExecutor(
+                    initializer=SharedCountries.attach,
+                    initargs=(shared.spec,)) as executor:
+                ...
+
+    and each worker attaches to it with its *spec* (a small picklable
+    dictionary). Attached layers are installed by default, i.e. used by
+    generate_map (with the 'matplotlib' engine) and generate_facet_map for
+    their projection and tolerance instead of loading the countries layer.
+    The memory pages of the file are shared by all the processes.
+
+    Use *create* and *attach* instead of the constructor.
+    """
+
+    def __init__(self, spec, owner):
+        self.spec = spec
+        self.owner = owner
+        self._mmap = np.memmap(spec['path'], dtype=np.uint8, mode='r')
+        self.arrays = {
+            name: np.frombuffer(self._mmap,
+                                dtype=np.dtype(dtype),
+                                count=int(np.prod(shape)),
+                                offset=offset).reshape(shape)
+            for name, dtype, shape, offset in spec['arrays']
+        }
+        self._paths = None
+        self._countries = None
+
+    @classmethod
+    def create(cls, region, projection=None, tolerance=None, path=None):
+        """
+        Writes the prepared countries layer for the given map options to a
+        new memory-mapped file.
+
+        :param str region: Region of the maps (see generate_map). Only used
+            to choose the default projection and tolerance, and whether the
+            layer is wrapped around the 180º longitude (Oceania).
+        :param str projection: Projection of the maps (see generate_map).
+        :param int tolerance: Tolerance of the maps (see generate_map).
+        :param str path: Path of the file. By default, a temporary file
+            (in /dev/shm if available).
+        :returns: The shared layer, owned by the current process
+        :rtype: SharedCountries
+        """
+        from reportcompiler_ic_tools import maps
+
+        projection, tolerance = maps._resolve_projection(region,
+                                                         projection,
+                                                         tolerance)
+        wrap = region == 'XOX'
+        countries = maps._prepared_countries(projection, tolerance, wrap)
+        paths = maps._country_paths(projection, tolerance, wrap)
+
+        iso_categories = list(countries['iso'].cat.categories)
+        continent_categories = list(countries['continent'].cat.categories)
+        path_iso = list(paths.keys())
+        lengths = [len(paths[iso].vertices) for iso in path_iso]
+        arrays = {
+            'iso': countries['iso'].cat.codes.values.astype(np.int16),
+            'continent':
+                countries['continent'].cat.codes.values.astype(np.int16),
+            'path_iso': np.array([iso_categories.index(iso)
+                                  for iso in path_iso], dtype=np.int16),
+            'path_offsets': np.concatenate([[0], np.cumsum(lengths)])
+                              .astype(np.int64),
+            'vertices': np.concatenate(
+                [paths[iso].vertices for iso in path_iso])
+                .astype(np.float64),
+            'codes': np.concatenate(
+                [_path_codes(paths[iso]) for iso in path_iso]),
+        }
+        for column in ATTRIBUTE_COLUMNS:
+            arrays[column] = countries[column].values.astype(np.float64)
+
+        if path is None:
+            directory = '/dev/shm' if os.path.isdir('/dev/shm') else None
+            descriptor, path = tempfile.mkstemp(
+                prefix='reportcompiler-countries-',
+                suffix='.bin',
+                dir=directory)
+            os.close(descriptor)
+
+        layout = []
+        size = 0
+        for name, array in arrays.items():
+            size = -(-size // _ALIGNMENT) * _ALIGNMENT
+            layout.append((name, array.dtype.str, list(array.shape), size))
+            size += array.nbytes
+        block = np.memmap(path, dtype=np.uint8, mode='w+', shape=(size,))
+        for (name, _, _, offset), array in zip(layout, arrays.values()):
+            block[offset:offset + array.nbytes] = \
+                np.frombuffer(array.tobytes(), dtype=np.uint8)
+        block.flush()
+        del block
+
+        spec = {
+            'path': path,
+            'key': [projection, tolerance, wrap],
+            'arrays': layout,
+            'iso_categories': iso_categories,
+            'continent_categories': continent_categories,
+            'columns': [str(column) for column in countries.columns
+                        if column != 'geometry'],
+        }
+        # Only JSON types, so the spec can also be passed to other programs
+        json.dumps(spec)
+        return cls(spec, owner=True)
+
+    @classmethod
+    def attach(cls, spec, install=True):
+        """
+        Attaches to a shared layer created by another process.
+
+        :param dict spec: Specification of the layer (its *spec* attribute)
+        :param bool install: Whether the layer should be used by the map
+            functions of this process (see *install*).
+        :rtype: SharedCountries
+        """
+        shared = cls(spec, owner=False)
+        if install:
+            shared.install()
+        return shared
+
+    @property
+    def key(self):
+        """ Projection, tolerance and wrapping of the layer """
+        projection, tolerance, wrap = self.spec['key']
+        return projection, tolerance, wrap
+
+    @property
+    def paths(self):
+        """
+        Dictionary with the matplotlib path of each country by ISO code,
+        whose vertices and codes are views of the shared memory.
+        """
+        if self._paths is None:
+            arrays = self.arrays
+            offsets = arrays['path_offsets']
+            iso_categories = self.spec['iso_categories']
+            self._paths = {
+                iso_categories[code]: Path(
+                    arrays['vertices'][offsets[i]:offsets[i + 1]],
+                    arrays['codes'][offsets[i]:offsets[i + 1]])
+                for i, code in enumerate(arrays['path_iso'])
+            }
+        return self._paths
+
+    @property
+    def countries(self):
+        """
+        Attributes of the countries layer (without geometries), indexed by
+        ISO code as the layer used by generate_map.
+        """
+        if self._countries is None:
+            arrays = self.arrays
+            iso = pd.Categorical.from_codes(arrays['iso'],
+                                            self.spec['iso_categories'])
+            countries = pd.DataFrame({
+                'iso': iso,
+                'continent': pd.Categorical.from_codes(
+                    arrays['continent'],
+                    self.spec['continent_categories']),
+            })
+            for column in ATTRIBUTE_COLUMNS:
+                countries[column] = arrays[column]
+            countries.index = pd.CategoricalIndex(iso, name=None)
+            self._countries = countries
+        return self._countries
+
+    def install(self):
+        """
+        Makes the map functions of this process use this layer for its
+        projection and tolerance (e.g. in the initializer of the worker
+        processes). The layers and paths already cached by the process are
+        discarded. While installed, maps with its projection and tolerance
+        can only be drawn with the 'matplotlib' engine.
+        """
+        from reportcompiler_ic_tools import maps
+        maps._SHARED_COUNTRIES[self.key] = self
+        maps._clear_caches()
+
+    def close(self):
+        """
+        Detaches from the shared layer (uninstalling it). If the current
+        process created it, the file is removed as well.
+        """
+        from reportcompiler_ic_tools import maps
+        if maps._SHARED_COUNTRIES.get(self.key) is self:
+            del maps._SHARED_COUNTRIES[self.key]
+            maps._clear_caches()
+        self._paths = None
+        self._countries = None
+        self.arrays = {}
+        self._mmap = None
+        if self.owner and os.path.exists(self.spec['path']):
+            os.remove(self.spec['path'])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _path_codes(path):
+    if path.codes is not None:
+        return path.codes.astype(np.uint8)
+    codes = np.full(len(path.vertices), Path.LINETO, dtype=np.uint8)
+    codes[0] = Path.MOVETO
+    return codes
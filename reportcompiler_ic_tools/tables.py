@@ -2,14 +2,53 @@
 This module contains helper functions to create tables with the Information
 Centre data.
 """
+import hashlib
+import html
+import re
+import unicodedata
 import pandas as pd
 import numpy as np
 from pprint import pprint
 from odictliteral import odict
 from reportcompiler_ic_tools.markers import \
     source_markers, note_markers, method_markers, year_markers
+from reportcompiler_ic_tools.records import TableCell, ColumnHeader, \
+    FooterEntry
+from reportcompiler_ic_tools.references import ReferenceSet
+from reportcompiler_ic_tools.utils import _is_arrow_table
 
-__all__ = ['generate_table_data']
+__all__ = ['generate_table_data', 'generate_grouped_tables',
+           'generate_chained_tables', 'footer_fingerprint', 'render_footer',
+           'render_table', 'escape_tex', 'TABLE_FORMATS']
+
+FOOTER_TITLES = odict[
+    'sources': 'Sources',
+    'notes': 'Notes',
+    'methods': 'Methods',
+    'years': 'Years',
+]
+''' Titles of each reference type in the table/figure footer. '''
+
+TABLE_FORMATS = ['latex', 'html', 'markdown']
+''' Output formats of the tables. LaTeX tables are rendered by the
+templates, HTML and Markdown tables are rendered by render_table. '''
+
+TABLE_WIDTH = 17.0
+''' Width (in cm) available for tables when computing their column
+specification. '''
+
+CHAR_WIDTH = .19
+''' Approximate width (in cm) of a character in a table cell. '''
+
+COLUMN_PADDING = .42
+''' Horizontal padding (in cm) of each table column (LaTeX's tabcolsep at
+both sides). '''
+
+MIN_COLUMN_WIDTH = .5
+''' Minimum width (in cm) of a table column in the computed column
+specification. '''
+
+_FOOTER_CACHE = {}
 
 
 def generate_table_data(data_dict,
@@ -19,13 +58,18 @@ def generate_table_data(data_dict,
                         format='latex',
                         collapse_refs=True,
                         footer=None,
-                        markers=None):
+                        markers=None,
+                        column_spec=False,
+                        registry=None):
     """
     Generates a new dataframe with the markers corresponding to the defined
         references (sources, notes, ...), alongside a list of the markers'
         meaning.
 
-    :param dict data_dict: Dictionary returned by the IC data fetcher
+    :param dict data_dict: Dictionary returned by the IC data fetcher (or a
+        ReferenceSet built from it, to reuse its indexed references). Its
+        data and reference dataframes can also be pyarrow tables, whose rows
+        are identified by their position.
     :param list selected_columns: List with the column names to be selected
         from the original dataframe
     :param list column_names: List with the column names of the selected
@@ -33,6 +77,8 @@ def generate_table_data(data_dict,
     :param str row_id_column: Column name that will contain the marks for row
         references
     :param str format: Format that the returned dataframe should comply with
+        (see TABLE_FORMATS). For 'html' and 'markdown', the finished markup of
+        the table and its footer is returned as well.
     :param bool collapse_refs: Whether markers should be collapsed when
         appropriate (e.g. all cells of a column to the column header)
     :param dict footer: Dictionary with the footer information as returned from
@@ -42,32 +88,319 @@ def generate_table_data(data_dict,
         each type of reference ('sources', 'notes', 'methods', 'years'). If
         None, new generators will be initialized (starting at 1 with sources,
         'a' with notes, ...).
+    :param bool column_spec: Whether a LaTeX column specification with fixed
+        column widths should be computed from the length of the table values
+        and markers (see TABLE_WIDTH). If True, it is returned in the
+        'table_latex' component.
+    :param ReferenceRegistry registry: Registry (see the registry module)
+        assigning the markers of the references, shared by all the tables of
+        a report. The markers parameter is ignored in this case.
     :returns: Dictionary with four components: table, columns, footer, markers;
         where table is the original dataframe with the necessary reference
-        markers, columns is the list with the table columns as will be
-        displayed, footer is a nested structure: for each type (sources, notes,
-        ...) there is a list of dictionaries with each ('marker' key) and
+        markers (as TableCell records), columns is the list with the table
+        columns as will be displayed (ColumnHeader records), footer is a
+        nested structure: for each type (sources, notes,
+        ...) there is a list of footer entries with each ('marker' key) and
         associated reference ('text' key) and markers is a dictionary with the
-        generators for the markers of each reference type.
+        generators for the markers of each reference type. If column_spec is
+        True, a fifth component, table_latex, contains the 'column_spec' to
+        be used by the table template. For the 'html' and 'markdown'
+        formats, a table_html or table_markdown component contains the
+        'table' and 'footer' markup (see render_table and render_footer).
     :rtype: dict
     """
-    data = data_dict['data'].copy()
+    references = ReferenceSet.of(data_dict)
+    data = data_dict['data']
+    selected_columns, column_names, row_id_column = _check_columns(
+        data, selected_columns, column_names, row_id_column)
+    return _table_data(references,
+                       _selected_data(data, selected_columns),
+                       selected_columns,
+                       column_names,
+                       row_id_column,
+                       format,
+                       collapse_refs,
+                       footer,
+                       markers,
+                       column_spec,
+                       registry)
+
+
+def generate_grouped_tables(data_dict,
+                            group_by,
+                            selected_columns=None,
+                            column_names=None,
+                            row_id_column=None,
+                            format='latex',
+                            collapse_refs=True,
+                            shared_markers=False,
+                            column_spec=False):
+    """
+    Generates a table (as generate_table_data) for each group of rows of the
+        data, e.g. a table for each country from a master dataframe with
+        the data of all countries. The data is split and validated only
+        once, and the references are indexed once and looked up by the rows
+        of each group.
+
+    :param dict data_dict: Dictionary returned by the IC data fetcher (or a
+        ReferenceSet built from it)
+    :param group_by: Column name (or list of column names) of the data whose
+        values define the groups. These columns do not need to be selected,
+        and cannot have null values.
+    :param list selected_columns: List with the column names to be selected
+        from the original dataframe
+    :param list column_names: List with the column names of the selected
+        dataframe columns
+    :param str row_id_column: Column name that will contain the marks for row
+        references
+    :param str format: Format that the returned dataframes should comply with
+    :param bool collapse_refs: Whether markers should be collapsed when
+        appropriate (e.g. all cells of a column to the column header)
+    :param bool shared_markers: Whether the markers and the footer should be
+        shared by all the tables (i.e. chained in group order). By default
+        each table has its own markers and footer.
+    :param bool column_spec: Whether a LaTeX column specification should be
+        computed for each table (see generate_table_data).
+    :returns: Dictionary with the result of generate_table_data for each
+        group value, in order of appearance.
+    :rtype: dict
+    """
+    references = ReferenceSet.of(data_dict)
+    data = data_dict['data']
+    if _is_arrow_table(data):
+        data = data.to_pandas()
+    selected_columns, column_names, row_id_column = _check_columns(
+        data, selected_columns, column_names, row_id_column)
+    selected_data = data[selected_columns]
+    group_columns = group_by if isinstance(group_by, list) else [group_by]
+    if data[group_columns].isnull().values.any():
+        # They would be silently dropped by groupby
+        raise ValueError('Null values in the group columns: {}'.format(
+            ', '.join(str(column) for column in group_columns)))
+
+    footer = None
+    markers = None
+    tables = {}
+    for group, positions in data.groupby(group_by, sort=False).indices.items():
+        table_info = _table_data(references,
+                                 selected_data.iloc[positions],
+                                 selected_columns,
+                                 column_names,
+                                 row_id_column,
+                                 format,
+                                 collapse_refs,
+                                 footer,
+                                 markers,
+                                 column_spec,
+                                 None)
+        if shared_markers:
+            footer = table_info['footer']
+            markers = table_info['markers']
+        tables[group] = table_info
+    return tables
+
+
+def generate_chained_tables(tables, executor=None, footer=None, markers=None):
+    """
+    Generates several tables chained in one single footer, with the same
+        result as calling generate_table_data for each of them in order
+        (passing the footer and markers returned by the previous call), but
+        preparing the tables concurrently. The order of the references of
+        each table is computed in parallel, then the markers are assigned
+        sequentially (a quick pass over the distinct references of each
+        table) and finally the tables and their markers are built in
+        parallel.
+
+    :param list tables: List with the generate_table_data arguments of each
+        table, as dictionaries with the 'data_dict' key and optionally the
+        rest of parameters (except 'footer', 'markers' and 'registry').
+        Passing ReferenceSets as data dictionaries avoids indexing their
+        references twice.
+    :param concurrent.futures.Executor executor: Executor (e.g. a
+        ThreadPoolExecutor or a ProcessPoolExecutor) where the tables are
+        prepared. If None, they are prepared in the current thread.
+    :param dict footer: Footer returned by a previous table to chain with.
+    :param dict markers: Dictionary with the marker generators of each
+        reference type (see generate_table_data).
+    :returns: List with the result of generate_table_data for each table.
+        As with chained calls, all of them share the same footer and marker
+        generators.
+    :rtype: list
+    """
+    for table_args in tables:
+        if ('footer' in table_args or
+                'markers' in table_args or
+                'registry' in table_args):
+            raise ValueError(
+                'Chained tables cannot have their own footer, markers or '
+                'registry')
+
+    ref_type_markers = markers
+    if ref_type_markers is None:
+        ref_type_markers = odict[
+            'sources': source_markers(),
+            'notes': note_markers(),
+            'methods': method_markers(),
+            'years': year_markers(),
+        ]
+    if footer is None:
+        footer = {ref_type: [] for ref_type in ref_type_markers.keys()}
+
+    orders = _map(executor, _table_reference_order, tables)
+
+    # Markers are assigned in table order, as the chained calls would
+    for ref_type in ref_type_markers.keys():
+        footer[ref_type] = [_footer_entry(entry)
+                            for entry in footer[ref_type]]
+    footer_indices = {
+        ref_type: _FooterIndex(footer[ref_type], markers, ref_type)
+        for ref_type, markers in ref_type_markers.items()
+    }
+    table_footers = []
+    footer_sizes = []
+    for order in orders:
+        table_footers.append({
+            ref_type: [(footer_indices[ref_type].marker(text, global_ref),
+                        text)
+                       for text, global_ref in order.get(ref_type, [])]
+            for ref_type in ref_type_markers.keys()
+        })
+        # Size of the shared footer once the markers of the table are
+        # assigned, i.e. the footer the chained call would have rendered
+        footer_sizes.append({ref_type: len(footer[ref_type])
+                             for ref_type in ref_type_markers.keys()})
+    for ref_type in ref_type_markers.keys():
+        footer[ref_type] = [FooterEntry(_marker, _ref)
+                            for _marker, _ref in footer[ref_type]]
+
+    results = _map(executor, _chained_table_data, tables, table_footers)
+    for table_args, table_info, sizes in zip(tables, results, footer_sizes):
+        footer['date'] = table_info['footer']['date']
+        table_info['footer'] = footer
+        table_info['markers'] = ref_type_markers
+        format = table_args.get('format', 'latex')
+        if format != 'latex':
+            table_footer = {ref_type: footer[ref_type][:size]
+                            for ref_type, size in sizes.items()}
+            table_footer['date'] = footer['date']
+            table_info['table_{}'.format(format)]['footer'] = \
+                render_footer(table_footer, format=format)
+    return results
+
+
+def _map(executor, function, *iterables):
+    if executor is None:
+        return list(map(function, *iterables))
+    futures = [executor.submit(function, *args) for args in zip(*iterables)]
+    return [future.result() for future in futures]
+
+
+def _table_reference_order(table_args):
+    references = ReferenceSet.of(table_args['data_dict'])
+    data = references['data']
+    selected_columns, _, _ = _check_columns(
+        data,
+        table_args.get('selected_columns'),
+        table_args.get('column_names'),
+        table_args.get('row_id_column'))
+    index = range(data.num_rows) if _is_arrow_table(data) else data.index
+    return _reference_order(references, index, selected_columns)
+
+
+def _chained_table_data(table_args, table_footer):
+    # Every reference of the table is already in its footer, so no new
+    # markers are drawn
+    table_args = dict(table_args)
+    data_dict = table_args.pop('data_dict')
+    no_markers = {ref_type: iter(()) for ref_type in table_footer.keys()}
+    return generate_table_data(data_dict,
+                               footer=table_footer,
+                               markers=no_markers,
+                               **table_args)
+
+
+def _reference_order(references, index, selected_columns):
+    # Distinct reference texts of each type in the order _table_data assigns
+    # their markers (global, column, row and cell references), with whether
+    # they first appear as global references
+    order = {}
+    for ref_type, lookups in references.lookups.items():
+        if references.is_empty(ref_type):
+            continue
+        texts = {}
+        for text in lookups['global']:
+            texts.setdefault(text, True)
+        refs_by_column = lookups['column']
+        for column in selected_columns:
+            for text in refs_by_column.get(column, []):
+                texts.setdefault(text, False)
+        refs_by_row = lookups['row']
+        if refs_by_row:
+            for row_index in index:
+                for text in refs_by_row.get(row_index, []):
+                    texts.setdefault(text, False)
+        refs_by_cell = lookups['cell']
+        if refs_by_cell:
+            for row_index in index:
+                refs_by_column = refs_by_cell.get(row_index)
+                if not refs_by_column:
+                    continue
+                for column in selected_columns:
+                    for text in refs_by_column.get(column, []):
+                        texts.setdefault(text, False)
+        order[ref_type] = list(texts.items())
+    return order
+
+
+def _check_columns(data, selected_columns, column_names, row_id_column):
+    columns = data.column_names if _is_arrow_table(data) else data.columns
     if selected_columns is None:
-        selected_columns = data.columns
+        selected_columns = columns
     if column_names is None:
-        column_names = data.columns
+        column_names = columns
     if row_id_column is None:
-        row_id_column = data.columns[0]
+        row_id_column = columns[0]
     if len(column_names) != len(selected_columns):
         raise ValueError(
             'column_names must have the same lengths as the number of '
             'columns in data_dict'
         )
-    if not set(selected_columns).issubset(set(data.columns)):
+    if not set(selected_columns).issubset(set(columns)):
         raise ValueError(
             'Selected columns must be included in the original dataframe'
         )
-    data = data[selected_columns]
+    return selected_columns, column_names, row_id_column
+
+
+def _selected_data(data, selected_columns):
+    # New dataframe with the selected columns. The columns of pyarrow tables
+    # are selected and converted to lists without converting the whole table
+    if not _is_arrow_table(data):
+        return data[selected_columns].copy()
+    selected_columns = list(selected_columns)
+    data = data.select(selected_columns)
+    return pd.DataFrame({
+        column: pd.Series(values, dtype=object)
+        for column, values in zip(selected_columns, data.to_pydict().values())
+    })
+
+
+def _table_data(references,
+                data,
+                selected_columns,
+                column_names,
+                row_id_column,
+                format,
+                collapse_refs,
+                footer,
+                markers,
+                column_spec,
+                registry):
+    # Reference markers of a table with its columns already selected (data
+    # is modified in place)
+    if format not in TABLE_FORMATS:
+        raise ValueError('Format "{}" not valid'.format(format))
+    ref_type_markers = markers
     if ref_type_markers is None:
         ref_type_markers = odict[
             'sources': source_markers(),
@@ -76,13 +409,15 @@ def generate_table_data(data_dict,
             'years': year_markers(),
         ]
 
-    marker_data = pd.DataFrame(data=None,
-                               columns=selected_columns,
-                               index=data.index)
-    for col in marker_data.columns:
-        marker_data[col] = marker_data[col].astype(object)
-        for row in marker_data.index:
-            marker_data.loc[row, col] = []
+    # Per cell markers are only needed with row or cell references
+    marker_data = None
+    if not (references.is_empty(scope='row') and
+            references.is_empty(scope='cell')):
+        marker_data = pd.DataFrame(data=None,
+                                   columns=selected_columns,
+                                   index=data.index)
+        for col in marker_data.columns:
+            marker_data[col] = [[] for row in marker_data.index]
     if footer is None:
         footer = {
             'sources': [],
@@ -90,50 +425,68 @@ def generate_table_data(data_dict,
             'methods': [],
             'years': [],
         }
+    else:
+        # Footers returned by previous calls have their entries already
+        # converted to dictionaries
+        for ref_type in ref_type_markers.keys():
+            footer[ref_type] = [_footer_entry(entry)
+                                for entry in footer[ref_type]]
+
+    registered = {}
+    if registry is not None:
+        # Markers of the references that are not global, in bulk
+        order = _reference_order(references, data.index, selected_columns)
+        for ref_type, texts in order.items():
+            texts = [text for text, global_ref in texts if not global_ref]
+            registered[ref_type] = dict(
+                zip(texts, registry.markers(ref_type, texts)))
 
     column_markers = [[] for col in selected_columns]
     for ref_type, markers in ref_type_markers.items():
-        ref_data = data_dict[ref_type]
-        _build_global_refs(ref_data['global'],
-                           footer[ref_type],
-                           markers,
-                           ref_type)
-        _column_markers = _build_column_refs(ref_data['column'],
-                                             footer[ref_type],
-                                             markers, ref_type,
-                                             marker_data,
-                                             selected_columns,
-                                             column_names)
+        if references.is_empty(ref_type):
+            continue
+        lookups = references.lookups[ref_type]
+        table_footer = _FooterIndex(footer[ref_type],
+                                    markers,
+                                    ref_type,
+                                    registered.get(ref_type))
+        _build_global_refs(lookups['global'], table_footer)
+        _column_markers = _build_column_refs(lookups['column'],
+                                             table_footer,
+                                             selected_columns)
         for i, col in enumerate(column_markers):
             column_markers[i].extend(_column_markers[i])
-        _build_row_refs(ref_data['row'],
-                        footer[ref_type],
-                        markers,
-                        ref_type,
+        _build_row_refs(lookups['row'],
+                        table_footer,
                         marker_data,
                         row_id_column)
-        _build_cell_refs(ref_data['cell'],
-                         footer[ref_type],
-                         markers,
-                         ref_type,
+        _build_cell_refs(lookups['cell'],
+                         table_footer,
                          marker_data)
 
-    column_info = [{'value': name, 'markers': markers}
+    column_info = [ColumnHeader(name, markers)
                    for name, markers
                    in zip(column_names, column_markers)]
 
-    referenced_table = _zip_table(data, marker_data, format)
+    if column_spec:
+        table_latex = {
+            'column_spec': _compute_column_spec(data,
+                                                marker_data,
+                                                column_info)
+        }
+
+    referenced_table = _zip_table(data, marker_data)
     referenced_table = referenced_table[selected_columns]
 
-    if collapse_refs:
+    if collapse_refs and marker_data is not None:
         _collapse_common_refs(referenced_table, column_info)
 
     for ref_type, _ in ref_type_markers.items():
-        footer[ref_type] = [{'marker': _marker, 'text': _ref}
+        footer[ref_type] = [FooterEntry(_marker, _ref)
                             for _marker, _ref
                             in footer[ref_type]]
 
-    footer['date'] = data_dict['date']
+    footer['date'] = references['date']
 
     info_dict = {
         'table': referenced_table,
@@ -141,135 +494,407 @@ def generate_table_data(data_dict,
         'footer': footer,
         'markers': ref_type_markers
     }
+    if column_spec:
+        info_dict['table_latex'] = table_latex
+    if format != 'latex':
+        info_dict['table_{}'.format(format)] = {
+            'table': render_table(info_dict, format),
+            'footer': render_footer(footer, format=format),
+        }
 
     return info_dict
 
 
+def footer_fingerprint(footer):
+    """
+    Returns a hash identifying the references (markers and texts) contained
+        in a footer, so identical footers can be detected without comparing
+        them entry by entry.
+
+    :param dict footer: Footer as returned by generate_table_data
+    :returns: Hexadecimal digest of the footer references
+    :rtype: str
+    """
+    digest = hashlib.sha1()
+    for ref_type in FOOTER_TITLES.keys():
+        digest.update(ref_type.encode('utf-8'))
+        for entry in footer.get(ref_type, []):
+            marker, text = _footer_entry(entry)
+            digest.update(
+                '\x1f{}\x1e{}'.format(marker, text).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def render_footer(footer, escape=None, format='latex'):
+    """
+    Renders the references (sources, notes, methods and years) of a footer
+        as a LaTeX fragment, equivalent to the one produced by the
+        'ic_references.tex' template, or as its HTML or Markdown
+        counterpart. Rendered footers are cached by their fingerprint, so
+        chained tables sharing the same footer are only rendered once. The
+        LaTeX result can be passed to the templates as the
+        'rendered_footer' context key.
+
+    :param dict footer: Footer as returned by generate_table_data
+    :param function escape: Function applied to markers and texts before
+        being rendered. By default, escape_tex in LaTeX, and texts are
+        escaped as HTML (and Markdown) in the other formats.
+    :param str format: Format of the fragment (see TABLE_FORMATS)
+    :returns: Fragment with the footer references
+    :rtype: str
+    """
+    if format not in TABLE_FORMATS:
+        raise ValueError('Format "{}" not valid'.format(format))
+    if escape is None:
+        escape = _ESCAPE_FUNCTIONS[format]
+    key = (footer_fingerprint(footer), escape, format)
+    try:
+        return _FOOTER_CACHE[key]
+    except KeyError:
+        pass
+
+    lines = []
+    for ref_type, title in FOOTER_TITLES.items():
+        entries = footer.get(ref_type)
+        if not entries:
+            continue
+        entries = [_footer_entry(entry) for entry in entries]
+        if format == 'latex':
+            lines.append('\\textbf{{{}}}: \\\\'.format(title))
+            for marker, text in entries:
+                if marker != '':
+                    marker = '$^{{{}}}$'.format(escape(marker))
+                else:
+                    marker = '-'
+                lines.append('{} {} \\\\'.format(marker, escape(text)))
+        elif format == 'html':
+            lines.append('<p><strong>{}</strong>:<br>'.format(title))
+            lines.extend('{}{} {}<br>'.format(_superscript([marker]),
+                                              '' if marker else '-',
+                                              escape(text))
+                         for marker, text in entries)
+            lines.append('</p>')
+        else:
+            lines.append('**{}**:\n'.format(title))
+            lines.extend('- {}{}'.format(_superscript([marker], ' '),
+                                         escape(text))
+                         for marker, text in entries)
+            lines.append('')
+    rendered = '\n'.join(lines).rstrip('\n')
+    _FOOTER_CACHE[key] = rendered
+    return rendered
+
+
+def render_table(table_info, format='html'):
+    """
+    Renders a table returned by generate_table_data (possibly customized
+        afterwards) as HTML or Markdown, with its markers as superscripts.
+        The markup is built column by column from the marker structures,
+        without a template. The footer is rendered separately with
+        render_footer, since chained tables share it.
+
+    :param dict table_info: Dictionary returned by generate_table_data
+        (only its 'table' and 'columns' components are used)
+    :param str format: Format of the markup ('html' or 'markdown')
+    :returns: Table markup
+    :rtype: str
+    """
+    if format not in ['html', 'markdown']:
+        raise ValueError('Format "{}" not valid'.format(format))
+    escape = _ESCAPE_FUNCTIONS[format]
+    table = table_info['table']
+    headers = ['{}{}'.format(escape(_cell_text(column['value'])),
+                             _superscript(column['markers']))
+               for column in table_info['columns']]
+    # Each column is rendered at once, rows are then joined
+    cells = []
+    for col in table.columns:
+        column_cells = table[col].tolist()
+        cells.append([
+            escape(_cell_text(cell['value'])) + _superscript(cell['markers'])
+            for cell in column_cells
+        ])
+    rows = zip(*cells)
+
+    if format == 'html':
+        lines = ['<table>',
+                 '<thead>',
+                 '<tr>{}</tr>'.format(''.join('<th>{}</th>'.format(header)
+                                              for header in headers)),
+                 '</thead>',
+                 '<tbody>']
+        lines.extend('<tr><td>{}</td></tr>'.format('</td><td>'.join(row))
+                     for row in rows)
+        lines.extend(['</tbody>', '</table>'])
+    else:
+        lines = ['| {} |'.format(' | '.join(headers)),
+                 '|{}|'.format('|'.join(' --- ' for _ in headers))]
+        lines.extend('| {} |'.format(' | '.join(row)) for row in rows)
+    return '\n'.join(lines)
+
+
+def _footer_entry(entry):
+    if isinstance(entry, (dict, FooterEntry)):
+        return entry['marker'], entry['text']
+    return entry
+
+
+def escape_tex(text):
+    """
+    Escapes the LaTeX special characters ('&', '%', '$', '#', '_', '{',
+        '}', '~' and '^') of a text, except those already escaped.
+        Backslashes are kept, since markers are LaTeX commands (e.g.
+        '\\dagger'). This is the function used by render_footer, and the
+        one the report compiler should register as the 'escape_tex' filter
+        of the templates, so both render the same references.
+
+    :param text: Text to be escaped (converted to a string)
+    :returns: Escaped text
+    :rtype: str
+    """
+    return _TEX_SPECIAL.sub(_escape_tex_match, str(text))
+
+
+_TEX_SPECIAL = re.compile(r'(?<!\\)([&%$#_{}~^])')
+
+_TEX_ESCAPES = {
+    '~': '\\textasciitilde{}',
+    '^': '\\textasciicircum{}',
+}
+
+
+def _escape_tex_match(match):
+    char = match.group(1)
+    return _TEX_ESCAPES.get(char, '\\' + char)
+
+
+def _escape_html(text):
+    return html.escape(str(text), quote=False)
+
+
+_MARKDOWN_ESCAPES = str.maketrans({
+    '|': '\\|',
+    '*': '\\*',
+    '_': '\\_',
+    '`': '\\`',
+    '\n': ' ',
+})
+
+
+def _escape_markdown(text):
+    return _escape_html(text).translate(_MARKDOWN_ESCAPES)
+
+
+_ESCAPE_FUNCTIONS = {
+    'latex': escape_tex,
+    'html': _escape_html,
+    'markdown': _escape_markdown,
+}
+
+_MARKER_SYMBOLS = {
+    '\\Diamond': '\u25c7', '\\triangle': '\u25b3', '\\nabla': '\u2207',
+    '\\S': '\u00a7', '\\bigstar': '\u2605', '\\aleph': '\u2135',
+    '\\infty': '\u221e', '\\Join': '\u22c8', '\\natural': '\u266e',
+    '\\mho': '\u2127', '\\emptyset': '\u2205', '\\partial': '\u2202',
+    '\\textdollar': '$', '\\triangleright': '\u25b7',
+    '\\triangleleft': '\u25c1', '\\bullet': '\u2022', '\\star': '\u22c6',
+    '\\dagger': '\u2020', '\\ddagger': '\u2021', '\\oplus': '\u2295',
+    '\\ominus': '\u2296', '\\otimes': '\u2297', '\\Box': '\u25a1',
+}
+
+
+def _marker_symbol(marker):
+    # Markers (LaTeX commands for methods and years) as unicode symbols
+    marker = str(marker)
+    try:
+        return _MARKER_SYMBOLS[marker]
+    except KeyError:
+        pass
+    symbol = marker
+    if marker.startswith('\\'):
+        name = marker[1:]
+        try:
+            symbol = unicodedata.lookup('GREEK {} LETTER {}'.format(
+                'CAPITAL' if name[:1].isupper() else 'SMALL', name.upper()))
+        except KeyError:
+            symbol = name
+    _MARKER_SYMBOLS[marker] = symbol
+    return symbol
+
+
+def _superscript(markers, suffix=''):
+    # Markers of a cell, header or footer entry as an HTML superscript
+    # (also valid in Markdown)
+    markers = [marker for marker in markers if marker != '']
+    if not markers:
+        return ''
+    return '<sup>{}</sup>{}'.format(
+        ','.join(html.escape(_marker_symbol(marker)) for marker in markers),
+        suffix)
+
+
+def _cell_text(value):
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return ''
+    return value
+
+
+def _compute_column_spec(data, marker_data, column_info):
+    # Each marker (and its separator) takes roughly the width of a regular
+    # character since they are rendered as superscripts. Null values are
+    # rendered empty
+    widths = np.array([
+        (data[col].astype(str).str.len().where(data[col].notna(), 0) +
+         (0 if marker_data is None else marker_data[col].str.len())).max()
+        for col in data.columns
+    ], dtype=float)
+    widths = np.nan_to_num(widths)
+    header_widths = np.array([len(str(c.value)) + len(c.markers)
+                              for c in column_info], dtype=float)
+    widths = np.maximum(np.maximum(widths, header_widths) * CHAR_WIDTH,
+                        MIN_COLUMN_WIDTH)
+
+    available = TABLE_WIDTH - COLUMN_PADDING * len(widths)
+    if available < MIN_COLUMN_WIDTH * len(widths):
+        # Too many columns for fixed widths, LaTeX sizes them instead
+        return 'l' * len(widths)
+    if widths.sum() > available:
+        # Columns narrower than an equal share keep their width, the rest
+        # of the space is split proportionally among the wider columns
+        fixed = np.zeros(len(widths), dtype=bool)
+        while True:
+            share = ((available - widths[fixed].sum()) /
+                     max(np.count_nonzero(~fixed), 1))
+            newly_fixed = ~fixed & (widths <= share)
+            if not newly_fixed.any():
+                break
+            fixed |= newly_fixed
+        # Wide columns that would be shrunk below the minimum width keep it
+        wide = ~fixed
+        while wide.any():
+            scale = ((available - widths[fixed].sum()) /
+                     widths[wide].sum())
+            narrow = wide & (widths * scale < MIN_COLUMN_WIDTH)
+            if not narrow.any():
+                widths[wide] *= scale
+                break
+            widths[narrow] = MIN_COLUMN_WIDTH
+            fixed |= narrow
+            wide &= ~narrow
+
+    return ''.join('>{{\\raggedright\\arraybackslash}}p{{{:.2f}cm}}'.format(w)
+                   for w in widths)
+
+
 def _collapse_common_refs(table, columns):
     for i, col in enumerate(table.columns):
-        markers = [cell['markers'] for cell in table[col]]
-        col_markers = set([ref
-                           for cell_markers in markers
-                           for ref in cell_markers])
+        cells = table[col].tolist()
+        markers = [cell.markers for cell in cells]
+        # In order of appearance, so collapsed markers do not depend on the
+        # string hashing of the process
+        col_markers = dict.fromkeys(ref
+                                    for cell_markers in markers
+                                    for ref in cell_markers)
         for marker in col_markers:
-            if (np.all([marker in cell['markers'] for cell in table[col]])):
+            if all(marker in cell_markers for cell_markers in markers):
                 # Include marker in column
-                columns[i]['markers'] += marker
+                columns[i].markers.append(marker)
                 # Remove markers from cells
-                for cell in table[col]:
-                    cell['markers'].remove(marker)
+                for cell_markers in markers:
+                    cell_markers.remove(marker)
 
 
-def _zip_table(data, marker_data, format):
+def _zip_table(data, marker_data):
     for col in data.columns:
-        data[col] = [{'value': value, 'markers': markers}
-                     for value, markers
-                     in list(zip(data[col], marker_data[col]))]
+        if marker_data is None:
+            data[col] = [TableCell(value, [])
+                         for value in data[col].tolist()]
+        else:
+            data[col] = [TableCell(value, markers)
+                         for value, markers
+                         in zip(data[col].tolist(), marker_data[col])]
     return data
 
 
-def _build_global_refs(ref_data, table_footer, markers, ref_type):
-    for ref in [ref.text for ref in ref_data.itertuples()]:
-        marker = None
+class _FooterIndex:
+    """
+    Footer entries of a reference type with their markers indexed by
+    reference text, assigning new markers to the references not found
+    (from the given registered markers by text, if any).
+    """
+
+    def __init__(self, entries, markers, ref_type, registered=None):
+        self.entries = entries
+        self.markers = markers
+        self.ref_type = ref_type
+        self.registered = registered
+        self.index = {}
+        for marker, text in entries:
+            self.index.setdefault(text, marker)
+
+    def marker(self, text, global_ref=False):
         try:
-            marker = [_marker
-                      for _marker, _ref
-                      in table_footer
-                      if _ref == ref][0]
-        except IndexError:
+            return self.index[text]
+        except KeyError:
             pass
-        if marker is None:
-            table_footer.append(('', ref))
+        if global_ref:
+            marker = ''
+        elif self.registered is not None:
+            marker = self.registered[text]
+        else:
+            try:
+                marker = next(self.markers)
+            except StopIteration:
+                raise EnvironmentError(
+                    "No more '{}' markers are available.".format(
+                        self.ref_type))
+        self.entries.append((marker, text))
+        self.index[text] = marker
+        return marker
 
 
-def _build_column_refs(ref_data,
-                       table_footer,
-                       markers,
-                       ref_type,
-                       marker_data,
-                       selected_columns,
-                       column_names):
+def _build_global_refs(texts, table_footer):
+    for ref in texts:
+        table_footer.marker(ref, global_ref=True)
+
+
+def _build_column_refs(refs_by_column, table_footer, selected_columns):
     column_markers = []
     for column in selected_columns:
-        refs = [ref.text
-                for ref in ref_data.itertuples()
-                if ref.column == column]
         col_markers = []
-        for ref in refs:
-            marker = None
-            try:
-                marker = [_marker
-                          for _marker, _ref
-                          in table_footer
-                          if _ref == ref][0]
-            except IndexError:
-                pass
-            if marker is None:
-                try:
-                    marker = next(markers)
-                except StopIteration:
-                    raise EnvironmentError(
-                        "No more '{}' markers are available.".format(ref_type))
-                table_footer.append((marker, ref))
+        for ref in refs_by_column.get(column, []):
+            marker = table_footer.marker(ref)
             if marker not in col_markers:
                 col_markers.append(marker)
         column_markers.append(col_markers)
     return column_markers
 
 
-def _build_row_refs(ref_data,
-                    table_footer,
-                    markers,
-                    ref_type,
-                    marker_data,
-                    row_id_column):
-    for row_index in marker_data.index:
-        refs = [ref.text
-                for ref in ref_data.itertuples()
-                if ref.row == row_index]
-        row_markers = marker_data.loc[row_index, row_id_column]
+def _build_row_refs(refs_by_row, table_footer, marker_data, row_id_column):
+    if not refs_by_row:
+        return
+    row_markers = marker_data[row_id_column].values
+    for position, row_index in enumerate(marker_data.index):
+        refs = refs_by_row.get(row_index)
+        if not refs:
+            continue
         for ref in refs:
-            marker = None
-            try:
-                marker = [_marker
-                          for _marker, _ref
-                          in table_footer
-                          if _ref == ref][0]
-            except IndexError:
-                pass
-            if marker is None:
-                try:
-                    marker = next(markers)
-                except StopIteration:
-                    raise EnvironmentError(
-                        "No more '{}' markers are available.".format(ref_type))
-                table_footer.append((marker, ref))
-            if marker not in row_markers:
-                row_markers.append(marker)
-
-
-def _build_cell_refs(ref_data, table_footer, markers, ref_type, marker_data):
-    for row_index in marker_data.index:
-        for column in marker_data.columns:
-            refs = [ref.text
-                    for ref in ref_data.itertuples()
-                    if ref.row == row_index and ref.column == column]
-            for ref in refs:
-                marker = None
-                try:
-                    marker = [_marker
-                              for _marker, _ref
-                              in table_footer
-                              if _ref == ref][0]
-                except IndexError:
-                    pass
-                if marker is None:
-                    try:
-                        marker = next(markers)
-                    except StopIteration:
-                        raise EnvironmentError(
-                            "No more '{}' markers are available.".format(
-                                ref_type))
-                    table_footer.append((marker, ref))
-                if marker not in marker_data.loc[row_index, column]:
-                    marker_data.loc[row_index, column].append(marker)
+            marker = table_footer.marker(ref)
+            if marker not in row_markers[position]:
+                row_markers[position].append(marker)
+
+
+def _build_cell_refs(refs_by_cell, table_footer, marker_data):
+    if not refs_by_cell:
+        return
+    columns = list(marker_data.columns)
+    cell_markers = [marker_data[column].values for column in columns]
+    for position, row_index in enumerate(marker_data.index):
+        refs_by_column = refs_by_cell.get(row_index)
+        if not refs_by_column:
+            continue
+        for column, markers in zip(columns, cell_markers):
+            for ref in refs_by_column.get(column, []):
+                marker = table_footer.marker(ref)
+                if marker not in markers[position]:
+                    markers[position].append(marker)
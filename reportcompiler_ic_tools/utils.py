@@ -2,9 +2,40 @@
 This module contains utility functions to be used with the rest of this
 libraries' functionality.
 """
+import hashlib
+from types import MappingProxyType
+import numpy as np
 import pandas as pd
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
 
-__all__ = ['wrap_empty_references']
+__all__ = ['wrap_empty_references', 'fingerprint', 'EMPTY_REFERENCES']
+
+
+class _EmptyReferences(dict):
+    # Read-only dictionary, pickled by reference so data dictionaries sent
+    # to other processes keep sharing it
+
+    def __reduce__(self):
+        return 'EMPTY_REFERENCES'
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError('EMPTY_REFERENCES is read-only')
+
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+
+EMPTY_REFERENCES = _EmptyReferences({
+    'global': pd.DataFrame(columns=['text']),
+    'row': pd.DataFrame(columns=['row', 'text']),
+    'column': pd.DataFrame(columns=['column', 'text']),
+    'cell': pd.DataFrame(columns=['row', 'column', 'text']),
+})
+''' Read-only references (of one type) without entries, shared by all the
+data dictionaries returned by wrap_empty_references. '''
 
 
 def wrap_empty_references(data):
@@ -15,12 +46,78 @@ def wrap_empty_references(data):
     when a dataframe needs to be built manually and then used as input
     for the tables.generate_table_data method, which expects this kind
     of structure.
+
+    All reference types share the same read-only EMPTY_REFERENCES, which
+    generate_table_data detects to skip the reference processing. To add
+    references of a type, replace its whole dictionary.
     """
     return {
         'data': data,
-        'sources': {},
-        'notes': {},
-        'methods': {},
-        'years': {},
+        'sources': EMPTY_REFERENCES,
+        'notes': EMPTY_REFERENCES,
+        'methods': EMPTY_REFERENCES,
+        'years': EMPTY_REFERENCES,
         'date': {},
     }
+
+
+def fingerprint(*objects):
+    """
+    Returns a hash identifying the content of the given objects, stable
+    across processes and runs. It supports dataframes, series, numpy arrays,
+    dictionaries, lists, tuples, scalars and pyarrow tables (nested as
+    needed). This is
+    useful to detect whether the inputs of a generated asset (e.g. a map)
+    have changed.
+
+    :returns: Hexadecimal digest of the objects
+    :rtype: str
+    """
+    digest = hashlib.sha1()
+    for obj in objects:
+        _update_fingerprint(digest, obj)
+    return digest.hexdigest()
+
+
+def _is_arrow_table(obj):
+    return pyarrow is not None and isinstance(obj, pyarrow.Table)
+
+
+def _column_values(frame, column):
+    # Values of a column of a dataframe or a pyarrow table as a list
+    if _is_arrow_table(frame):
+        return frame.column(column).to_pylist()
+    return frame[column].tolist()
+
+
+def _update_fingerprint(digest, obj):
+    if _is_arrow_table(obj):
+        digest.update(b'Table')
+        _update_fingerprint(digest, obj.to_pandas())
+    elif isinstance(obj, pd.DataFrame):
+        digest.update(b'DataFrame')
+        _update_fingerprint(digest, [str(c) for c in obj.columns])
+        _update_fingerprint(digest, [str(t) for t in obj.dtypes])
+        digest.update(
+            pd.util.hash_pandas_object(obj, index=True).values.tobytes())
+    elif isinstance(obj, pd.Series):
+        digest.update(b'Series')
+        _update_fingerprint(digest, [str(obj.name), str(obj.dtype)])
+        digest.update(
+            pd.util.hash_pandas_object(obj, index=True).values.tobytes())
+    elif isinstance(obj, np.ndarray):
+        _update_fingerprint(digest, pd.Series(obj.ravel()))
+        _update_fingerprint(digest, list(obj.shape))
+    elif isinstance(obj, (dict, MappingProxyType)):
+        digest.update(b'dict')
+        for key in sorted(obj, key=str):
+            _update_fingerprint(digest, key)
+            _update_fingerprint(digest, obj[key])
+    elif isinstance(obj, (list, tuple)):
+        digest.update('{}:{}'.format(type(obj).__name__,
+                                     len(obj)).encode('utf-8'))
+        for item in obj:
+            _update_fingerprint(digest, item)
+    else:
+        digest.update('{}:{!r};'.format(type(obj).__name__,
+                                        obj).encode('utf-8'))
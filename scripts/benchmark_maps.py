@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Benchmarks of the map generation functionality. Run from the repository
+root, e.g.:
+
+    python scripts/benchmark_maps.py paths --repeat 5
+"""
+import argparse
+import os
+import sys
+import time
+import warnings
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import numpy as np
+import pandas as pd
+from reportcompiler_ic_tools import maps
+
+
+def _timeit(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return np.median(times)
+
+
+def _world_data():
+    countries = maps._load_countries()
+    iso_codes = countries['iso'].astype(str).unique()
+    return pd.DataFrame({
+        'iso': iso_codes,
+        'value': np.random.RandomState(0).uniform(0, 100, len(iso_codes)),
+    })
+
+
+def benchmark_paths(repeat):
+    """ Shapely to matplotlib path conversion on the XWX world map """
+    from plotnine.geoms.geom_map import PolygonPatch
+
+    projection = 'robinson'
+    tolerance = maps.DEFAULT_TOLERANCES[projection]['XWX']
+    countries = maps._prepared_countries(projection, tolerance, False)
+    geometries = [g for g in countries['geometry'] if g is not None]
+
+    def convert():
+        [PolygonPatch(g) for g in geometries]
+
+    def cached():
+        paths = maps._country_paths(projection, tolerance, False)
+        [paths[iso] for iso in countries['iso']]
+
+    print('Path conversion per map (uncached): {:.4f}s'.format(
+        _timeit(convert, repeat)))
+    print('Path lookup per map (cached):       {:.4f}s'.format(
+        _timeit(cached, repeat)))
+
+    data = _world_data()
+
+    def draw():
+        plot = maps.generate_map(data, 'XWX', 'value')['plot']
+        plot.draw()
+
+    draw()  # Warm up the per-process caches
+    print('XWX map draw (cached paths):        {:.4f}s'.format(
+        _timeit(draw, repeat)))
+
+
+def benchmark_projection(repeat):
+    """ Reprojection of the countries layer with the cached transformers """
+    geometries = maps._load_countries()['geometry']
+
+    for projection in ['robinson', 'equal_earth', 'mollweide']:
+        def to_crs():
+            geometries.to_crs(maps.PROJECTION_DICT[projection])
+
+        def bulk():
+            maps.reproject_geometries(geometries.values, projection)
+
+        print('{:<12} GeoSeries.to_crs:            {:.4f}s'.format(
+            projection, _timeit(to_crs, repeat)))
+        print('{:<12} reproject_geometries:        {:.4f}s'.format(
+            projection, _timeit(bulk, repeat)))
+
+
+def benchmark_vector(repeat):
+    """ PDF size and save time with quantized coordinates """
+    import io
+
+    data = _world_data()
+    for region in ['XWX', 'XEX', 'XSX']:
+        for resolution in [None, 300, 150]:
+            figure = maps.generate_map(data, region, 'value',
+                                       engine='matplotlib',
+                                       vector_resolution=resolution)['plot']
+            output = io.BytesIO()
+
+            def save():
+                output.seek(0)
+                output.truncate()
+                figure.savefig(output, format='pdf')
+
+            save_time = _timeit(save, repeat)
+            print('{} {:<28} {:>7} bytes  {:.4f}s'.format(
+                region,
+                'full precision:' if resolution is None else
+                'quantized ({} dpi):'.format(resolution),
+                len(output.getvalue()),
+                save_time))
+
+
+BENCHMARKS = {
+    'paths': benchmark_paths,
+    'projection': benchmark_projection,
+    'vector': benchmark_vector,
+}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('benchmarks', nargs='*',
+                        help='Benchmarks to run (all by default): {}'.format(
+                            ', '.join(sorted(BENCHMARKS))))
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Number of repetitions of each measure')
+    args = parser.parse_args()
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error('Unknown benchmarks: {}'.format(
+            ', '.join(sorted(unknown))))
+    warnings.simplefilter('ignore')
+    for name in args.benchmarks or sorted(BENCHMARKS):
+        print('== {} =='.format(name))
+        BENCHMARKS[name](args.repeat)
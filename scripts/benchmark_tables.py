@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Benchmarks of the table generation functionality. Run from the repository
+root, e.g.:
+
+    python scripts/benchmark_tables.py formats --rows 20000 --repeat 3
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import numpy as np
+import pandas as pd
+from reportcompiler_ic_tools import tables
+from reportcompiler_ic_tools.utils import wrap_empty_references
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(tables.__file__), 'templates')
+
+
+def _timeit(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return np.median(times)
+
+
+def _table_dict(rows, columns=6):
+    random = np.random.RandomState(0)
+    data = pd.DataFrame({
+        'column_{}'.format(i): ['{:.2f}'.format(v)
+                                for v in random.uniform(0, 100, rows)]
+        for i in range(columns)
+    })
+    data_dict = wrap_empty_references(data)
+    cells = random.choice(rows * columns, rows // 4, replace=False)
+    for ref_type, texts in [('sources', 40), ('notes', 40)]:
+        data_dict[ref_type] = {
+            'global': pd.DataFrame({'text': ['Global reference']}),
+            'column': pd.DataFrame(columns=['column', 'text']),
+            'row': pd.DataFrame({
+                'row': random.choice(rows, rows // 10),
+                'text': ['{} {}'.format(ref_type, i)
+                         for i in random.randint(0, texts, rows // 10)],
+            }),
+            'cell': pd.DataFrame({
+                'row': cells // columns,
+                'column': ['column_{}'.format(c) for c in cells % columns],
+                'text': ['{} {}'.format(ref_type, i)
+                         for i in random.randint(0, texts, len(cells))],
+            }),
+        }
+    data_dict['date'] = {'date_closing': '2019-06-30',
+                         'date_publication': '2019-09-01'}
+    return data_dict
+
+
+def _latex_template():
+    from jinja2 import Environment, FileSystemLoader
+
+    # Same delimiters as the report compiler LaTeX templates
+    environment = Environment(block_start_string='\\BLOCK{',
+                              block_end_string='}',
+                              variable_start_string='\\VAR{',
+                              variable_end_string='}',
+                              comment_start_string='\\#{',
+                              comment_end_string='}',
+                              trim_blocks=True,
+                              autoescape=False,
+                              loader=FileSystemLoader(TEMPLATE_DIR))
+    environment.filters['escape_tex'] = tables.escape_tex
+    environment.filters['format_date'] = lambda date, date_format: date
+    return environment.get_template('hpv-infocentre/ic_table.tex')
+
+
+def benchmark_formats(repeat, rows):
+    """ LaTeX template rendering against the HTML and Markdown renderers """
+    data_dict = _table_dict(rows)
+    template = _latex_template()
+    table_info = tables.generate_table_data(data_dict)
+
+    print('Table data ({} rows):                    {:.4f}s'.format(
+        rows, _timeit(lambda: tables.generate_table_data(data_dict),
+                      repeat)))
+
+    def latex():
+        template.render(ctx={'data': table_info['table'],
+                             'columns': table_info['columns'],
+                             'footer': table_info['footer'],
+                             'caption': 'Benchmark'})
+
+    print('LaTeX (ic_table.tex template):           {:.4f}s'.format(
+        _timeit(latex, repeat)))
+    for format in ['html', 'markdown']:
+        def render():
+            tables._FOOTER_CACHE.clear()
+            tables.render_table(table_info, format)
+            tables.render_footer(table_info['footer'], format=format)
+
+        print('{:<40} {:.4f}s'.format(
+            '{} (render_table/render_footer):'.format(format.upper()),
+            _timeit(render, repeat)))
+
+
+BENCHMARKS = {
+    'formats': benchmark_formats,
+}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('benchmarks', nargs='*',
+                        help='Benchmarks to run (all by default): {}'.format(
+                            ', '.join(sorted(BENCHMARKS))))
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Number of repetitions of each measure')
+    parser.add_argument('--rows', type=int, default=20000,
+                        help='Number of rows of the benchmark tables')
+    args = parser.parse_args()
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error('Unknown benchmarks: {}'.format(
+            ', '.join(sorted(unknown))))
+    for name in args.benchmarks or sorted(BENCHMARKS):
+        print('== {} =='.format(name))
+        BENCHMARKS[name](args.repeat, args.rows)
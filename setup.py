@@ -75,4 +75,7 @@ setup(
         'autoapi',
         'sphinxcontrib-websupport'
     ],
+    extras_require={
+        'arrow': ['pyarrow'],
+    },
 )
@@ -0,0 +1,105 @@
+import unittest
+import pandas as pd
+from reportcompiler_ic_tools.maps import generate_map
+from reportcompiler_ic_tools.tables import generate_table_data
+from reportcompiler_ic_tools.utils import wrap_empty_references, fingerprint
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+
+@unittest.skipIf(pa is None, 'pyarrow is not installed')
+class ArrowInputTest(unittest.TestCase):
+    """ """
+
+    def setUp(self):
+        self.data_dict = wrap_empty_references(pd.DataFrame(
+            {
+                'iso': ['ESP', 'FRA', 'ITA'],
+                'indicator': ['Prevalence'] * 3,
+                'value': [10.5, None, 3.0],
+            }))
+        self.data_dict['sources'] = {
+            'global': pd.DataFrame({'text': ['Global survey']}),
+            'row': pd.DataFrame({'row': [1], 'text': ['French survey']}),
+            'column': pd.DataFrame({'column': ['value'],
+                                    'text': ['Estimates']}),
+            'cell': pd.DataFrame({'row': [2], 'column': ['value'],
+                                  'text': ['Italian registry']}),
+        }
+        self.arrow_dict = dict(self.data_dict)
+        self.arrow_dict['data'] = pa.Table.from_pandas(
+            self.data_dict['data'], preserve_index=False)
+        self.arrow_dict['sources'] = {
+            scope: pa.Table.from_pandas(frame, preserve_index=False)
+            for scope, frame in self.data_dict['sources'].items()
+        }
+
+    def test_table(self):
+        params = {
+            'selected_columns': ['iso', 'value'],
+            'column_names': ['Country', 'Value'],
+        }
+        expected = generate_table_data(self.data_dict, **params)
+        table_info = generate_table_data(self.arrow_dict, **params)
+        values = table_info['table'].map(lambda cell: cell['markers'])
+        self.assertEqual(
+            values.values.tolist(),
+            expected['table'].map(lambda cell: cell['markers'])
+                             .values.tolist())
+        self.assertEqual(table_info['table'].loc[0, 'value']['value'], 10.5)
+        self.assertEqual(table_info['columns'], expected['columns'])
+        self.assertEqual(table_info['footer'], expected['footer'])
+
+    def test_map(self):
+        data = self.data_dict['data']
+        expected = generate_map(data, 'XEX', 'value', engine='matplotlib',
+                                lazy=True)['plan']
+        plan = generate_map(self.arrow_dict['data'], 'XEX', 'value',
+                            engine='matplotlib', lazy=True)['plan']
+        self.assertTrue(expected.plot_data['value'].equals(
+            plan.plot_data['value']))
+        self.assertEqual(list(plan.layers), list(expected.layers))
+        with self.assertRaises(ValueError):
+            generate_map(pa.table({'iso': ['ESP', 'ESP'], 'value': [1, 2]}),
+                         'XEX', 'value', engine='matplotlib')
+
+    def test_map_iso_types(self):
+        expected = generate_map(self.data_dict['data'], 'XEX', 'value',
+                                engine='matplotlib', lazy=True)['plan']
+        data = self.arrow_dict['data']
+        iso_index = data.schema.get_field_index('iso')
+        for iso_codes in [data.column('iso').dictionary_encode(),
+                          data.column('iso').cast(pa.large_string())]:
+            plan = generate_map(data.set_column(iso_index, 'iso', iso_codes),
+                                'XEX', 'value', engine='matplotlib',
+                                lazy=True)['plan']
+            self.assertTrue(expected.plot_data['value'].equals(
+                plan.plot_data['value']))
+        with self.assertRaises(ValueError):
+            generate_map(pa.table({'iso': pa.array(['ESP', 'ESP'])
+                                   .dictionary_encode(), 'value': [1, 2]}),
+                         'XEX', 'value', engine='matplotlib')
+
+    def test_map_null_iso(self):
+        expected = generate_map(self.data_dict['data'], 'XEX', 'value',
+                                engine='matplotlib', lazy=True)['plan']
+        table = self.arrow_dict['data']
+        data = pa.concat_tables([
+            table,
+            pa.table({'iso': [None, None],
+                      'indicator': ['Prevalence'] * 2,
+                      'value': [1., 2.]}).cast(table.schema),
+        ])
+        plan = generate_map(data, 'XEX', 'value', engine='matplotlib',
+                            lazy=True)['plan']
+        self.assertTrue(expected.plot_data['value'].equals(
+            plan.plot_data['value']))
+
+    def test_fingerprint(self):
+        table = self.arrow_dict['data']
+        self.assertEqual(fingerprint(table),
+                         fingerprint(pa.Table.from_pandas(
+                             self.data_dict['data'], preserve_index=False)))
+        self.assertNotEqual(fingerprint(table), fingerprint(table.slice(1)))
@@ -0,0 +1,92 @@
+import os
+import tempfile
+import unittest
+import pandas as pd
+from reportcompiler_ic_tools.builds import IncrementalBuild
+from reportcompiler_ic_tools.tables import generate_table_data
+from reportcompiler_ic_tools.utils import wrap_empty_references
+
+
+class IncrementalBuildTest(unittest.TestCase):
+    """ """
+
+    def setUp(self):
+        self.build_dir = tempfile.TemporaryDirectory()
+        self.data_dict = wrap_empty_references(pd.DataFrame(
+            {
+                'country': ['Spain', 'France'],
+                'prevalence': ['10', '20']
+            },
+            index=[0, 1]))
+        for ref_type in ['sources', 'notes', 'methods', 'years']:
+            self.data_dict[ref_type] = {
+                'global': pd.DataFrame(columns=['text']),
+                'row': pd.DataFrame(columns=['row', 'text']),
+                'column': pd.DataFrame(columns=['column', 'text']),
+                'cell': pd.DataFrame(columns=['row', 'column', 'text']),
+            }
+        self.data_dict['sources']['row'] = pd.DataFrame([
+            {'row': 1, 'text': 'Source for France'},
+        ])
+
+    def tearDown(self):
+        self.build_dir.cleanup()
+
+    def test_reuse_unchanged_assets(self):
+        calls = []
+
+        def asset(value):
+            calls.append(value)
+            return value * 2
+
+        with IncrementalBuild(self.build_dir.name) as build:
+            self.assertEqual(build.asset('a', asset, 1), 2)
+            self.assertEqual(build.asset('b', asset, 2), 4)
+        with IncrementalBuild(self.build_dir.name) as build:
+            self.assertEqual(build.asset('a', asset, 1), 2)
+            self.assertEqual(build.asset('b', asset, 3), 6)
+        self.assertEqual(calls, [1, 2, 3])
+        self.assertEqual(build.reused, ['a'])
+        self.assertEqual(build.built, ['b'])
+
+        # Assets not requested in a build are only removed when pruning
+        with IncrementalBuild(self.build_dir.name) as build:
+            build.asset('a', asset, 1)
+        self.assertEqual(len(os.listdir(
+            os.path.join(self.build_dir.name, 'assets'))), 2)
+        with IncrementalBuild(self.build_dir.name) as build:
+            build.asset('a', asset, 1)
+            build.save(prune=True)
+        self.assertEqual(len(os.listdir(
+            os.path.join(self.build_dir.name, 'assets'))), 1)
+
+    def test_concurrent_builds(self):
+        first = IncrementalBuild(self.build_dir.name)
+        second = IncrementalBuild(self.build_dir.name)
+        first.asset('a', abs, -1)
+        second.asset('b', abs, -2)
+        first.save()
+        second.save()
+        # Both builds keep their entries in the shared manifest
+        with IncrementalBuild(self.build_dir.name) as build:
+            self.assertEqual(build.asset('a', abs, -1), 1)
+            self.assertEqual(build.asset('b', abs, -2), 2)
+        self.assertEqual(build.reused, ['a', 'b'])
+        # No temporary files are left
+        self.assertEqual(sorted(os.listdir(self.build_dir.name)),
+                         ['assets', 'manifest.json', 'manifest.json.lock'])
+
+    def test_chained_tables(self):
+        expected = generate_table_data(self.data_dict)
+        expected = generate_table_data(self.data_dict,
+                                       footer=expected['footer'],
+                                       markers=expected['markers'])
+        for _ in range(2):
+            with IncrementalBuild(self.build_dir.name) as build:
+                first = build.table('first', self.data_dict)
+                second = build.table('second', self.data_dict,
+                                     footer=first['footer'])
+            self.assertEqual(second['footer']['sources'],
+                             expected['footer']['sources'])
+            self.assertEqual(next(second['markers']['sources']), '2')
+        self.assertEqual(build.reused, ['first', 'second'])
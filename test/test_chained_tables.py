@@ -0,0 +1,112 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import pandas as pd
+from reportcompiler_ic_tools.references import ReferenceSet
+from reportcompiler_ic_tools.tables import generate_table_data, \
+    generate_chained_tables
+from reportcompiler_ic_tools.utils import wrap_empty_references
+
+
+class ChainedTablesTest(unittest.TestCase):
+    """ """
+
+    def setUp(self):
+        self.tables = []
+        for i, iso in enumerate(['ESP', 'FRA', 'ITA']):
+            data_dict = wrap_empty_references(pd.DataFrame(
+                {
+                    'indicator': ['Prevalence', 'Incidence'],
+                    'value': [str(i), str(i * 2)],
+                }))
+            data_dict['sources'] = {
+                'global': pd.DataFrame({'text': ['Global survey']}),
+                'row': pd.DataFrame([
+                    {'row': 0, 'text': '{} survey'.format(iso)},
+                    {'row': 1, 'text': 'Shared registry'},
+                ]),
+                'column': pd.DataFrame(columns=['column', 'text']),
+                'cell': pd.DataFrame(columns=['row', 'column', 'text']),
+            }
+            data_dict['notes'] = {
+                'global': pd.DataFrame(columns=['text']),
+                'row': pd.DataFrame(columns=['row', 'text']),
+                'column': pd.DataFrame([
+                    {'column': 'value', 'text': 'Estimated'},
+                ]),
+                'cell': pd.DataFrame([
+                    {'row': 1, 'column': 'value',
+                     'text': '{} adjusted'.format(iso)},
+                ]),
+            }
+            self.tables.append({'data_dict': data_dict,
+                                'row_id_column': 'indicator',
+                                'collapse_refs': i != 1})
+
+    def _serial_tables(self):
+        footer = None
+        markers = None
+        results = []
+        for table_args in self.tables:
+            table_args = dict(table_args)
+            table_info = generate_table_data(table_args.pop('data_dict'),
+                                             footer=footer,
+                                             markers=markers,
+                                             **table_args)
+            footer = table_info['footer']
+            markers = table_info['markers']
+            results.append(table_info)
+        return results
+
+    def _assert_same_tables(self, results):
+        expected = self._serial_tables()
+        self.assertEqual(len(expected), len(results))
+        for expected_info, table_info in zip(expected, results):
+            self.assertTrue(expected_info['table'].equals(table_info['table']))
+            self.assertEqual(expected_info['columns'], table_info['columns'])
+            self.assertEqual(expected_info['footer'], table_info['footer'])
+        self.assertIs(results[0]['footer'], results[-1]['footer'])
+        self.assertEqual(next(results[-1]['markers']['sources']),
+                         next(expected[-1]['markers']['sources']))
+
+    def test_current_thread(self):
+        results = generate_chained_tables(self.tables)
+        self._assert_same_tables(results)
+        self.assertEqual([entry['marker'] for entry
+                          in results[0]['footer']['sources']],
+                         ['', '1', '2', '3', '4'])
+
+    def test_executors(self):
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            tables = [dict(table_args,
+                           data_dict=ReferenceSet(table_args['data_dict']))
+                      for table_args in self.tables]
+            results = generate_chained_tables(tables, executor=executor)
+        self._assert_same_tables(results)
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            results = generate_chained_tables(self.tables, executor=executor)
+        self._assert_same_tables(results)
+
+    def test_formats(self):
+        for format in ['html', 'markdown']:
+            key = 'table_{}'.format(format)
+            self.tables = [dict(table_args, format=format)
+                           for table_args in self.tables]
+            expected = self._serial_tables()
+            results = generate_chained_tables(self.tables)
+            for expected_info, table_info in zip(expected, results):
+                self.assertEqual(expected_info[key], table_info[key])
+            self.assertNotEqual(results[0][key]['footer'],
+                                results[-1][key]['footer'])
+            self.assertIn('ITA survey', results[-1][key]['footer'])
+
+    def test_chained_footer(self):
+        first = generate_table_data(self.tables[0]['data_dict'],
+                                    row_id_column='indicator')
+        results = generate_chained_tables(self.tables[1:],
+                                          footer=first['footer'],
+                                          markers=first['markers'])
+        self.assertIs(results[0]['footer'], first['footer'])
+        self.assertEqual(results[0]['table'].loc[1, 'indicator']['markers'],
+                         ['2'])
+        with self.assertRaises(ValueError):
+            generate_chained_tables([dict(self.tables[0], footer=None)])
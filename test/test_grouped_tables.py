@@ -0,0 +1,70 @@
+import unittest
+import pandas as pd
+from reportcompiler_ic_tools.tables import generate_table_data, \
+    generate_grouped_tables
+from reportcompiler_ic_tools.utils import wrap_empty_references
+
+
+class GroupedTablesTest(unittest.TestCase):
+    """ """
+
+    def setUp(self):
+        self.data_dict = wrap_empty_references(pd.DataFrame(
+            {
+                'iso': ['ESP', 'ESP', 'FRA', 'FRA'],
+                'indicator': ['Prevalence', 'Incidence'] * 2,
+                'value': ['10', '2', '20', '3'],
+            }))
+        for ref_type in ['sources', 'notes', 'methods', 'years']:
+            self.data_dict[ref_type] = {
+                'global': pd.DataFrame(columns=['text']),
+                'row': pd.DataFrame(columns=['row', 'text']),
+                'column': pd.DataFrame(columns=['column', 'text']),
+                'cell': pd.DataFrame(columns=['row', 'column', 'text']),
+            }
+        self.data_dict['sources']['row'] = pd.DataFrame([
+            {'row': 0, 'text': 'Spanish survey'},
+            {'row': 2, 'text': 'French survey'},
+            {'row': 3, 'text': 'French registry'},
+        ])
+        self.data_dict['notes']['cell'] = pd.DataFrame([
+            {'row': 3, 'column': 'value', 'text': 'Estimated'},
+        ])
+        self.params = {
+            'selected_columns': ['indicator', 'value'],
+            'column_names': ['Indicator', 'Value'],
+            'row_id_column': 'indicator',
+        }
+
+    def test_per_group_markers(self):
+        tables = generate_grouped_tables(self.data_dict, 'iso', **self.params)
+        self.assertEqual(list(tables), ['ESP', 'FRA'])
+        data = self.data_dict['data']
+        for iso, table_info in tables.items():
+            group_dict = dict(self.data_dict, data=data[data['iso'] == iso])
+            expected = generate_table_data(group_dict, **self.params)
+            self.assertTrue(expected['table'].equals(table_info['table']))
+            self.assertEqual(expected['footer'], table_info['footer'])
+        self.assertEqual(tables['FRA']['footer']['sources'],
+                         [{'marker': '1', 'text': 'French survey'},
+                          {'marker': '2', 'text': 'French registry'}])
+
+    def test_shared_markers(self):
+        tables = generate_grouped_tables(self.data_dict, 'iso',
+                                         shared_markers=True,
+                                         **self.params)
+        self.assertEqual(
+            tables['FRA']['table'].loc[2, 'indicator']['markers'], ['2'])
+        self.assertIs(tables['ESP']['footer'], tables['FRA']['footer'])
+        self.assertEqual([entry['marker'] for entry
+                          in tables['FRA']['footer']['sources']],
+                         ['1', '2', '3'])
+        self.assertEqual(tables['FRA']['footer']['notes'],
+                         [{'marker': 'a', 'text': 'Estimated'}])
+
+    def test_null_group(self):
+        data = self.data_dict['data'].copy()
+        data.loc[3, 'iso'] = None
+        with self.assertRaises(ValueError):
+            generate_grouped_tables(dict(self.data_dict, data=data), 'iso',
+                                    **self.params)
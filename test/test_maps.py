@@ -0,0 +1,272 @@
+import io
+import os
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+import shapely
+from reportcompiler_ic_tools import maps
+from reportcompiler_ic_tools.cache import FileCache
+from reportcompiler_ic_tools.maps import generate_map, cached_map_image, \
+    generate_facet_map, define_region, MapPlan
+
+
+class MapsTest(unittest.TestCase):
+    """ """
+
+    def setUp(self):
+        self.data = pd.DataFrame(
+            {
+                'iso': ['ESP', 'FRA', 'NLD'],
+                'prevalence': [10., 20., 30.],
+            })
+
+    def test_values_attached_by_iso(self):
+        plot = generate_map(self.data, 'XEX', 'prevalence')['plot']
+        values = plot.layers[0].geom.data
+        self.assertEqual(sorted(values['iso'].astype(str).unique()),
+                         ['ESP', 'FRA', 'NLD'])
+        self.assertEqual(
+            values.loc[values['iso'] == 'FRA', 'prevalence'].tolist(),
+            [20.])
+        self.assertEqual(len(values[values['iso'] == 'NLD']), 2)
+
+    def test_duplicated_iso(self):
+        data = pd.concat([self.data, self.data.iloc[[0]]])
+        with self.assertRaises(ValueError):
+            generate_map(data, 'XEX', 'prevalence')
+
+    def test_null_iso(self):
+        data = pd.concat([self.data,
+                          pd.DataFrame({'iso': [None, np.nan],
+                                        'prevalence': [1., 2.]})],
+                         ignore_index=True)
+        expected = generate_map(self.data, 'XEX', 'prevalence',
+                                lazy=True)['plan']
+        plan = generate_map(data, 'XEX', 'prevalence', lazy=True)['plan']
+        self.assertTrue(expected.plot_data['prevalence'].equals(
+            plan.plot_data['prevalence']))
+
+    def test_region_layers(self):
+        plot = generate_map(self.data, 'XEX', 'prevalence')['plot']
+        missing = plot.layers[1].geom.data
+        out_region = plot.layers[2].geom.data
+        self.assertTrue((missing['continent'] == 'XEX').all())
+        self.assertNotIn('ESP', missing['iso'].tolist())
+        self.assertFalse((out_region['continent'] == 'XEX').any())
+
+        # Empty layers are not drawn
+        plot = generate_map(self.data, 'XWX', 'prevalence')['plot']
+        self.assertEqual(len(plot.layers), 3)
+        self.assertTrue(all(len(layer.geom.data) > 0
+                            for layer in plot.layers))
+
+    def test_lazy_plan(self):
+        map_info = generate_map(self.data, 'XWX', 'prevalence', lazy=True)
+        plan = map_info['plan']
+        self.assertIsInstance(plan, MapPlan)
+        self.assertNotIn('plot', map_info)
+        self.assertEqual(plan.layers, ['values', 'missing', 'dots_values'])
+        self.assertEqual(plan._frames, {})
+        values = plan.frame('values')
+        self.assertIs(plan.frame('values'), values)
+        self.assertEqual(sorted(values['iso'].astype(str).unique()),
+                         ['ESP', 'FRA', 'NLD'])
+        self.assertEqual(len(plan.frame('out_region')), 0)
+        self.assertEqual(list(plan.frames), plan.layers)
+
+        plot = plan.render()
+        self.assertEqual(len(plot.layers), len(plan.layers))
+        self.assertIs(plot.layers[0].geom.data, values)
+
+    def test_cached_base_layer(self):
+        plot = generate_map(self.data, 'XEX', 'prevalence',
+                            cache_base_layer=True)['plot']
+        base_layer = plot.layers[2].geom.data
+        self.assertEqual(len(base_layer), 1)
+        self.assertEqual(base_layer.geometry.iloc[0].geom_type,
+                         'MultiPolygon')
+        plot = generate_map(self.data, 'XEX', 'prevalence',
+                            cache_base_layer=True)['plot']
+        self.assertIs(plot.layers[2].geom.data, base_layer)
+        self.assertEqual(list(plot.layers[2].geom.params["paths"]),
+                         ["base"])
+
+    def test_matplotlib_engine(self):
+        map_info = generate_map(self.data, 'XEX', 'prevalence',
+                                engine='matplotlib')
+        figure = map_info['plot']
+        self.assertEqual(type(figure).__name__, 'Figure')
+        self.assertAlmostEqual(
+            map_info['ratio'],
+            generate_map(self.data, 'XEX', 'prevalence')['ratio'])
+        ax = figure.axes[0]
+        values_collection = ax.collections[2]
+        # ESP, FRA and NLD (two polygons, one single path)
+        self.assertEqual(len(values_collection.get_paths()), 3)
+        with self.assertRaises(ValueError):
+            generate_map(self.data, 'XEX', 'prevalence', engine='unknown')
+
+    def test_vector_resolution(self):
+        map_info = generate_map(self.data, 'XEX', 'prevalence',
+                                engine='matplotlib',
+                                lazy=True,
+                                vector_resolution=300)
+        plan = map_info['plan']
+        paths = plan.paths
+        full_paths = generate_map(self.data, 'XEX', 'prevalence',
+                                  engine='matplotlib',
+                                  lazy=True)['plan'].paths
+        self.assertLessEqual(len(paths['ESP'].vertices),
+                             len(full_paths['ESP'].vertices))
+        # Vertices are snapped to the grid without consecutive duplicates
+        vertices = paths['FRA'].vertices
+        self.assertFalse(np.any(np.all(vertices[1:] == vertices[:-1],
+                                       axis=1)))
+        grid = vertices / maps._quantization_step(plan.limits_y,
+                                                  plan.plot_size,
+                                                  300)
+        np.testing.assert_allclose(grid, np.rint(grid))
+
+        sizes = []
+        for resolution in [None, 300]:
+            figure = generate_map(self.data, 'XEX', 'prevalence',
+                                  engine='matplotlib',
+                                  vector_resolution=resolution)['plot']
+            output = io.BytesIO()
+            figure.savefig(output, format='pdf')
+            sizes.append(len(output.getvalue()))
+        self.assertLess(sizes[1], sizes[0])
+        with self.assertRaises(ValueError):
+            generate_map(self.data, 'XEX', 'prevalence',
+                         engine='matplotlib', vector_resolution=0)
+        with self.assertRaises(ValueError):
+            generate_map(self.data, 'XEX', 'prevalence',
+                         engine='plotnine', vector_resolution=300)
+
+    def test_facet_map(self):
+        data = pd.concat([
+            self.data.assign(indicator='prevalence'),
+            pd.DataFrame({'iso': ['ESP', 'ITA'],
+                          'indicator': 'programme',
+                          'prevalence': ['Yes', 'No']}),
+        ])
+        map_info = generate_facet_map(data, 'XEX',
+                                      value_field='prevalence',
+                                      titles={'programme': 'Programme'})
+        figure = map_info['plot']
+        panels = [ax for ax in figure.axes if ax.get_title(loc='left')]
+        self.assertEqual([ax.get_title(loc='left') for ax in panels],
+                         ['prevalence', 'Programme'])
+        self.assertEqual(len(panels[0].collections[2].get_paths()), 3)
+        self.assertEqual(len(panels[1].collections[2].get_paths()), 2)
+        # Per-panel scales: discrete legend only in the second panel
+        self.assertEqual(
+            [t.get_text() for t in panels[1].get_legend().get_texts()],
+            ['No', 'Yes', 'No data available'])
+
+        null_iso = pd.DataFrame({'iso': [None, None],
+                                 'indicator': 'programme',
+                                 'prevalence': ['Yes', 'No']})
+        figure = generate_facet_map(pd.concat([data, null_iso]), 'XEX',
+                                    value_field='prevalence')['plot']
+        panels = [ax for ax in figure.axes if ax.get_title(loc='left')]
+        self.assertEqual(len(panels[1].collections[2].get_paths()), 2)
+        with self.assertRaises(ValueError):
+            generate_facet_map(pd.concat([data, data.iloc[[0]]]), 'XEX',
+                               value_field='prevalence')
+        with self.assertRaises(ValueError):
+            generate_facet_map(data, 'XEX', value_field='prevalence',
+                               indicators=['unknown'])
+
+    def test_projections(self):
+        x, y = maps.reproject([0, 10], [0, 45], 'equal_earth')
+        self.assertAlmostEqual(x[0], 0)
+        self.assertGreater(y[1], 0)
+        self.assertIs(maps._transformer(maps._crs('epsg4326'),
+                                        maps._crs('equal_earth')),
+                      maps._transformer(maps._crs('epsg4326'),
+                                        maps._crs('equal_earth')))
+        countries = maps._load_countries()
+        np.testing.assert_allclose(
+            shapely.bounds(maps.reproject_geometries(
+                countries['geometry'].values[:5], 'robinson')),
+            countries['geometry'].iloc[:5].to_crs(
+                maps.PROJECTION_DICT['robinson']).bounds.values)
+
+        for projection in ['equal_earth', 'mollweide']:
+            map_info = generate_map(self.data, 'XEX', 'prevalence',
+                                    projection=projection,
+                                    engine='matplotlib')
+            self.assertGreater(map_info['ratio'], 1)
+            with self.assertRaises(ValueError):
+                generate_map(self.data, 'XOX', 'prevalence',
+                             projection=projection)
+
+        plan = generate_map(pd.DataFrame({'iso': ['NZL'], 'value': [1.]}),
+                            'XOX', 'value', lazy=True)['plan']
+        # Wrapped around the 180º longitude
+        self.assertTrue((plan.frame('values')['lon'] > 0).all())
+
+    def test_custom_region(self):
+        # The cached masks and bounds of the region are cleared as well
+        self.addCleanup(maps._clear_region_caches)
+        paths = maps._country_paths('robinson', 13000, False)
+        define_region('IBERIA', ['ESP', 'PRT'])
+        self.addCleanup(maps.CUSTOM_REGIONS.pop, 'IBERIA')
+        # Region-independent caches are kept
+        self.assertIs(maps._country_paths('robinson', 13000, False), paths)
+        plan = generate_map(self.data, 'IBERIA', 'prevalence',
+                            lazy=True)['plan']
+        self.assertEqual(
+            sorted(plan.frame('values')['iso'].astype(str)), ['ESP'])
+        self.assertEqual(
+            sorted(plan.frame('missing')['iso'].astype(str)), ['PRT'])
+        self.assertGreater(plan.tolerance, 0)
+
+        # Bounds of the main polygons (without the Canary Islands or the
+        # Azores), with margin
+        plan = generate_map(self.data, 'IBERIA', 'prevalence',
+                            projection='epsg4326', lazy=True)['plan']
+        min_x, max_x = plan.limits_x
+        min_y, max_y = plan.limits_y
+        self.assertTrue(-11 < min_x < -9.5 and 3.3 < max_x < 5)
+        self.assertTrue(35 < min_y < 36.1 and 43.8 < max_y < 45)
+
+        with self.assertRaises(ValueError):
+            define_region('XEX', ['ESP'])
+        with self.assertRaises(ValueError):
+            define_region('UNKNOWN', ['ESP', 'XXX'])
+
+    def test_cached_map_image(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            path = cached_map_image(self.data, 'XEX', 'prevalence',
+                                    cache_dir=cache_dir,
+                                    engine='matplotlib',
+                                    dpi=20)
+            self.assertTrue(os.path.exists(path))
+            self.assertEqual(
+                cached_map_image(self.data.iloc[::-1], 'XEX', 'prevalence',
+                                 cache_dir=cache_dir,
+                                 engine='matplotlib',
+                                 dpi=20),
+                path)
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+
+            data = self.data.copy()
+            data.loc[0, 'prevalence'] = 50.
+            other_path = cached_map_image(data, 'XEX', 'prevalence',
+                                          cache_dir=cache_dir,
+                                          engine='matplotlib',
+                                          dpi=20,
+                                          max_cache_size=0)
+            self.assertNotEqual(other_path, path)
+            # Least recently used images are evicted
+            self.assertEqual(os.listdir(cache_dir),
+                             [os.path.basename(other_path)])
+
+            # Files being written by other processes are not removed
+            tmp_path = os.path.join(cache_dir, '.tmp-writing.png')
+            open(tmp_path, 'wb').close()
+            FileCache(cache_dir).clear()
+            self.assertEqual(os.listdir(cache_dir), ['.tmp-writing.png'])
@@ -0,0 +1,36 @@
+import unittest
+import numpy as np
+from matplotlib.colors import to_rgba
+from reportcompiler_ic_tools.palettes import get_palette, \
+    ContinuousPalette, DiscretePalette
+
+
+class PalettesTest(unittest.TestCase):
+    """ """
+
+    def test_continuous(self):
+        palette = ContinuousPalette(low='#000000',
+                                    high='#ffffff',
+                                    limits=[0, 10])
+        colors = palette(np.array([0, 5, 10, 20, np.nan]))
+        np.testing.assert_allclose(colors[0], to_rgba('#000000'))
+        np.testing.assert_allclose(colors[1][:3], [.5] * 3, atol=.01)
+        np.testing.assert_allclose(colors[2], to_rgba('#ffffff'))
+        np.testing.assert_allclose(colors[3], colors[2])
+        np.testing.assert_allclose(colors[4], palette.na_color)
+
+    def test_discrete(self):
+        palette = DiscretePalette(type='qual')
+        colors = palette(np.array(['b', 'a', 'b', None], dtype=object))
+        legend = palette.legend(np.array(['b', 'a'], dtype=object))
+        self.assertEqual([label for label, _ in legend], ['a', 'b'])
+        np.testing.assert_allclose(colors[0], legend[1][1])
+        np.testing.assert_allclose(colors[1], legend[0][1])
+        np.testing.assert_allclose(colors[3], palette.na_color)
+
+    def test_cached_palettes(self):
+        scale_params = {'limits': [0, 100], 'name': 'Prevalence'}
+        self.assertIs(get_palette(scale_params, False),
+                      get_palette(dict(scale_params), False))
+        self.assertIsNot(get_palette(scale_params, False),
+                         get_palette(scale_params, True))
@@ -0,0 +1,66 @@
+import pickle
+import unittest
+import pandas as pd
+from reportcompiler_ic_tools.records import TableCell, ColumnHeader, \
+    FooterEntry
+from reportcompiler_ic_tools.tables import generate_table_data
+from reportcompiler_ic_tools.utils import wrap_empty_references
+
+
+class RecordsTest(unittest.TestCase):
+    """ """
+
+    def test_dictionary_interface(self):
+        cell = TableCell('10', ['1'])
+        self.assertEqual(cell.value, '10')
+        self.assertEqual(cell['markers'], ['1'])
+        self.assertIsNone(cell.color)
+        self.assertEqual(cell, {'value': '10', 'markers': ['1']})
+        self.assertNotIn('color', cell)
+        cell['color'] = .5
+        self.assertEqual(dict(cell),
+                         {'value': '10', 'markers': ['1'], 'color': .5})
+        with self.assertRaises(KeyError):
+            cell['style'] = 'bold'
+        with self.assertRaises(AttributeError):
+            cell.style = 'bold'
+
+        entry = FooterEntry('a', 'Note')
+        self.assertEqual(entry, {'marker': 'a', 'text': 'Note'})
+        self.assertNotEqual(entry, FooterEntry('b', 'Note'))
+        self.assertEqual(pickle.loads(pickle.dumps(entry)), entry)
+        self.assertEqual(repr(ColumnHeader('Country', [])),
+                         "ColumnHeader(value='Country', markers=[])")
+
+    def test_table_records(self):
+        data_dict = wrap_empty_references(pd.DataFrame(
+            {'country': ['Spain', 'France'], 'value': ['1', '2']}))
+        data_dict['methods'] = {
+            'global': pd.DataFrame(columns=['text']),
+            'row': pd.DataFrame(columns=['row', 'text']),
+            'column': pd.DataFrame(columns=['column', 'text']),
+            'cell': pd.DataFrame({'row': [0, 1],
+                                  'column': ['value', 'value'],
+                                  'text': ['Model', 'Model']}),
+        }
+        table_info = generate_table_data(data_dict)
+        cell = table_info['table'].loc[0, 'value']
+        self.assertIsInstance(cell, TableCell)
+        self.assertEqual(cell.markers, [])
+        # Multi-character markers are collapsed as a whole
+        self.assertEqual(table_info['columns'][1].markers, ['\\alpha'])
+        self.assertEqual(table_info['footer']['methods'],
+                         [{'marker': '\\alpha', 'text': 'Model'}])
+        self.assertIsInstance(table_info['footer']['methods'][0],
+                              FooterEntry)
+
+    def test_dataframe_of_cells(self):
+        # Cells are stored as scalars, not unpacked as sequences
+        cells = [TableCell('10', ['1']), TableCell('20', [])]
+        frame = pd.DataFrame({'value': cells})
+        self.assertEqual(frame.shape, (2, 1))
+        self.assertIs(frame.loc[0, 'value'], cells[0])
+        self.assertIs(frame.iloc[1, 0], cells[1])
+        self.assertIs(frame.at[1, 'value'], cells[1])
+        self.assertIn(repr(cells[0]), frame.to_string())
+        self.assertIn(repr(cells[1]), repr(frame))
@@ -0,0 +1,93 @@
+import unittest
+import pandas as pd
+from reportcompiler_ic_tools.references import ReferenceSet
+from reportcompiler_ic_tools.tables import generate_table_data
+from reportcompiler_ic_tools.utils import wrap_empty_references, \
+    EMPTY_REFERENCES
+
+
+class ReferenceSetTest(unittest.TestCase):
+    """ """
+
+    def setUp(self):
+        self.data_dict = wrap_empty_references(pd.DataFrame(
+            {
+                'country': ['Spain', 'France'],
+                'prevalence': ['10', '20']
+            },
+            index=[0, 1]))
+        for ref_type in ['sources', 'notes', 'methods', 'years']:
+            self.data_dict[ref_type] = {
+                'global': pd.DataFrame(columns=['text']),
+                'row': pd.DataFrame(columns=['row', 'text']),
+                'column': pd.DataFrame(columns=['column', 'text']),
+                'cell': pd.DataFrame(columns=['row', 'column', 'text']),
+            }
+        self.data_dict['sources']['row'] = pd.DataFrame([
+            {'row': 1, 'text': 'Row source'},
+        ])
+        self.data_dict['sources']['cell'] = pd.DataFrame([
+            {'row': 0, 'column': 'prevalence', 'text': 'Cell source'},
+            {'row': 1, 'column': 'prevalence', 'text': 'Row source'},
+        ])
+        self.data_dict['notes']['column'] = pd.DataFrame([
+            {'column': 'prevalence', 'text': 'Column note'},
+        ])
+
+    def test_lookups(self):
+        references = ReferenceSet(self.data_dict)
+        self.assertEqual(references.row_refs('sources', 1), ['Row source'])
+        self.assertEqual(references.row_refs('sources', 0), [])
+        self.assertEqual(references.cell_refs('sources', 0, 'prevalence'),
+                         ['Cell source'])
+        self.assertEqual(references.column_refs('notes', 'prevalence'),
+                         ['Column note'])
+        self.assertFalse(references.global_refs('methods'))
+        # Interned texts
+        self.assertIs(references.row_refs('sources', 1)[0],
+                      references.cell_refs('sources', 1, 'prevalence')[0])
+        self.assertIs(ReferenceSet.of(references), references)
+        self.assertIs(references['data'], self.data_dict['data'])
+
+    def test_same_tables(self):
+        references = ReferenceSet(self.data_dict)
+        for params in [{}, {'selected_columns': ['prevalence'],
+                            'column_names': ['Prevalence'],
+                            'row_id_column': 'prevalence'}]:
+            expected = generate_table_data(self.data_dict, **params)
+            table_info = generate_table_data(references, **params)
+            self.assertTrue(expected['table'].equals(table_info['table']))
+            self.assertEqual(expected['columns'], table_info['columns'])
+            self.assertEqual(expected['footer'], table_info['footer'])
+        self.assertEqual(table_info['table'].loc[1, 'prevalence']['markers'],
+                         ['1'])
+        self.assertEqual(table_info['footer']['sources'],
+                         [{'marker': '1', 'text': 'Row source'},
+                          {'marker': '2', 'text': 'Cell source'}])
+
+    def test_with_data(self):
+        references = ReferenceSet(self.data_dict)
+        subset = references.with_data(self.data_dict['data'].iloc[[1]])
+        self.assertIs(subset.lookups, references.lookups)
+        table_info = generate_table_data(subset)
+        self.assertEqual(table_info['footer']['sources'],
+                         [{'marker': '1', 'text': 'Row source'}])
+
+    def test_empty_references(self):
+        data_dict = wrap_empty_references(self.data_dict['data'])
+        self.assertIs(data_dict['sources'], EMPTY_REFERENCES)
+        with self.assertRaises(TypeError):
+            data_dict['sources']['global'] = None
+        references = ReferenceSet(data_dict)
+        self.assertTrue(references.is_empty())
+        self.assertFalse(ReferenceSet(self.data_dict).is_empty())
+        self.assertTrue(ReferenceSet(self.data_dict).is_empty('methods'))
+        self.assertTrue(ReferenceSet(self.data_dict).is_empty(scope='global'))
+
+        table_info = generate_table_data(data_dict, column_spec=True)
+        self.assertEqual(table_info['table'].loc[0, 'country'],
+                         {'value': 'Spain', 'markers': []})
+        self.assertEqual(table_info['columns'][1],
+                         {'value': 'prevalence', 'markers': []})
+        self.assertEqual(table_info['footer']['sources'], [])
+        self.assertIn('column_spec', table_info['table_latex'])
@@ -0,0 +1,101 @@
+import os
+import shutil
+import tempfile
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from reportcompiler_ic_tools.registry import ReferenceRegistry
+from reportcompiler_ic_tools.tables import generate_table_data
+from reportcompiler_ic_tools.utils import wrap_empty_references
+
+
+def _registry_markers(registry, texts):
+    return registry.markers('sources', texts)
+
+
+class ReferenceRegistryTest(unittest.TestCase):
+    """ """
+
+    def setUp(self):
+        self.build_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.build_dir)
+
+    def test_shared_markers(self):
+        with ReferenceRegistry(self.build_dir) as first, \
+                ReferenceRegistry(self.build_dir) as second:
+            self.assertEqual(first.markers('sources', ['A', 'B', 'A']),
+                             ['1', '2', '1'])
+            self.assertEqual(second.markers('sources', ['C', 'B']),
+                             ['3', '2'])
+            self.assertEqual(first.markers('sources', ['C']), ['3'])
+            self.assertEqual(second.markers('notes', ['A']), ['a'])
+            self.assertEqual(first.footer()['sources'],
+                             [{'marker': '1', 'text': 'A'},
+                              {'marker': '2', 'text': 'B'},
+                              {'marker': '3', 'text': 'C'}])
+        self.assertTrue(os.path.exists(
+            os.path.join(self.build_dir, 'references.sqlite')))
+
+    def test_footer_order(self):
+        with ReferenceRegistry(self.build_dir) as first, \
+                ReferenceRegistry(self.build_dir) as second:
+            second.markers('sources', ['B'])
+            first.markers('sources', ['A'])
+            second.markers('sources', ['C'])
+            self.assertEqual([entry['marker'] for entry
+                              in first.footer()['sources']],
+                             ['1', '2', '3'])
+            self.assertEqual([entry['text'] for entry
+                              in first.footer()['sources']],
+                             ['B', 'A', 'C'])
+
+    def test_many_sources(self):
+        with ReferenceRegistry(self.build_dir) as registry:
+            texts = ['S{}'.format(i) for i in range(120)]
+            self.assertEqual(registry.markers('sources', texts),
+                             [str(i) for i in range(1, 121)])
+            self.assertEqual(registry.footer()['sources'][-1]['marker'],
+                             '120')
+            with self.assertRaisesRegex(EnvironmentError,
+                                        "No more 'notes' markers"):
+                registry.markers('notes', texts)
+
+    def test_processes(self):
+        registry = ReferenceRegistry(self.build_dir)
+        texts = [['T{}'.format(i), 'T{}'.format(i + 1)] for i in range(8)]
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            results = list(executor.map(_registry_markers,
+                                        [registry] * len(texts),
+                                        texts))
+        markers = {}
+        for batch, batch_markers in zip(texts, results):
+            for text, marker in zip(batch, batch_markers):
+                self.assertEqual(markers.setdefault(text, marker), marker)
+        self.assertEqual(sorted(markers.values(), key=int),
+                         [str(i) for i in range(1, 10)])
+        self.assertEqual(registry.markers('sources', ['T0', 'T8']),
+                         [markers['T0'], markers['T8']])
+        registry.close()
+
+    def test_tables(self):
+        registry = ReferenceRegistry(self.build_dir)
+        tables = []
+        for texts in [['Survey', 'Registry'], ['Registry', 'Cohort']]:
+            data_dict = wrap_empty_references(pd.DataFrame(
+                {'indicator': ['Prevalence', 'Incidence']}))
+            data_dict['sources'] = {
+                'global': pd.DataFrame({'text': ['Global survey']}),
+                'row': pd.DataFrame({'row': [0, 1], 'text': texts}),
+                'column': pd.DataFrame(columns=['column', 'text']),
+                'cell': pd.DataFrame(columns=['row', 'column', 'text']),
+            }
+            tables.append(generate_table_data(data_dict, registry=registry))
+        self.assertEqual(tables[1]['table'].loc[0, 'indicator']['markers'],
+                         ['2'])
+        self.assertEqual(tables[1]['footer']['sources'],
+                         [{'marker': '', 'text': 'Global survey'},
+                          {'marker': '2', 'text': 'Registry'},
+                          {'marker': '3', 'text': 'Cohort'}])
+        registry.close()
@@ -0,0 +1,94 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import pandas as pd
+from reportcompiler_ic_tools.scheduler import AssetScheduler
+from reportcompiler_ic_tools.tables import generate_table_data
+from reportcompiler_ic_tools.utils import wrap_empty_references
+
+
+def _wait(seconds, value=None):
+    time.sleep(seconds)
+    return value
+
+
+class AssetSchedulerTest(unittest.TestCase):
+    """ """
+
+    def setUp(self):
+        self.build_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.build_dir)
+
+    def _data_dict(self, texts):
+        data_dict = wrap_empty_references(pd.DataFrame(
+            {'indicator': ['Prevalence', 'Incidence']}))
+        data_dict['sources'] = {
+            'global': pd.DataFrame(columns=['text']),
+            'row': pd.DataFrame({'row': [0, 1], 'text': texts}),
+            'column': pd.DataFrame(columns=['column', 'text']),
+            'cell': pd.DataFrame(columns=['row', 'column', 'text']),
+        }
+        return data_dict
+
+    def test_assets(self):
+        scheduler = AssetScheduler(max_workers=2, io_workers=2)
+        scheduler.shared_countries('europe', 'XEX')
+        scheduler.table('first', self._data_dict(['Survey', 'Registry']))
+        scheduler.table('second', self._data_dict(['Registry', 'Cohort']),
+                        chain='first')
+        path = os.path.join(self.build_dir, 'maps', 'europe.png')
+        scheduler.map_image('map', pd.DataFrame({'iso': ['ESP', 'FRA'],
+                                                 'value': [1., 2.]}),
+                            'XEX', 'value', path, dpi=30, shared='europe')
+        scheduler.task('summary', len, scheduler.result('second', 'footer'),
+                       pool='loop')
+        report = scheduler.run()
+
+        first = generate_table_data(self._data_dict(['Survey', 'Registry']))
+        second = generate_table_data(self._data_dict(['Registry', 'Cohort']),
+                                     footer=first['footer'],
+                                     markers=first['markers'])
+        self.assertTrue(report.results['second']['table'].equals(
+            second['table']))
+        self.assertEqual(report.results['second']['footer'],
+                         second['footer'])
+        self.assertEqual(report.results['map'], path)
+        self.assertTrue(os.path.getsize(path) > 0)
+        self.assertEqual(report.results['summary'], 5)
+        self.assertEqual(report.timings['map:draw']['pool'], 'process')
+        self.assertEqual(report.timings['map']['pool'], 'thread')
+        self.assertFalse(os.path.exists(report.results['europe'].spec['path']))
+        self.assertIn('Critical path', report.summary())
+
+    def test_critical_path(self):
+        scheduler = AssetScheduler(max_workers=2, io_workers=2)
+        scheduler.task('slow', _wait, .3)
+        scheduler.task('quick', _wait, .05, pool='thread')
+        scheduler.task('last', _wait, .05, scheduler.result('quick'),
+                       depends_on=['slow'], pool='thread')
+        report = scheduler.run()
+        self.assertEqual(report.critical_path, ['slow', 'last'])
+        self.assertGreaterEqual(report.critical_path_time, .35)
+        # Independent tasks overlap
+        self.assertLess(report.timings['quick']['start'],
+                        report.timings['slow']['end'])
+        self.assertLessEqual(report.critical_path_time,
+                             report.wall_time + .01)
+        self.assertEqual(set(report.utilization), {'process', 'thread'})
+
+    def test_invalid_dependencies(self):
+        scheduler = AssetScheduler()
+        scheduler.task('first', _wait, 0, depends_on=['second'])
+        scheduler.task('second', _wait, 0, scheduler.result('first'))
+        with self.assertRaises(ValueError):
+            scheduler.run()
+        scheduler = AssetScheduler()
+        scheduler.task('first', _wait, 0, depends_on=['missing'])
+        with self.assertRaises(ValueError):
+            scheduler.run()
+        with self.assertRaises(ValueError):
+            scheduler.task('first', _wait, 0)
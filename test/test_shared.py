@@ -0,0 +1,69 @@
+import multiprocessing
+import os
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from reportcompiler_ic_tools import maps
+from reportcompiler_ic_tools.shared import SharedCountries
+
+
+def _draw_map(iso_codes):
+    # Runs in a worker attached to the shared layer
+    data = pd.DataFrame({'iso': iso_codes, 'value': range(len(iso_codes))})
+    figure = maps.generate_map(data, 'XEX', 'value',
+                               engine='matplotlib')['plot']
+    return (maps._load_countries.cache_info().currsize,
+            len(figure.axes[0].collections[2].get_paths()))
+
+
+class SharedCountriesTest(unittest.TestCase):
+    """ """
+
+    def test_shared_layer(self):
+        with SharedCountries.create('XEX') as shared:
+            paths = maps._country_paths('robinson', 13000, False)
+            self.assertEqual(
+                sorted(shared.paths.keys()), sorted(paths.keys()))
+            self.assertTrue(
+                (shared.paths['NLD'].vertices ==
+                 paths['NLD'].vertices).all())
+            self.assertEqual(list(shared.countries['iso']),
+                             list(maps._load_countries()['iso']))
+
+            attached = SharedCountries.attach(shared.spec, install=False)
+            # Views of the shared file, not copies
+            self.assertTrue(np.shares_memory(attached.paths['ESP'].vertices,
+                                             attached._mmap))
+            attached.close()
+            self.assertTrue(os.path.exists(shared.spec['path']))
+        self.assertFalse(os.path.exists(shared.spec['path']))
+
+    def test_workers(self):
+        context = multiprocessing.get_context('spawn')
+        with SharedCountries.create('XEX') as shared:
+            with ProcessPoolExecutor(1,
+                                     mp_context=context,
+                                     initializer=SharedCountries.attach,
+                                     initargs=(shared.spec,)) as executor:
+                loaded, values = executor.submit(
+                    _draw_map, ['ESP', 'FRA']).result()
+        # The worker does not load the countries layer
+        self.assertEqual(loaded, 0)
+        self.assertEqual(values, 2)
+
+    def test_installed_layer(self):
+        data = pd.DataFrame({'iso': ['ESP'], 'value': [1.]})
+        # Layers cached before installing the shared one are not used
+        maps.generate_map(data, 'XEX', 'value')
+        with SharedCountries.create('XEX') as shared:
+            attached = SharedCountries.attach(shared.spec)
+            try:
+                self.assertIs(maps._country_paths('robinson', 13000, False),
+                              attached.paths)
+                with self.assertRaises(ValueError):
+                    maps.generate_map(data, 'XEX', 'value')
+            finally:
+                attached.close()
+        self.assertNotIn(attached.key, maps._SHARED_COUNTRIES)
+        maps.generate_map(data, 'XEX', 'value')
@@ -0,0 +1,103 @@
+import os
+import unittest
+import pandas as pd
+from jinja2 import Environment, FileSystemLoader
+from reportcompiler_ic_tools import tables
+from reportcompiler_ic_tools.tables import generate_table_data, \
+    footer_fingerprint, render_footer, escape_tex
+from reportcompiler_ic_tools.utils import wrap_empty_references
+
+
+class TableFooterTest(unittest.TestCase):
+    """ """
+
+    def setUp(self):
+        self.data_dict = wrap_empty_references(pd.DataFrame(
+            {
+                'country': ['Spain', 'France'],
+                'prevalence': ['10', '20']
+            },
+            index=[0, 1]))
+        empty_refs = {
+            'global': pd.DataFrame(columns=['text']),
+            'row': pd.DataFrame(columns=['row', 'text']),
+            'column': pd.DataFrame(columns=['column', 'text']),
+            'cell': pd.DataFrame(columns=['row', 'column', 'text']),
+        }
+        for ref_type in ['sources', 'notes', 'methods', 'years']:
+            self.data_dict[ref_type] = dict(empty_refs)
+        self.data_dict['sources']['column'] = pd.DataFrame([
+            {'column': 'country', 'text': 'Source 50% & more'},
+        ])
+        self.data_dict['notes']['global'] = pd.DataFrame([
+            {'text': 'Global note'},
+        ])
+
+    def test_chained_footer(self):
+        first = generate_table_data(self.data_dict)
+        second = generate_table_data(self.data_dict,
+                                     footer=first['footer'],
+                                     markers=first['markers'])
+        self.assertEqual(second['footer']['sources'],
+                         [{'marker': '1', 'text': 'Source 50% & more'}])
+        self.assertEqual(second['columns'][0]['markers'], ['1'])
+
+    def test_render_footer(self):
+        footer = generate_table_data(self.data_dict)['footer']
+        rendered = render_footer(footer)
+        self.assertEqual(
+            rendered,
+            '\\textbf{Sources}: \\\\\n'
+            '$^{1}$ Source 50\\% \\& more \\\\\n'
+            '\\textbf{Notes}: \\\\\n'
+            '- Global note \\\\')
+        self.assertIs(render_footer(dict(footer)), rendered)
+
+    def test_escape_tex(self):
+        self.assertEqual(escape_tex('50% & $5 {a} ~x^2 #1_2'),
+                         '50\\% \\& \\$5 \\{a\\} \\textasciitilde{}x'
+                         '\\textasciicircum{}2 \\#1\\_2')
+        # Escaped characters and marker commands are kept
+        self.assertEqual(escape_tex('10\\% \\dagger'), '10\\% \\dagger')
+
+    def test_render_footer_as_template(self):
+        self.data_dict['notes']['global'] = pd.DataFrame([
+            {'text': 'Cost in $ {approx.} ~10^3 #1_a'},
+        ])
+        footer = generate_table_data(self.data_dict)['footer']
+        environment = Environment(
+            block_start_string='\\BLOCK{',
+            block_end_string='}',
+            variable_start_string='\\VAR{',
+            variable_end_string='}',
+            comment_start_string='\\#{',
+            comment_end_string='}',
+            trim_blocks=True,
+            autoescape=False,
+            loader=FileSystemLoader(os.path.join(
+                os.path.dirname(tables.__file__), 'templates')))
+        environment.filters['escape_tex'] = escape_tex
+        environment.filters['format_date'] = lambda date, date_format: date
+        template = environment.get_template(
+            'hpv-infocentre/ic_references.tex')
+        date = {'date_closing': '2019-06-30',
+                'date_publication': '2019-09-01'}
+
+        def render(**ctx):
+            return ''.join(template.render(
+                ctx=dict(ctx, footer=dict(footer, date=date))).split())
+
+        self.assertEqual(render(),
+                         render(rendered_footer=render_footer(footer)))
+
+    def test_fingerprint(self):
+        footer = generate_table_data(self.data_dict)['footer']
+        same_footer = {
+            'sources': [('1', 'Source 50% & more')],
+            'notes': [('', 'Global note')],
+        }
+        self.assertEqual(footer_fingerprint(footer),
+                         footer_fingerprint(same_footer))
+        same_footer['notes'] = []
+        self.assertNotEqual(footer_fingerprint(footer),
+                            footer_fingerprint(same_footer))
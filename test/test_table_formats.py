@@ -0,0 +1,81 @@
+import unittest
+import pandas as pd
+from reportcompiler_ic_tools.tables import generate_table_data, \
+    render_table, render_footer
+from reportcompiler_ic_tools.utils import wrap_empty_references
+
+
+class TableFormatsTest(unittest.TestCase):
+    """ """
+
+    def setUp(self):
+        self.data_dict = wrap_empty_references(pd.DataFrame(
+            {
+                'country': ['Spain', 'France'],
+                'value': ['10 < 20', 'a|b'],
+            }))
+        self.data_dict['sources'] = {
+            'global': pd.DataFrame({'text': ['Global & co']}),
+            'row': pd.DataFrame({'row': [0], 'text': ['Survey']}),
+            'column': pd.DataFrame(columns=['column', 'text']),
+            'cell': pd.DataFrame(columns=['row', 'column', 'text']),
+        }
+        self.data_dict['methods'] = {
+            'global': pd.DataFrame(columns=['text']),
+            'row': pd.DataFrame(columns=['row', 'text']),
+            'column': pd.DataFrame({'column': ['value'], 'text': ['Model']}),
+            'cell': pd.DataFrame(columns=['row', 'column', 'text']),
+        }
+
+    def test_html(self):
+        table_info = generate_table_data(self.data_dict, format='html')
+        markup = table_info['table_html']
+        self.assertEqual(markup['table'], '\n'.join([
+            '<table>',
+            '<thead>',
+            '<tr><th>country</th><th>value<sup>α</sup></th></tr>',
+            '</thead>',
+            '<tbody>',
+            '<tr><td>Spain<sup>1</sup></td><td>10 &lt; 20</td></tr>',
+            '<tr><td>France</td><td>a|b</td></tr>',
+            '</tbody>',
+            '</table>',
+        ]))
+        self.assertEqual(markup['footer'], '\n'.join([
+            '<p><strong>Sources</strong>:<br>',
+            '- Global &amp; co<br>',
+            '<sup>1</sup> Survey<br>',
+            '</p>',
+            '<p><strong>Methods</strong>:<br>',
+            '<sup>α</sup> Model<br>',
+            '</p>',
+        ]))
+
+    def test_markdown(self):
+        table_info = generate_table_data(self.data_dict)
+        self.assertNotIn('table_markdown', table_info)
+        self.assertEqual(render_table(table_info, 'markdown'), '\n'.join([
+            '| country | value<sup>α</sup> |',
+            '| --- | --- |',
+            '| Spain<sup>1</sup> | 10 &lt; 20 |',
+            '| France | a\\|b |',
+        ]))
+        self.assertEqual(
+            render_footer(table_info['footer'], format='markdown'),
+            '\n'.join([
+                '**Sources**:',
+                '',
+                '- Global &amp; co',
+                '- <sup>1</sup> Survey',
+                '',
+                '**Methods**:',
+                '',
+                '- <sup>α</sup> Model',
+            ]))
+
+    def test_invalid_format(self):
+        with self.assertRaises(ValueError):
+            generate_table_data(self.data_dict, format='rtf')
+        table_info = generate_table_data(self.data_dict)
+        with self.assertRaises(ValueError):
+            render_table(table_info, 'latex')
@@ -0,0 +1,73 @@
+import unittest
+import pandas as pd
+from reportcompiler_ic_tools import tables
+from reportcompiler_ic_tools.tables import generate_table_data
+from reportcompiler_ic_tools.utils import wrap_empty_references
+
+
+class TableOptionsTest(unittest.TestCase):
+    """ """
+
+    def setUp(self):
+        self.data_dict = wrap_empty_references(pd.DataFrame(
+            {
+                'country': ['Spain', 'France', 'Germany'],
+                'study': ['A' * 40, 'B', 'C' * 300],
+                'prevalence': ['10', '20', '30']
+            },
+            index=[0, 1, 2]))
+        for ref_type in ['sources', 'notes', 'methods', 'years']:
+            self.data_dict[ref_type] = {
+                'global': pd.DataFrame(columns=['text']),
+                'row': pd.DataFrame(columns=['row', 'text']),
+                'column': pd.DataFrame(columns=['column', 'text']),
+                'cell': pd.DataFrame(columns=['row', 'column', 'text']),
+            }
+
+    def test_column_spec(self):
+        table_info = generate_table_data(self.data_dict, column_spec=True)
+        column_spec = table_info['table_latex']['column_spec']
+        widths = [float(w.split('cm')[0])
+                  for w in column_spec.split('p{')[1:]]
+        self.assertEqual(len(widths), 3)
+        self.assertAlmostEqual(
+            sum(widths) + 3 * tables.COLUMN_PADDING,
+            tables.TABLE_WIDTH,
+            places=1)
+        # Narrow columns keep their natural width
+        self.assertAlmostEqual(widths[0], 7 * tables.CHAR_WIDTH, places=2)
+        self.assertGreater(widths[1], widths[2] * 5)
+
+    def test_column_spec_minimum_width(self):
+        self.data_dict['data']['study'] = ['A' * 2000, 'B', None]
+        self.data_dict['data']['empty'] = [None, float('nan'), None]
+        table_info = generate_table_data(self.data_dict, column_spec=True)
+        widths = [float(w.split('cm')[0]) for w in
+                  table_info['table_latex']['column_spec'].split('p{')[1:]]
+        self.assertEqual(len(widths), 4)
+        # Null values are not measured as 'nan'
+        self.assertAlmostEqual(widths[3], 5 * tables.CHAR_WIDTH, places=2)
+        self.assertGreaterEqual(min(widths), tables.MIN_COLUMN_WIDTH)
+
+    def test_column_spec_many_columns(self):
+        data = pd.DataFrame({'column_{}'.format(i): ['value']
+                             for i in range(45)})
+        data_dict = dict(self.data_dict, data=data)
+        table_info = generate_table_data(data_dict, column_spec=True)
+        self.assertEqual(table_info['table_latex']['column_spec'], 'l' * 45)
+        # Columns shrunk below the minimum width keep it
+        data = data.iloc[:, :15].assign(column_0=['A' * 2000])
+        data_dict['data'] = data
+        column_spec = generate_table_data(
+            data_dict, column_spec=True)['table_latex']['column_spec']
+        widths = [float(w.split('cm')[0])
+                  for w in column_spec.split('p{')[1:]]
+        self.assertEqual(widths[1:], [tables.MIN_COLUMN_WIDTH] * 14)
+        self.assertAlmostEqual(
+            sum(widths) + 15 * tables.COLUMN_PADDING,
+            tables.TABLE_WIDTH,
+            places=1)
+
+    def test_no_column_spec(self):
+        table_info = generate_table_data(self.data_dict)
+        self.assertNotIn('table_latex', table_info)